@@ -3,6 +3,6 @@ from .sc import Schur
 from .ev import ErrVar
 from .en import Ensemble, ParameterEnsemble
 from .mc import MonteCarlo
-from .mat import Matrix, Jco, Cov
+from .mat import Matrix, Jco, Cov, MatrixCache
 from .pst import Pst, pst_utils
 
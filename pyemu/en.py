@@ -1,12 +1,46 @@
 from __future__ import print_function, division
 import os
 import copy
-import math
+import json
+import time
 import numpy as np
 import pandas as pd
 
-from pyemu.mat.mat_handler import get_common_elements
-from pyemu.pst.pst_utils import write_parfile,read_parfile
+from pyemu.mat.mat_handler import get_common_elements, Cov
+from pyemu.pst.pst_utils import write_parfile,read_parfile,\
+    read_parfiles,write_parfiles,replace_file
+
+def read_binary_header(filename):
+    """ read the header of a binary ensemble file
+
+    Parameters:
+    ----------
+        filename: (str) binary ensemble file (a directory)
+
+    Returns:
+    -------
+        dict with "columns", "index", "islog", "dtype" and "values_file"
+        entries
+
+    """
+    header_file = os.path.join(filename,"header.json")
+    if not os.path.exists(header_file):
+        raise Exception("read_binary_header() error: binary ensemble " +\
+                        "file {0} not found".format(filename))
+    with open(header_file,'r') as f:
+        header = json.load(f)
+    # files written before the values file was named in the header
+    header.setdefault("values_file","values.bin")
+    return header
+
+
+def _write_binary_header(filename,header):
+    # write to a temp file and rename so readers never see a partial header
+    tmp = os.path.join(filename,"header.json.{0:d}.tmp".format(os.getpid()))
+    with open(tmp,'w') as f:
+        json.dump(header,f)
+    replace_file(tmp,os.path.join(filename,"header.json"))
+
 
 class Ensemble(pd.DataFrame):
     """ a pandas.DataFrame derived type to store
@@ -26,17 +60,39 @@ class Ensemble(pd.DataFrame):
             raise Exception("Ensemble requires 'mean_values' kwarg")
         self.__mean_values = mean_values
 
+    def _replace_values(self,values,index,columns):
+        """ private: replace the realizations (and columns) of self, in
+            place.  The frame is rebuilt with the DataFrame constructor,
+            since .loc can't change the shape of a frame without
+            enlarging it one row at a time
 
-    def draw(self,cov,num_reals=1):
+        Parameters:
+        ----------
+            values: (numpy.ndarray) the new values - not copied
+
+            index: (list) realization names
+
+            columns: (list) column names
+
+        """
+        pd.DataFrame.__init__(self,values,index=index,columns=columns,
+                              copy=False)
+
+
+    def draw(self,cov,num_reals=1,seed=None):
         """ draw random realizations from a multivariate
             Gaussian distribution
 
         Parameters:
         ----------
             cov: a Cov instance
-                covariance structure to draw from
+                covariance structure to draw from.  The factor of cov is
+                cached on cov, so repeated draws from it are cheap
             num_reals: int
                 number of realizations to generate
+            seed: None, int, numpy.random.RandomState or Generator
+                random number generator to draw with.  If None, the
+                global numpy.random state is used
         Returns:
         -------
             None
@@ -49,30 +105,127 @@ class Ensemble(pd.DataFrame):
         if self.names != cov.row_names:
             common_names = get_common_elements(self.names,
                                                cov.row_names)
-            vals = self.mean_values.loc[common_names]
-            cov = cov.get(common_names)
-            pass
         else:
-            vals = self.mean_values
             common_names = self.names
+        vals = self.mean_values.loc[common_names]
+        if not isinstance(cov, Cov):
+            cov = Cov(x=cov.x, names=cov.row_names,
+                      isdiagonal=cov.isdiagonal)
+
+        # generate random numbers - independent scaled normals if cov
+        # is diagonal, otherwise a product with the factor of cov.  Only
+        # the common names block of cov is factored, and that factor is
+        # cached on cov for the next draw
+        val_array = cov.draw(num_reals, seed=seed, names=common_names)
+        val_array += vals.values
+
+        # build the full realization block at once - columns not in
+        # cov are set to mean_values
+        mean_values = self.mean_values.loc[self.columns].values
+        data = np.empty((num_reals, len(self.columns)))
+        data[:, :] = mean_values
+        data[:, self.columns.get_indexer(common_names)] = val_array
+        self._replace_values(data,real_names,self.columns)
 
-        # generate random numbers
-        val_array = np.random.multivariate_normal(vals, cov.as_2d,num_reals)
 
-        self.loc[:,:] = np.NaN
-        self.dropna(inplace=True)
+    def enforce(self):
+        raise Exception("Ensemble.enforce() must overloaded by derived types")
 
-        # this sucks - can only set by enlargement one row at a time
-        for rname,vals in zip(real_names,val_array):
-            self.loc[rname,common_names] = vals
-    
-            # set NaNs to mean_values
-            idx = pd.isnull(self.loc[rname,:])
-            self.loc[rname,idx] = self.mean_values[idx]
+    def to_binary(self,filename,append=False):
+        """ write the ensemble to a binary ensemble file - a directory
+            holding a header of the names, realization ids and log
+            transform status and the values as a raw float64 block
 
+        Parameters:
+        ----------
+            filename: (str) binary ensemble file name
 
-    def enforce(self):
-        raise Exception("Ensemble.enforce() must overloaded by derived types")
+            append: (bool) append the realizations of self to an existing
+                file.  The columns of self must include all the columns
+                in the file
+
+        Returns:
+        -------
+            None
+
+        """
+        index = [str(real) for real in self.index]
+        old_values_file = None
+        if append and os.path.exists(os.path.join(filename,"header.json")):
+            header = read_binary_header(filename)
+            idx = self.columns.get_indexer(header["columns"])
+            if (idx < 0).any():
+                raise Exception("Ensemble.to_binary() error: columns " +\
+                                "in {0} not found in ensemble".format(filename))
+            values = self.values[:,idx]
+            header["index"].extend(index)
+        else:
+            if not os.path.exists(filename):
+                os.makedirs(filename)
+            if os.path.exists(os.path.join(filename,"header.json")):
+                old_values_file = read_binary_header(filename)["values_file"]
+            values = self.values
+            # a new values file, so the current header and values stay
+            # consistent until the new header replaces the current one
+            header = {"columns":[str(c) for c in self.columns],
+                      "index":index,"islog":getattr(self,"islog",None),
+                      "dtype":"<f8",
+                      "values_file":"values.{0:d}.{1:d}.bin".\
+                          format(os.getpid(),int(time.time() * 1.0e+6))}
+        # write the values before the header - a reader only sees
+        # the realizations listed in the header
+        values_file = os.path.join(filename,header["values_file"])
+        with open(values_file,'ab') as f:
+            f.write(np.ascontiguousarray(values,dtype=header["dtype"])
+                    .tobytes())
+        _write_binary_header(filename,header)
+        if old_values_file is not None and \
+                old_values_file != header["values_file"]:
+            try:
+                os.remove(os.path.join(filename,old_values_file))
+            except OSError:
+                # still open (memory-mapped) on windows
+                pass
+
+    def from_binary(self,filename,columns=None,mmap_mode='c'):
+        """ load the ensemble from a binary ensemble file
+
+        Parameters:
+        ----------
+            filename: (str) binary ensemble file name
+
+            columns: (list[str]) optional subset of columns to load
+
+            mmap_mode: (str) numpy memory-map mode for the values.  The
+                default, 'c' (copy-on-write), reads values from disk as they
+                are accessed.  None reads all the values into memory
+
+        Returns:
+        -------
+            dict : the file header
+
+        """
+        header = read_binary_header(filename)
+        shape = (len(header["index"]),len(header["columns"]))
+        values_file = os.path.join(filename,header["values_file"])
+        if mmap_mode is None:
+            values = np.fromfile(values_file,dtype=header["dtype"],
+                                 count=shape[0] * shape[1]).reshape(shape)
+        else:
+            values = np.memmap(values_file,dtype=header["dtype"],
+                               mode=mmap_mode,shape=shape)
+        file_columns = header["columns"]
+        if columns is not None:
+            col_idx = dict([(name,i) for i,name in enumerate(file_columns)])
+            missing = [name for name in columns if name not in col_idx]
+            if len(missing) > 0:
+                raise Exception("Ensemble.from_binary() error: columns " +\
+                                "not found in {0}: {1}".\
+                                format(filename,','.join(missing)))
+            values = values[:,[col_idx[name] for name in columns]]
+            file_columns = list(columns)
+        self._replace_values(values,header["index"],file_columns)
+        return header
     
 
     def plot(self,*args,**kwargs):
@@ -116,8 +269,8 @@ class ObservationEnsemble(Ensemble):
         return vals
 
 
-    def draw(self,cov,num_reals):
-        super(ObservationEnsemble,self).draw(cov,num_reals)
+    def draw(self,cov,num_reals,seed=None):
+        super(ObservationEnsemble,self).draw(cov,num_reals,seed=seed)
         self.loc[:,self.names] += self.pst.observation_data.obsval
 
 
@@ -206,12 +359,19 @@ class ParameterEnsemble(Ensemble):
         isfixed = self.pst.parameter_data.partrans == "fixed"
         return isfixed.values
 
-    def draw(self,cov,num_reals=1):
+    def draw(self,cov,num_reals=1,seed=None):
         if not self.islog:
             self._transform()
-        super(ParameterEnsemble,self).draw(cov,num_reals=num_reals)
+        super(ParameterEnsemble,self).draw(cov,num_reals=num_reals,
+                                           seed=seed)
         self._back_transform()
 
+    def _log_column_indices(self):
+        """ integer indices of the log-transformed columns
+        """
+        islog = self.pst.parameter_data.partrans.loc[self.columns] == "log"
+        return np.where(islog.values)[0]
+
     def _back_transform(self,inplace=True):
         """ remove log10 transformation from ensemble
         Parameters:
@@ -229,16 +389,19 @@ class ParameterEnsemble(Ensemble):
         if not self.islog:
             raise Exception("ParameterEnsemble already back transformed")
 
-        islog = self.pst.parameter_data.loc[:,"partrans"] == "log"
+        idx = self._log_column_indices()
+        vals = 10.0**(self.values[:, idx])
         if inplace:
-            self.loc[:,islog] = 10.0**(self.loc[:,islog])
+            self.iloc[:, idx] = vals
             self.__islog = False
         else:
-            vals = self.pst.parameter_data.parval1.copy()
-            new_en = ParameterEnsemble(pst=self.pst.get(),data=self.loc[:,:].copy(),
-                              columns=self.columns,
-                              mean_values=vals,islog=False)
-            new_en.loc[:,islog] = 10.0**(self.loc[:,islog])
+            # share the pst - only the values change
+            data = self.values.copy()
+            data[:, idx] = vals
+            new_en = ParameterEnsemble(pst=self.pst,data=data,
+                              index=self.index,columns=self.columns,
+                              mean_values=self.pst.parameter_data.parval1.copy(),
+                              islog=False)
             return new_en
 
 
@@ -259,23 +422,29 @@ class ParameterEnsemble(Ensemble):
         if self.islog:
             raise Exception("ParameterEnsemble already transformed")
 
-        islog = self.pst.parameter_data.loc[:,"partrans"] == "log"
+        idx = self._log_column_indices()
+        vals = self.values[:, idx]
+        if (vals <= 0.0).any():
+            raise Exception("ParameterEnsemble._transform(): non-positive " +
+                            "values for log-transformed parameters")
+        vals = np.log10(vals)
         if inplace:
-            #self.loc[:,islog] = np.log10(self.loc[:,islog])
-            self.loc[:,islog] = self.loc[:,islog].applymap(lambda x: math.log10(x))
-
+            self.iloc[:, idx] = vals
             self.__islog = True
         else:
-            vals = self.pst.parameter_data.parval1.copy()
-            new_en = ParameterEnsemble(pst=self.pst.get(),data=self.loc[:,:].copy(),
-                              columns=self.columns,
-                              mean_values=vals,islog=True)
-            new_en.loc[:,islog] = self.loc[:,islog].applymap(lambda x: math.log10(x))
+            # share the pst - only the values change
+            data = self.values.copy()
+            data[:, idx] = vals
+            new_en = ParameterEnsemble(pst=self.pst,data=data,
+                              index=self.index,columns=self.columns,
+                              mean_values=self.pst.parameter_data.parval1.copy(),
+                              islog=True)
             return new_en
 
 
 
-    def project(self,projection_matrix,inplace=True,log=None,enforce=True):
+    def project(self,projection_matrix=None,inplace=True,log=None,
+                enforce=True,v1=None):
         """ project the ensemble
         Parameters:
         ----------
@@ -285,7 +454,12 @@ class ParameterEnsemble(Ensemble):
 
             log: (pyemu.la.logger instance) for logging progress
 
-            enforce: (bool) parameter bound enforcement flag (True)
+            enforce: (bool or str) parameter bound enforcement flag (True).
+                Can also be "scale" - see ParameterEnsemble.enforce()
+
+            v1: (pyemu.Matrix) solution-space basis (npar X nsing) to
+                project with I - V1V1^T instead of projection_matrix.
+                The npar X npar projection matrix is never formed
 
         Returns:
         -------
@@ -295,68 +469,137 @@ class ParameterEnsemble(Ensemble):
 
 
         """
+        if (projection_matrix is None) == (v1 is None):
+            raise Exception("ParameterEnsemble.project(): one (and only " +
+                            "one) of projection_matrix and v1 is required")
+
+        if not inplace:
+            # project a (log transformed) copy so self is left unchanged
+            if self.islog:
+                new_en = ParameterEnsemble(pst=self.pst,
+                                  data=self.values.copy(),index=self.index,
+                                  columns=self.columns,
+                                  mean_values=self.mean_values.copy(),
+                                  islog=True)
+            else:
+                new_en = self._transform(inplace=False)
+            new_en.project(projection_matrix,inplace=True,log=log,
+                           enforce=enforce,v1=v1)
+            return new_en
 
         if not self.islog:
             self._transform()
 
         #make sure everything is cool WRT ordering
-        common_names = get_common_elements(self.adj_names,
-                                                 projection_matrix.row_names)
-        base = self.mean_values.loc[common_names]
-        projection_matrix = projection_matrix.get(common_names,common_names)
-
-        if not inplace:
-            new_en = ParameterEnsemble(pst=self.pst.get(),data=self.loc[:,:].copy(),
-                              columns=self.columns,
-                              mean_values=self.mean_values.copy(),islog=self.islog)
-
-        for real in self.index:
-            if log is not None:
-                log("projecting realization " + real)
-
-            # null space projection of difference vector
-            pdiff = np.dot(projection_matrix.x,
-                           (self.loc[real,common_names] - base)\
-                           .as_matrix())
-
-            # lb_fac = np.abs(pdiff)/((base+pdiff)-self.lbnd)
-            # lb_fac[pdiff>0.0] = 1.0
-            #
-            # ub_fac = np.abs(pdiff)/(self.ubnd-(base+pdiff))
-            # ub_fac[pdiff<=0.0] = 1.0
-            #
-            # factor = max(lb_fac.max(),
-            #              ub_fac.max())
-
-            if inplace:
-                self.loc[real,common_names] = base + pdiff
-            else:
-                new_en.loc[real,common_names] = base +  pdiff
-
-            if log is not None:
-                log("projecting realization " + real)
-        if not inplace:
-            if enforce:
-                new_en.enforce()
-            new_en._back_transform()
-            return new_en
+        if v1 is not None:
+            common_names = get_common_elements(self.adj_names,
+                                               v1.row_names)
+            v1 = v1.get(row_names=common_names).x
+        else:
+            common_names = get_common_elements(self.adj_names,
+                                               projection_matrix.row_names)
+            projection_matrix = projection_matrix.get(common_names,
+                                                      common_names).x
+        base = self.mean_values.loc[common_names].values
+
+        if log is not None:
+            log("projecting {0} realizations".format(self.shape[0]))
+        # null space projection of all the difference vectors at once -
+        # one realization per row
+        idx = self.columns.get_indexer(common_names)
+        diff = self.values[:, idx] - base
+        if v1 is not None:
+            pdiff = diff - np.dot(np.dot(diff, v1), v1.transpose())
+        else:
+            pdiff = np.dot(diff, projection_matrix.transpose())
+        self.iloc[:, idx] = base + pdiff
+        if log is not None:
+            log("projecting {0} realizations".format(self.shape[0]))
 
         if enforce:
-            self.enforce()
+            self.enforce(how=enforce)
         self._back_transform()
 
-    def enforce(self):
+    def enforce(self,how="reset"):
         """ enforce parameter bounds on the ensemble
 
+        Parameters:
+        ----------
+            how: (str) "reset" to set values that transgress the bounds to
+                the bounds (True is the same as "reset").  "scale" to shrink
+                the difference vector of each realization from the mean
+                values so the whole realization is within the bounds,
+                which preserves its direction
+
+        """
+        if how is True:
+            how = "reset"
+        ub = self.ubnd.loc[self.columns].values
+        lb = self.lbnd.loc[self.columns].values
+        vals = self.values
+        if how == "reset":
+            vals = np.where(vals > ub, ub * (1.0 + self.bound_tol), vals)
+            vals = np.where(vals < lb, lb * (1.0 - self.bound_tol), vals)
+        elif how == "scale":
+            base = self.mean_values.loc[self.columns].values
+            diff = vals - base
+            # the fraction of each difference that is within the bounds
+            with np.errstate(divide="ignore", invalid="ignore"):
+                fac = np.where(diff > 0.0, (ub - base) / diff,
+                               np.where(diff < 0.0, (lb - base) / diff,
+                                        np.inf))
+            fac = np.clip(fac.min(axis=1), 0.0, 1.0)
+            vals = base + diff * fac[:, np.newaxis]
+        else:
+            raise Exception("ParameterEnsemble.enforce(): unrecognized " +
+                            "'how' arg: " + str(how) +
+                            ", must be 'reset' or 'scale'")
+        self.iloc[:, :] = vals
+
+
+    def to_binary(self,filename,append=False):
+        """ write the ensemble to a binary ensemble file.  When appending,
+            the realizations are written in the log transform status of
+            the file
+
+        Parameters:
+        ----------
+            filename: (str) binary ensemble file name
+
+            append: (bool) append to an existing file
+
         """
-        ub = self.ubnd
-        lb = self.lbnd
-        for iname,name in enumerate(self.columns):
-            self.loc[self.loc[:,name] > ub[name],name] = ub[name].copy() * (1.0 + self.bound_tol)
-            #print(self.ubnd[name],self.loc[:,name])
-            self.loc[self.loc[:,name] < lb[name],name] = lb[name].copy() * (1.0 - self.bound_tol)
-            #print(self.lbnd[name],self.loc[:,name])
+        if append and os.path.exists(os.path.join(filename,"header.json")):
+            islog = read_binary_header(filename)["islog"]
+            if islog is not None and bool(islog) != self.islog:
+                if islog:
+                    en = self._transform(inplace=False)
+                else:
+                    en = self._back_transform(inplace=False)
+                return super(ParameterEnsemble,en).to_binary(filename,
+                                                             append=True)
+        super(ParameterEnsemble,self).to_binary(filename,append=append)
+
+    def from_binary(self,filename,columns=None,mmap_mode='c'):
+        """ load the ensemble from a binary ensemble file, including the
+            log transform status
+
+        Parameters:
+        ----------
+            filename: (str) binary ensemble file name
+
+            columns: (list[str]) optional subset of columns to load
 
+            mmap_mode: (str) numpy memory-map mode for the values, None to
+                read all the values into memory
+
+        """
+        header = super(ParameterEnsemble,self).from_binary(filename,
+                                                           columns=columns,
+                                                           mmap_mode=mmap_mode)
+        if header["islog"] is not None:
+            self.__islog = bool(header["islog"])
+        return header
 
     def read_parfiles_prefix(self,prefix):
         """ thin wrapper around read_parfiles using the pnulpar prefix concept
@@ -378,31 +621,46 @@ class ParameterEnsemble(Ensemble):
         return self.read_parfiles(parfile_names)
 
 
-    def read_parfiles(self,parfile_names):
+    def read_parfiles(self,parfile_names,num_workers=None):
         """ read the ensemble from par files
 
         Parameters:
         ----------
             parfile_names: (list[str]) list of par files to load
 
+            num_workers: (int) optional number of processes to read with
+
         Note:
         ----
             log transforms after loading according and possibly resets self.__islog
 
         """
-        par_dfs = []
         for pfile in parfile_names:
             assert os.path.exists(pfile),"ParameterEnsemble.read_parfiles() error: " +\
                                          "file: {0} not found".format(pfile)
-            df = read_parfile(pfile)
-            self.loc[pfile] = df.loc[:,'parval1']
-        self.loc[:,:] = self.loc[:,:].astype(np.float64)
+        results = read_parfiles(parfile_names,num_workers=num_workers)
+
+        # assemble the realizations in one block - names not in a
+        # par file are NaN
+        col_idx = dict([(name,i) for i,name in enumerate(self.columns)])
+        data = np.zeros((len(parfile_names),self.shape[1])) + np.NaN
+        for i,(names,vals) in enumerate(results):
+            idx = [col_idx.get(name,-1) for name in names]
+            keep = [j for j,ii in enumerate(idx) if ii >= 0]
+            data[i,[idx[j] for j in keep]] = vals[keep]
+        df = pd.DataFrame(data,index=parfile_names,columns=self.columns)
+        if self.shape[0] > 0:
+            # keep existing realizations that are not replaced
+            old = pd.DataFrame(self.values,index=self.index,
+                               columns=self.columns)
+            df = pd.concat([old.loc[~old.index.isin(parfile_names),:],df])
+        self._replace_values(df.values,df.index,df.columns)
         #if self.islog:
         #    self.__islog = False
         #self._transform(inplace=True)
 
 
-    def to_parfiles(self,prefix):
+    def to_parfiles(self,prefix,num_workers=None):
         """
             write the parameter ensemble to pest-style parameter files
 
@@ -410,6 +668,8 @@ class ParameterEnsemble(Ensemble):
         ----------
             prefix: (str) file prefix for par files
 
+            num_workers: (int) optional number of processes to write with
+
         Note:
         ----
             this function back-transforms before writing
@@ -420,9 +680,7 @@ class ParameterEnsemble(Ensemble):
             self._back_transform(inplace=True)
 
         par_df = self.pst.parameter_data.loc[:,
-                 ["parnme","parval1","scale","offset"]].copy()
-
-        for real in self.index:
-            par_file = prefix+real+".par"
-            par_df.loc[:,"parval1"] =self.loc[real,:]
-            write_parfile(par_df,par_file)
\ No newline at end of file
+                 ["parnme","parval1","scale","offset"]]
+        values = self.loc[:,par_df.parnme].values
+        parfile_names = [prefix + str(real) + ".par" for real in self.index]
+        write_parfiles(par_df,values,parfile_names,num_workers=num_workers)
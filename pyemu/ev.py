@@ -1,6 +1,7 @@
 from __future__ import print_function, division
 import numpy as np
 import pandas as pd
+import scipy.linalg as la
 from pyemu.la import LinearAnalysis
 from pyemu.mat.mat_handler import Matrix, Jco, Cov
 
@@ -18,6 +19,9 @@ class ErrVar(LinearAnalysis):
                 omitted parameter parcov
             omitted_predictions (Matrix or str): argument that identifies
             omitted prediction vectors
+            use_qhalfx (bool): flag to calculate R, G and I - R from the
+                thin SVD of qhalfx instead of the SVD of xtqx.  Cheaper
+                when nobs < npar and avoids squaring the condition number
 
         Note: if only omitted_parameters is passed, then the omitted_parameter
             argument must be a string or list of strings that identifies
@@ -54,8 +58,14 @@ class ErrVar(LinearAnalysis):
             kl = bool(kwargs["kl"])
             kwargs.pop("kl")
 
+        self.__use_qhalfx = False
+        if "use_qhalfx" in kwargs.keys():
+            self.__use_qhalfx = bool(kwargs["use_qhalfx"])
+            kwargs.pop("use_qhalfx")
 
-        self.__qhalfx = None
+        self.__qhalfx_u = None
+        self.__qhalfx_s = None
+        self.__qhalfx_v = None
         self.__R = None
         self.__R_sv = None
         self.__G = None
@@ -224,6 +234,50 @@ class ErrVar(LinearAnalysis):
             self.log("loading omitted_parcov")
         return self.__omitted_parcov
 
+    def __set_qhalfx_svd(self):
+        """private: set the components of the thin SVD of qhalfx
+        """
+        self.log("thin SVD of qhalfx")
+        try:
+            u, s, v = la.svd(self.qhalfx.x, full_matrices=False)
+            v = v.transpose()
+        except:
+            try:
+                v, s, u = la.svd(self.qhalfx.x.transpose(),
+                                 full_matrices=False)
+                u = u.transpose()
+            except:
+                raise Exception("ErrVar.__set_qhalfx_svd(): " +
+                                "unable to compute SVD of qhalfx")
+        sing_names = ["sing_val_" + str(i + 1) for i in range(s.shape[0])]
+        self.__qhalfx_u = Matrix(x=u, row_names=self.qhalfx.row_names,
+                                 col_names=["left_sing_vec_" + str(i + 1)
+                                            for i in range(u.shape[1])],
+                                 autoalign=False)
+        self.__qhalfx_s = Matrix(x=np.atleast_2d(s).transpose(),
+                                 row_names=sing_names, col_names=sing_names,
+                                 isdiagonal=True, autoalign=False)
+        self.__qhalfx_v = Matrix(x=v, row_names=self.qhalfx.col_names,
+                                 col_names=["right_sing_vec_" + str(i + 1)
+                                            for i in range(v.shape[1])],
+                                 autoalign=False)
+        self.log("thin SVD of qhalfx")
+
+    def __solution_space(self):
+        """private: get the right singular vectors and the corresponding
+            singular values of xtqx, either from the SVD of xtqx or from
+            the thin SVD of qhalfx
+        Returns:
+        -------
+            tuple(Matrix of right singular vectors,
+                  ndarray of xtqx singular values)
+        """
+        if self.__use_qhalfx:
+            if self.__qhalfx_v is None:
+                self.__set_qhalfx_svd()
+            return self.__qhalfx_v, self.__qhalfx_s.x[:, 0] ** 2
+        return self.xtqx.v, self.xtqx.s.x[:, 0]
+
     def get_errvar_dataframe(self, singular_values=None):
         """get a pandas dataframe of error variance results indexed
             on singular value and (prediction name,<term>)
@@ -241,15 +295,133 @@ class ErrVar(LinearAnalysis):
         if not isinstance(singular_values, list) and \
                 not isinstance(singular_values, np.ndarray):
             singular_values = [singular_values]
-        results = {}
-        for singular_value in singular_values:
-            sv_results = self.variance_at(singular_value)
-            for key, val in sv_results.items():
-                if key not in results.keys():
-                    results[key] = []
-                results[key].append(val)
+        results = self.__sweep(singular_values)
         return pd.DataFrame(results, index=singular_values)
 
+    def __sweep(self, singular_values):
+        """private: calculate all three error variance terms for all
+            predictions at every singular value in one pass.  The
+            predictions are projected onto the right singular vectors of
+            xtqx once and each term is then accumulated over the singular
+            components, rather than forming I-R, G and the npar X npar
+            term matrices at each singular value.
+        Parameters:
+        ----------
+            singular_values (list of int) : singular values to test
+        Returns:
+        -------
+            dict{[<term>,prediction_name]:list of error variances}
+        """
+        if not self.predictions:
+            raise Exception("ErrVar.__sweep(): no predictions are set")
+        self.log("error variance sweep")
+        v, s = self.__solution_space()
+        names = v.row_names
+        npar = len(names)
+        # the number of singular components available
+        nsing = v.shape[1]
+        mn = min(self.jco.shape)
+        try:
+            mn = min(self.pst.npar_adj, self.pst.nnz_obs)
+        except:
+            pass
+        # the largest number of singular components actually used
+        ksum = min(max([sv for sv in singular_values if sv <= mn] + [0]),
+                   nsing)
+        s = s[:ksum]
+
+        v1 = v.x[:, :ksum]
+        # V_1^T * X^T * Q * X * V_1
+        if self.__use_qhalfx:
+            d = np.diag(s)
+        else:
+            d = np.dot(v1.T, np.dot(self.xtqx.x, v1))
+
+        parcov = self.parcov.get(row_names=names)
+        if parcov.isdiagonal:
+            c = parcov.x[:, 0]
+        else:
+            # parcov in the basis of the right singular vectors, formed
+            # once for all predictions
+            cv = np.dot(parcov.x, v.x)
+            vcv = np.dot(v.x.T, cv)
+        if self.__need_omitted:
+            ojco = self.omitted_jco
+            # V_1^T * X^T * Q * X_o
+            if self.__use_qhalfx:
+                u = self.__qhalfx_u
+                qhalf = self.qhalf.get(row_names=u.row_names)
+                h = np.sqrt(s)[:, np.newaxis] * np.dot(u.x[:, :ksum].T,
+                    (qhalf * ojco.get(row_names=u.row_names)).x)
+            else:
+                h = np.dot(v1.T, ((self.jco.T * self.obscov.inv) * ojco).x)
+            oparcov = self.omitted_parcov.get(row_names=ojco.col_names).as_2d
+
+        results = {}
+        for iprediction, prediction in enumerate(self.predictions):
+            pred_name = prediction.col_names[0]
+            # project the prediction onto the right singular vectors
+            y = prediction.get(row_names=names).x[:, 0]
+            a = np.dot(v.x.T, y)
+
+            # first term - (I-R)y = y - sum(v_i * a_i) over the
+            # solution space
+            if parcov.isdiagonal:
+                w = np.zeros((npar, nsing + 1))
+                w[:, 0] = y
+                w[:, 1:] = y[:, np.newaxis] - np.cumsum(v.x * a, axis=1)
+                first = (c[:, np.newaxis] * w ** 2).sum(axis=0)
+            else:
+                # with y = V * a + r, (I-R)y = r + sum(v_i * a_i) over
+                # the components not yet used, so each term is a tail
+                # sum over the singular components
+                r = y - np.dot(v.x, a)
+                cross = a * np.dot(cv.T, r)
+                quad = np.diag((np.outer(a, a) * vcv)[::-1, ::-1].
+                               cumsum(axis=0).cumsum(axis=1))[::-1]
+                first = np.zeros(nsing + 1)
+                first[:-1] = 2.0 * np.cumsum(cross[::-1])[::-1] + quad
+                first += np.dot(r, np.dot(parcov.x, r))
+
+            # second term - b^T * V_1^T * X^T * Q * X * V_1 * b
+            # accumulated over the leading block of singular components
+            b = a[:ksum] / s
+            second = np.zeros(ksum + 1)
+            second[1:] = np.diag((np.outer(b, b) * d).cumsum(axis=0).
+                                 cumsum(axis=1))
+
+            # third term - y^T * G * X_o - y_o^T over the solution space
+            if self.__need_omitted:
+                yo = self.omitted_predictions[iprediction].\
+                    get(row_names=ojco.col_names).x[:, 0]
+                p = np.zeros((ksum + 1, yo.shape[0]))
+                p[1:, :] = np.cumsum(b[:, np.newaxis] * h, axis=0)
+                p -= yo
+                third = (p * np.dot(p, oparcov)).sum(axis=1)
+
+            for term in ["first", "second", "third"]:
+                results[(term, pred_name)] = []
+            for singular_value in singular_values:
+                if singular_value > npar:
+                    results[("first", pred_name)].append(0.0)
+                else:
+                    results[("first", pred_name)].append(
+                        float(first[min(singular_value, nsing)]))
+                if singular_value > mn:
+                    results[("second", pred_name)].append(1.0E+35)
+                else:
+                    results[("second", pred_name)].append(
+                        float(second[min(singular_value, ksum)]))
+                if not self.__need_omitted:
+                    results[("third", pred_name)].append(0.0)
+                elif singular_value > mn:
+                    results[("third", pred_name)].append(1.0E+35)
+                else:
+                    results[("third", pred_name)].append(
+                        float(third[min(singular_value, ksum)]))
+        self.log("error variance sweep")
+        return results
+
     def get_identifiability_dataframe(self,singular_value):
         """get the parameter identifiability as a pandas dataframe
         Parameters:
@@ -260,8 +432,8 @@ class ErrVar(LinearAnalysis):
             A pandas dataframe of the V_1**2 Matrix with the
              identifiability in the column labeled "ident"
         """
-        #v1_df = self.qhalfx.v[:, :singular_value].to_dataframe() ** 2
-        v1_df = self.xtqx.v[:, :singular_value].to_dataframe() ** 2
+        v, s = self.__solution_space()
+        v1_df = v[:, :singular_value].to_dataframe() ** 2
         v1_df["ident"] = v1_df.sum(axis=1)
         return v1_df
 
@@ -298,8 +470,8 @@ class ErrVar(LinearAnalysis):
             return self.parcov.identity
         else:
             self.log("calc R @" + str(singular_value))
-            #v1 = self.qhalfx.v[:, :singular_value]
-            v1 = self.xtqx.v[:, :singular_value]
+            v, s = self.__solution_space()
+            v1 = v[:, :singular_value]
             self.__R = v1 * v1.T
             self.__R_sv = singular_value
             self.log("calc R @" + str(singular_value))
@@ -320,8 +492,16 @@ class ErrVar(LinearAnalysis):
         else:
             if singular_value > self.jco.ncol:
                 return self.parcov.zero
+            elif self.__use_qhalfx:
+                # the thin SVD only carries V_1, so form I - V_1 * V_1^T
+                v, s = self.__solution_space()
+                v1 = v.x[:, :singular_value]
+                self.__I_R = Matrix(x=np.eye(v.shape[0]) - np.dot(v1, v1.T),
+                                    row_names=v.row_names,
+                                    col_names=v.row_names)
+                self.__I_R_sv = singular_value
+                return self.__I_R
             else:
-                #v2 = self.qhalfx.v[:, singular_value:]
                 v2 = self.xtqx.v[:, singular_value:]
                 self.__I_R = v2 * v2.T
                 self.__I_R_sv = singular_value
@@ -330,6 +510,7 @@ class ErrVar(LinearAnalysis):
     def G(self, singular_value):
         """get the parameter solution Matrix at a singular value
             V_1 * S_1^(_1) * U_1^T
+            (* Q^(1/2) if use_qhalfx)
         Parameters:
         ----------
             singular_value (int) : singular value to calc G at
@@ -358,14 +539,22 @@ class ErrVar(LinearAnalysis):
                 str(min(self.pst.npar_adj, self.pst.nnz_obs)))
             singular_value = min(self.pst.npar_adj, self.pst.nnz_obs)
         self.log("calc G @" + str(singular_value))
-        #v1 = self.qhalfx.v[:, :singular_value]
-        v1 = self.xtqx.v[:, :singular_value]
-        #s1 = ((self.qhalfx.s[:singular_value]) ** 2).inv
-        s1 = (self.xtqx.s[:singular_value]).inv
-        self.__G = v1 * s1 * v1.T * self.jco.T * self.obscov.inv
-        self.__G_sv = singular_value
-        self.__G.row_names = self.jco.col_names
-        self.__G.col_names = self.jco.row_names
+        if self.__use_qhalfx:
+            v, s = self.__solution_space()
+            v1 = v[:, :singular_value]
+            s1 = (self.__qhalfx_s[:singular_value]).inv
+            u1 = self.__qhalfx_u[:, :singular_value]
+            self.__G = v1 * s1 * u1.T * self.qhalf.get(row_names=u1.row_names)
+            self.__G_sv = singular_value
+            self.__G.row_names = v.row_names
+            self.__G.col_names = u1.row_names
+        else:
+            v1 = self.xtqx.v[:, :singular_value]
+            s1 = (self.xtqx.s[:singular_value]).inv
+            self.__G = v1 * s1 * v1.T * self.jco.T * self.obscov.inv
+            self.__G_sv = singular_value
+            self.__G.row_names = self.jco.col_names
+            self.__G.col_names = self.jco.row_names
         self.__G.autoalign = True
         self.log("calc G @" + str(singular_value))
         return self.__G
@@ -3,9 +3,11 @@ import os
 import copy
 from datetime import datetime
 import numpy as np
+from scipy.linalg import blas
 #import mat_handler as mhand
 #import pst_handler as phand
 from pyemu.mat.mat_handler import Matrix, Jco, Cov
+from pyemu.mat.mat_cache import MatrixCache
 from pyemu.pst.pst_handler import Pst
 
 
@@ -103,18 +105,21 @@ class LinearAnalysis(object):
             prediction sensitivity vectors
         ref_var (float) : reference variance
         verbose (either bool or string) : controls log file / screen output
+        cache_dir (str or MatrixCache) : optional directory to cache
+            the expensive intermediates (qhalf, qhalfx, xtqx, fehalf and
+            their SVDs) in.  Entries are keyed by the content of jco,
+            parcov and obscov, so they are reused by later analyses
     Notes:
         the class makes heavy use of property decorator to encapsulate
         private attributes
     """
     def __init__(self, jco=None, pst=None, parcov=None, obscov=None,
                  predictions=None, ref_var=1.0, verbose=False,
-                 resfile=False, forecasts=None,**kwargs):
+                 resfile=False, forecasts=None, cache_dir=None, **kwargs):
         self.logger = logger(verbose)
         self.log = self.logger.log
         self.jco_arg = jco
-        #if jco is None:
-        self.__jco = jco
+        self.__jco = None
         if pst is None:
             if isinstance(jco, str):
                 pst_case = jco.replace(".jco", ".pst").replace(".jcb",".pst")
@@ -144,38 +149,31 @@ class LinearAnalysis(object):
         self.__xtqx = None
         self.__fehalf = None
         self.__prior_prediction = None
-
-        self.log("pre-loading base components")
-        if jco is not None:
-            self.__load_jco()
-        if pst is not None:
-            self.__load_pst()
-        if parcov is not None:
-            self.__load_parcov()
-        if obscov is not None:
-            self.__load_obscov()
-
-        if predictions is not None:
-            self.__load_predictions()
-        self.log("pre-loading base components")
+        # names to drop from jco (once it is loaded) and obscov
+        self.__jco_drop_names = []
+        self.__forecast_obs_names = []
+        self.__loading_predictions = False
+
+        self.__cache = None
+        if cache_dir is not None:
+            if isinstance(cache_dir, MatrixCache):
+                self.__cache = cache_dir
+            else:
+                self.__cache = MatrixCache(cache_dir)
+        self.__cache_keys = {}
+        # name: True once the SVD is in the cache too
+        self.__cache_written = {}
+        # id(matrix): (matrix, matrix.x, hash) - each input matrix is only
+        # hashed again if it, or its x, has been replaced
+        self.__matrix_hashes = {}
+
+        # the base components are loaded the first time they are accessed
         if len(kwargs.keys()) > 0:
             self.logger.warn("unused kwargs in type " +
                              str(self.__class__.__name__) +
                              " : " + str(kwargs))
             raise Exception("unused kwargs" +
                              " : " + str(kwargs))
-        # automatically do some things that should be done
-        self.log("dropping prior information")
-        pi = None
-        try:
-            pi = self.pst.prior_information
-        except:
-            self.logger.warn("unable to access self.pst: can't tell if " +
-                             " any prior information needs to be dropped.")
-        if pi is not None:
-            self.drop_prior_information()
-        self.log("dropping prior information")
-
 
         if resfile != False:
             self.log("scaling obscov by residual phi components")
@@ -238,17 +236,21 @@ class LinearAnalysis(object):
             return None
         if isinstance(self.pst_arg, Pst):
             self.__pst = self.pst_arg
-            return self.pst
         else:
             try:
                 self.log("loading pst: " + str(self.pst_arg))
                 self.__pst = Pst(self.pst_arg)
                 self.log("loading pst: " + str(self.pst_arg))
-                return self.pst
             except Exception as e:
                 raise Exception("linear_analysis.__load_pst(): error loading"+\
                                 " pest control from argument: " +
                                 str(self.pst_arg) + '\n->' + str(e))
+        # automatically do some things that should be done
+        if self.__pst.prior_information is not None:
+            self.log("dropping prior information")
+            self.drop_prior_information()
+            self.log("dropping prior information")
+        return self.__pst
 
 
     def __load_jco(self):
@@ -271,6 +273,53 @@ class LinearAnalysis(object):
             raise Exception("linear_analysis.__load_jco(): jco_arg must " +
                             "be a matrix object or a file name: " +
                             str(self.jco_arg))
+        # make sure the prior information and forecast rows are
+        # dropped, same as if they had been dropped after loading
+        if self.__pst is None and self.pst_arg is not None:
+            try:
+                self.pst
+            except:
+                self.logger.warn("unable to access self.pst: can't tell " +
+                                 "if any prior information needs to be " +
+                                 "dropped.")
+        if self.prediction_arg is not None and self.__predictions is None:
+            self.__load_predictions()
+        self.__drop_pending(self.__jco, self.__jco_drop_names, axis=0)
+
+    def __drop_pending(self, mat, names, axis):
+        """private: drop names that were queued before mat was loaded
+        Parameters:
+        ----------
+            mat (Matrix) : the matrix to drop from
+            names (list of str) : the queued names. emptied in place
+            axis (int) : the axis to drop from
+        Returns:
+        -------
+            None
+        """
+        if len(names) == 0:
+            return
+        if axis == 0:
+            present = set(mat.row_names)
+        else:
+            present = set(mat.col_names)
+        drop = [name for name in names if name in present]
+        if len(drop) > 0:
+            mat.drop(drop, axis=axis)
+        del names[:]
+
+    def __jco_row_names(self):
+        """private: get the jco row names, reading only the names
+            from a binary jco file if the jco is not loaded yet
+        """
+        if self.__jco is None and isinstance(self.jco_arg, str) and\
+            self.jco_arg.split('.')[-1].lower() in ["jco", "jcb"]:
+            try:
+                return Jco().read_binary_names(self.jco_arg)[0]
+            except Exception as e:
+                self.logger.warn("unable to read names from " +
+                                 self.jco_arg + ", loading jco: " + str(e))
+        return self.jco.row_names
 
 
     def __load_parcov(self):
@@ -315,8 +364,11 @@ class LinearAnalysis(object):
             # then load parcov from parbounds
             if self.parcov_arg.lower().endswith(".pst"):
                 self.__parcov = Cov()
-
-                self.__parcov.from_parbounds(self.parcov_arg)
+                # reuse the already loaded pst rather than re-reading it
+                if self.parcov_arg == self.pst_arg:
+                    self.__parcov.from_parbounds(self.pst)
+                else:
+                    self.__parcov.from_parbounds(self.parcov_arg)
             else:
                 self.__parcov = self.__fromfile(self.parcov_arg)
         # if the arg is a pst object
@@ -371,7 +423,11 @@ class LinearAnalysis(object):
         if isinstance(self.obscov_arg, str):
             if self.obscov_arg.lower().endswith(".pst"):
                 self.__obscov = Cov()
-                self.__obscov.from_obsweights(self.obscov_arg)
+                # reuse the already loaded pst rather than re-reading it
+                if self.obscov_arg == self.pst_arg:
+                    self.__obscov.from_obsweights(self.pst)
+                else:
+                    self.__obscov.from_obsweights(self.obscov_arg)
             else:
                 self.__obscov = self.__fromfile(self.obscov_arg)
         elif isinstance(self.obscov_arg, Pst):
@@ -398,12 +454,17 @@ class LinearAnalysis(object):
         if self.prediction_arg is None:
             self.__predictions = None
             return
+        # loading the jco during the loop below calls back here
+        if self.__loading_predictions:
+            return
+        self.__loading_predictions = True
         self.log("loading forecasts")
         if not isinstance(self.prediction_arg, list):
             self.prediction_arg = [self.prediction_arg]
 
         row_names = []
         vecs = []
+        jco_row_names = None
         for arg in self.prediction_arg:
             if isinstance(arg, Matrix):
                 # a vector
@@ -418,7 +479,9 @@ class LinearAnalysis(object):
                     for pred_name in arg.row_names:
                         vecs.append(arg.extract(row_names=pred_name).T)
             elif isinstance(arg, str):
-                if arg.lower() in self.jco.row_names:
+                if jco_row_names is None:
+                    jco_row_names = set(self.__jco_row_names())
+                if arg.lower() in jco_row_names:
                     row_names.append(arg.lower())
                 else:
                     pred_mat = self.__fromfile(arg)
@@ -457,15 +520,27 @@ class LinearAnalysis(object):
                 raise Exception("unrecognized predictions argument: " +
                                 str(arg))
         if len(row_names) > 0:
-            extract = self.jco.extract(row_names=row_names)
+            if self.__jco is None and isinstance(self.jco_arg, str) and\
+                self.jco_arg.split('.')[-1].lower() in ["jco", "jcb"]:
+                # only read the forecast rows - the rest of the jco
+                # is loaded when it is needed
+                self.log("loading forecast rows from jco: " + self.jco_arg)
+                extract = Jco()
+                extract.from_binary(self.jco_arg, row_names=row_names)
+                self.__jco_drop_names.extend(row_names)
+                self.log("loading forecast rows from jco: " + self.jco_arg)
+            else:
+                extract = self.jco.extract(row_names=row_names)
             for row_name in row_names:
                 vecs.append(extract.get(row_names=row_name).T)
 
-            # call obscov to load __obscov so that __obscov
-            # (priavte) can be manipulated
-            self.obscov
-            self.__obscov.drop(row_names, axis=0)
+            # the forecasts are not observations
+            self.__forecast_obs_names.extend(row_names)
+            if self.__obscov is not None:
+                self.__drop_pending(self.__obscov,
+                                    list(self.__forecast_obs_names), axis=0)
         self.__predictions = vecs
+        self.__loading_predictions = False
         self.log("loading forecasts")
         return self.__predictions
 
@@ -484,7 +559,13 @@ class LinearAnalysis(object):
     @property
     def obscov(self):
         if not self.__obscov:
+            # the forecast names need to be known to drop them from obscov
+            if self.prediction_arg is not None and\
+                            self.__predictions is None:
+                self.__load_predictions()
             self.__load_obscov()
+            self.__drop_pending(self.__obscov,
+                                list(self.__forecast_obs_names), axis=0)
         return self.__obscov
 
 
@@ -513,18 +594,84 @@ class LinearAnalysis(object):
         elif self.__pst:
             return self.__pst
         else:
-            self.__load_pst()
+            return self.__load_pst()
 
 
+    def __from_cache(self, name, *args):
+        """private: try to load an intermediate from the cache
+        Parameters:
+        ----------
+            name (str) : name of the intermediate
+            args (Matrix) : the matrices the intermediate is calculated from
+        Returns:
+        -------
+            Matrix if found in the cache, otherwise None
+        """
+        if self.__cache is None:
+            return None
+        key = self.__cache.key(name, *[self.__hash_matrix(arg)
+                                       for arg in args])
+        self.__cache_keys[name] = key
+        self.log("loading " + name + " from cache")
+        mat = self.__cache.get(key)
+        self.log("loading " + name + " from cache")
+        if mat is not None:
+            self.__cache_written[name] = self.__cache.has_svd(key)
+        return mat
+
+    def __hash_matrix(self, mat):
+        """private: get the content hash of an input matrix, hashing it
+            only the first time it is used
+        Parameters:
+        ----------
+            mat (Matrix) : the matrix
+        Returns:
+        -------
+            str : the hash (see MatrixCache.hash_matrix())
+        """
+        memo = self.__matrix_hashes.get(id(mat), None)
+        if memo is not None and memo[0] is mat and memo[1] is mat.x:
+            return memo[2]
+        self.log("hashing " + str(mat.shape) + " matrix")
+        h = self.__cache.hash_matrix(mat)
+        self.log("hashing " + str(mat.shape) + " matrix")
+        # keep references so the ids can't be reused
+        self.__matrix_hashes[id(mat)] = (mat, mat.x, h)
+        return h
+
+    def __to_cache(self, name, mat):
+        """private: store an intermediate (and its SVD, once computed)
+            in the cache.  The cache is only touched when there is
+            something new to write - the first call and the first call
+            after the SVD of mat has been calculated
+        Parameters:
+        ----------
+            name (str) : name of the intermediate
+            mat (Matrix) : the intermediate
+        Returns:
+        -------
+            None
+        """
+        if self.__cache is None or name not in self.__cache_keys:
+            return
+        if name in self.__cache_written and \
+                (self.__cache_written[name] or mat._Matrix__s is None):
+            return
+        self.__cache_written[name] = self.__cache.put(self.__cache_keys[name],
+                                                      mat)
+
     @property
     def fehalf(self):
         """set the KL parcov scaling matrix attribute
         """
         if self.__fehalf != None:
             return self.__fehalf
-        self.log("fehalf")
-        self.__fehalf = self.parcov.u * (self.parcov.s ** (0.5))
-        self.log("fehalf")
+        self.__fehalf = self.__from_cache("fehalf", self.parcov)
+        if self.__fehalf is None:
+            self.log("fehalf")
+            self.__fehalf = self.parcov.u * (self.parcov.s ** (0.5))
+            self.log("fehalf")
+            self.__to_cache("fehalf", self.__fehalf)
         return self.__fehalf
 
 
@@ -534,19 +681,57 @@ class LinearAnalysis(object):
         """
         if self.__qhalf != None:
             return self.__qhalf
-        self.log("qhalf")
-        self.__qhalf = self.obscov ** (-0.5)
-        self.log("qhalf")
+        self.__qhalf = self.__from_cache("qhalf", self.obscov)
+        if self.__qhalf is None:
+            self.log("qhalf")
+            self.__qhalf = self.obscov ** (-0.5)
+            self.log("qhalf")
+            self.__to_cache("qhalf", self.__qhalf)
         return self.__qhalf
 
+    def __weighted_jco(self):
+        """private: scale the rows of jco by the observation weights
+            (the square root of the inverse of a diagonal obscov) without
+            forming the obscov inverse
+        Returns:
+        -------
+            tuple(list of row names, ndarray of Q^(1/2) * X)
+        """
+        jco, obscov = self.jco, self.obscov
+        names = jco.row_names
+        x = jco.x
+        if names == obscov.row_names:
+            w = obscov.x[:, 0]
+        else:
+            # align on the common observations, same as autoalign would
+            onames = set(obscov.row_names)
+            names = [name for name in jco.row_names if name in onames]
+            if len(names) == 0:
+                raise Exception("LinearAnalysis.__weighted_jco(): no " +
+                                "common observations between jco and " +
+                                "obscov")
+            if len(names) != jco.shape[0]:
+                x = jco.get(row_names=names).x
+            w = obscov.get(row_names=names).x[:, 0]
+        return names, x * (1.0 / np.sqrt(w))[:, np.newaxis]
+
     @property
     def qhalfx(self):
         """set the half normal matrix attribute
         """
         if self.__qhalfx is None:
-            self.log("qhalfx")
-            self.__qhalfx = self.qhalf * self.jco
-            self.log("qhalfx")
+            self.__qhalfx = self.__from_cache("qhalfx", self.jco, self.obscov)
+            if self.__qhalfx is None:
+                self.log("qhalfx")
+                if self.obscov.isdiagonal:
+                    names, wx = self.__weighted_jco()
+                    self.__qhalfx = type(self.jco)(x=wx, row_names=names,
+                                             col_names=self.jco.col_names)
+                else:
+                    self.__qhalfx = self.qhalf * self.jco
+                self.log("qhalfx")
+        # also picks up SVD components calculated since the last access
+        self.__to_cache("qhalfx", self.__qhalfx)
         return self.__qhalfx
 
     @property
@@ -554,9 +739,27 @@ class LinearAnalysis(object):
         """set the normal matrix attribute
         """
         if self.__xtqx is None:
-            self.log("xtqx")
-            self.__xtqx = self.jco.T * (self.obscov ** -1) * self.jco
-            self.log("xtqx")
+            self.__xtqx = self.__from_cache("xtqx", self.jco, self.obscov)
+            if self.__xtqx is None:
+                self.log("xtqx")
+                if self.obscov.isdiagonal:
+                    # (w * X)^T * (w * X) as a single symmetric rank-k
+                    # update, reusing qhalfx if it is already in memory
+                    if self.__qhalfx is not None:
+                        wx = self.__qhalfx.x
+                    else:
+                        wx = self.__weighted_jco()[1]
+                    # dsyrk fills the upper triangle
+                    x = blas.dsyrk(1.0, np.asarray(wx, dtype=np.float64).T)
+                    x += np.triu(x, 1).T
+                    self.__xtqx = type(self.jco)(x=x,
+                                                 row_names=self.jco.col_names,
+                                                 col_names=self.jco.col_names)
+                else:
+                    self.__xtqx = self.jco.T * (self.obscov ** -1) * self.jco
+                self.log("xtqx")
+        # also picks up SVD components calculated since the last access
+        self.__to_cache("xtqx", self.__xtqx)
         return self.__xtqx
 
 
@@ -661,8 +864,11 @@ class LinearAnalysis(object):
                                             "obs cov")
         #pi_names = list(self.pst.prior_information.pilbl.values)
         pi_names = list(self.pst.prior_names)
-        if self.jco is not None:
-            self.__jco.drop(pi_names, axis=0)
+        if self.__jco is not None:
+            self.__drop_pending(self.__jco, pi_names, axis=0)
+        elif self.jco_arg is not None:
+            # drop once the jco is loaded
+            self.__jco_drop_names.extend(pi_names)
         self.__pst.prior_information = self.pst.null_prior
         self.__pst.control_data.pestmode = "estimation"
         #self.__obscov.drop(pi_names,axis=0)
@@ -730,12 +936,12 @@ class LinearAnalysis(object):
         if astype is not None:
             return astype(jco=new_jco, pst=new_pst, parcov=new_parcov,
                           obscov=new_obscov, predictions=new_preds,
-                          verbose=False)
+                          verbose=False, cache_dir=self.__cache)
         else:
             # return a new object of the same type
             return type(self)(jco=new_jco, pst=new_pst, parcov=new_parcov,
                               obscov=new_obscov, predictions=new_preds,
-                              verbose=False)
+                              verbose=False, cache_dir=self.__cache)
 
 
     def adjust_obscov_resfile(self, resfile=None):
@@ -1,2 +1,2 @@
 from .mat_handler import Matrix, Cov, Jco
-
+from .mat_cache import MatrixCache
@@ -0,0 +1,229 @@
+from __future__ import print_function, division
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+from pyemu.mat.mat_handler import Matrix, Jco, Cov
+from pyemu.pst.pst_utils import replace_file
+
+
+class MatrixCache(object):
+    """a size-bounded, least-recently-used on-disk cache of Matrix objects.
+        Each entry is a directory holding the entries of the Matrix as a
+        numpy .npy file (memory-mapped on load), the row and column names
+        and, if they have been computed, the SVD components.
+
+    Parameters:
+    ----------
+        cache_dir (str) : directory to store the cache entries in
+        max_size (float) : maximum size of the cache in bytes.  The least
+            recently used entries are evicted once this is exceeded
+    Note:
+        entries are keyed by content hashes, so the cache can be shared
+        between analyses (and processes) that use the same matrices
+    """
+    def __init__(self, cache_dir, max_size=1.0e+10):
+        self.cache_dir = cache_dir
+        self.max_size = float(max_size)
+        self.info_file = "info.json"
+        self.svd_names = ["u", "v", "s"]
+        self.types = {"Matrix": Matrix, "Jco": Jco, "Cov": Cov}
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def hash_matrix(mat):
+        """get a content hash of a Matrix
+        Parameters:
+        ----------
+            mat (Matrix) : the matrix to hash
+        Returns:
+        -------
+            str : hex digest of the entries, names and diagonal flag
+        """
+        h = hashlib.sha1()
+        h.update(str(mat.isdiagonal).encode())
+        h.update(str(mat.x.shape).encode())
+        h.update('\n'.join(mat.row_names).encode())
+        h.update('|'.encode())
+        h.update('\n'.join(mat.col_names).encode())
+        h.update(np.ascontiguousarray(mat.x, dtype=np.float64))
+        return h.hexdigest()
+
+    @staticmethod
+    def key(name, *hashes):
+        """get a cache key for a named intermediate
+        Parameters:
+        ----------
+            name (str) : name of the intermediate (e.g. "xtqx")
+            hashes (str) : content hashes of the matrices it depends on
+        Returns:
+        -------
+            str : the cache key
+        """
+        h = hashlib.sha1()
+        h.update(name.encode())
+        for item in hashes:
+            h.update(item.encode())
+        return name + '_' + h.hexdigest()
+
+    def __entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.__entry(key),
+                                           self.info_file))
+
+    def __has_svd(self, key):
+        return all([os.path.exists(os.path.join(self.__entry(key),
+                                                name + ".npy"))
+                    for name in self.svd_names])
+
+    def __save(self, entry, name, arr):
+        """private: write an array to a temp file and rename it so readers
+            never see a partially written file
+        """
+        tmp = os.path.join(entry, name + ".{0:d}.tmp".format(os.getpid()))
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(arr))
+        replace_file(tmp, os.path.join(entry, name + ".npy"))
+
+    def __load(self, entry, name):
+        return np.load(os.path.join(entry, name + ".npy"), mmap_mode='c')
+
+    def get(self, key):
+        """load a Matrix from the cache
+        Parameters:
+        ----------
+            key (str) : cache key
+        Returns:
+        -------
+            Matrix (or derived type) with memory-mapped entries if key is
+            in the cache, otherwise None
+        """
+        if key not in self:
+            return None
+        entry = self.__entry(key)
+        try:
+            with open(os.path.join(entry, self.info_file), 'r') as f:
+                info = json.load(f)
+            x = self.__load(entry, "x")
+            mat = self.types[info["type"]](x=x, row_names=info["row_names"],
+                                           col_names=info["col_names"],
+                                           isdiagonal=info["isdiagonal"],
+                                           autoalign=info["autoalign"])
+            if self.__has_svd(key):
+                u, v, s = [self.__load(entry, name)
+                           for name in self.svd_names]
+                mat._Matrix__set_svd_components(u, s, v)
+        except Exception as e:
+            print("MatrixCache.get() warning: unable to load cache " +
+                  "entry {0}: {1}".format(key, str(e)))
+            return None
+        # mark as most recently used
+        os.utime(entry, None)
+        return mat
+
+    def has_svd(self, key):
+        """check if the SVD components of an entry are cached
+        """
+        return key in self and self.__has_svd(key)
+
+    def put(self, key, mat):
+        """store a Matrix (and its SVD components, if they have been
+            computed) in the cache
+        Parameters:
+        ----------
+            key (str) : cache key
+            mat (Matrix) : the matrix to store
+        Returns:
+        -------
+            bool : True if both the matrix and its SVD are now cached
+        Note:
+            the cache is only evicted if something was written
+        """
+        entry = self.__entry(key)
+        if not os.path.exists(entry):
+            os.makedirs(entry)
+        written = False
+        if key not in self:
+            written = True
+            self.__save(entry, "x", mat.x)
+            info = {"type": type(mat).__name__, "row_names": mat.row_names,
+                    "col_names": mat.col_names,
+                    "isdiagonal": mat.isdiagonal,
+                    "autoalign": mat.autoalign}
+            if info["type"] not in self.types:
+                info["type"] = "Matrix"
+            tmp = os.path.join(entry, self.info_file +
+                               ".{0:d}.tmp".format(os.getpid()))
+            with open(tmp, 'w') as f:
+                json.dump(info, f)
+            replace_file(tmp, os.path.join(entry, self.info_file))
+        complete = self.__has_svd(key)
+        if not complete and mat._Matrix__s is not None:
+            # s is written last and marks the svd as complete
+            self.__save(entry, "u", mat.u.x)
+            self.__save(entry, "v", mat.v.x)
+            self.__save(entry, "s", mat.s.x[:, 0])
+            complete = True
+            written = True
+        os.utime(entry, None)
+        if written:
+            self.evict(keep=key)
+        return complete
+
+    @property
+    def entries(self):
+        """get the cache entries from least to most recently used
+        Returns:
+        -------
+            list of tuple(key, size in bytes)
+        """
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self.__entry(key)
+            if not os.path.isdir(entry):
+                continue
+            size = sum([os.path.getsize(os.path.join(entry, f))
+                        for f in os.listdir(entry)])
+            entries.append((os.path.getmtime(entry), key, size))
+        entries.sort()
+        return [(key, size) for _, key, size in entries]
+
+    @property
+    def size(self):
+        """the total size of the cache in bytes
+        """
+        return sum([size for _, size in self.entries])
+
+    def evict(self, keep=None):
+        """remove least recently used entries until the cache is no larger
+            than max_size
+        Parameters:
+        ----------
+            keep (str) : a key that should not be evicted
+        Returns:
+        -------
+            list of evicted keys
+        """
+        entries = self.entries
+        total = sum([size for _, size in entries])
+        evicted = []
+        for key, size in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.__entry(key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted
+
+    def clear(self):
+        """remove all entries from the cache
+        """
+        for key, _ in self.entries:
+            shutil.rmtree(self.__entry(key), ignore_errors=True)
@@ -1,5 +1,6 @@
 from __future__ import print_function, division
 import copy
+import zlib
 import struct
 import numpy as np
 import pandas
@@ -63,22 +64,36 @@ def concat(mats):
 
 def get_common_elements(list1, list2):
     """find the common elements in two lists.  used to support auto align
-        might be faster with sets
     Parameters:
     ----------
         list1 : a list of objects
         list2 : a list of objects
     Returns:
     -------
-        list of common objects shared by list1 and list2
+        list of common objects shared by list1 and list2, in list1 order
     """
-    result = []
-    for item in list1:
-        if item in list2:
-            result.append(item)
-    return result
+    set2 = set(list2)
+    return [item for item in list1 if item in set2]
 
 
+def get_random_state(seed=None):
+    """get a random number generator for drawing realizations
+    Parameters:
+    ----------
+        seed : None, int, numpy.random.RandomState or a
+            numpy.random.Generator-like object with a standard_normal()
+            method
+    Returns:
+    -------
+        generator : numpy.random (the global state) if seed is None,
+            a new RandomState if seed is an int, otherwise seed
+    """
+    if seed is None:
+        return np.random
+    if hasattr(seed, "standard_normal"):
+        return seed
+    return np.random.RandomState(seed)
+
 
 class Matrix(object):
     """a class for easy linear algebra
@@ -415,16 +430,13 @@ class Matrix(object):
                 elem_prod.isdiagonal = True
                 return elem_prod
             elif first.isdiagonal:
-                ox = second.newx
-                for j in range(first.shape[0]):
-                    ox[j, :] *= first.x[j]
+                # scale the rows of second
+                ox = second.x * first.x
                 return type(self)(x=ox, row_names=first.row_names,
                               col_names=second.col_names)
             elif second.isdiagonal:
-                x = first.newx
-                ox = second.x
-                for j in range(first.shape[1]):
-                    x[:, j] *= ox[j]
+                # scale the columns of first
+                x = first.x * second.x.transpose()
                 return type(self)(x=x, row_names=first.row_names,
                               col_names=second.col_names)
             else:
@@ -457,6 +469,19 @@ class Matrix(object):
             except:
                 raise Exception("Matrix.__set_svd(): " +
                                 "unable to compute SVD of self.x")
+        self.__set_svd_components(u, s, v)
+
+    def __set_svd_components(self, u, s, v):
+        """private method to set SVD components from arrays
+        Parameters:
+        ----------
+            u : ndarray of left singular vectors
+            s : ndarray (vector) of singular values
+            v : ndarray of right singular vectors (not transposed)
+        Returns:
+        -------
+            None
+        """
         col_names = []
         [col_names.append("left_sing_vec_" + str(i + 1))
          for i in range(u.shape[1])]
@@ -666,15 +691,20 @@ class Matrix(object):
             numpy.ndarray : indices of names.  if axis is None, two ndarrays
                 are returned, corresponding the indices of names for each axis
         """
+        # name -> first index lookups
+        row_map = dict([(name, i) for i, name in
+                        reversed(list(enumerate(self.row_names)))])
+        col_map = dict([(name, i) for i, name in
+                        reversed(list(enumerate(self.col_names)))])
         row_idxs, col_idxs = [], []
         for name in names:
-            if name.lower() not in self.col_names \
-                    and name.lower() not in self.row_names:
+            lname = name.lower()
+            if lname not in col_map and lname not in row_map:
                 raise Exception('Matrix.indices(): name not found: ' + name)
-            if name.lower() in self.col_names:
-                col_idxs.append(self.col_names.index(name))
-            if name.lower() in self.row_names:
-                row_idxs.append(self.row_names.index(name))
+            if lname in col_map:
+                col_idxs.append(col_map[lname])
+            if lname in row_map:
+                row_idxs.append(row_map[lname])
         if axis is None:
             return np.array(row_idxs, dtype=np.int32),\
                 np.array(col_idxs, dtype=np.int32)
@@ -902,11 +932,69 @@ class Matrix(object):
         f.close()
 
 
-    def from_binary(self, filename):
+    def __read_binary_header(self, f):
+        """private: read the header of a pest-compatible binary file
+        Parameters:
+        ----------
+            f : open binary file handle
+        Returns:
+        -------
+            tuple(nrow, ncol, icount) or None if the file was written
+            with the 'sequential' fortran specification
+        """
+        itemp1, itemp2, icount = np.fromfile(f, self.binary_header_dt, 1)[0]
+        if itemp1 > 0 and itemp2 < 0 and icount < 0:
+            return None
+        if itemp1 >= 0:
+           raise TypeError('Matrix.from_binary(): Jco produced by ' +
+                           'deprecated version of PEST,' +
+                           'Use JcoTRANS to convert to new format')
+        return abs(itemp2), abs(itemp1), icount
+
+    def __read_binary_names(self, f, nrow, ncol, icount):
+        """private: read the column and row names that trail the data
+            records of a pest-compatible binary file
+        """
+        f.seek(self.binary_header_dt.itemsize +
+               int(icount) * self.binary_rec_dt.itemsize)
+        col_names = [name.strip().lower().decode() for name in
+                     np.fromfile(f, "S" + str(self.par_length), ncol)]
+        row_names = [name.strip().lower().decode() for name in
+                     np.fromfile(f, "S" + str(self.obs_length), nrow)]
+        assert len(row_names) == nrow,\
+          "Matrix.from_binary() len(row_names) (" + str(len(row_names)) +\
+          ") != nrow (" + str(nrow) + ")"
+        assert len(col_names) == ncol,\
+          "Matrix.from_binary() len(col_names) (" + str(len(col_names)) +\
+          ") != ncol (" + str(ncol) + ")"
+        return row_names, col_names
+
+    def read_binary_names(self, filename):
+        """read the row and column names from a pest-compatible binary
+            file without loading the entries
+        Parameters:
+        ----------
+            filename : [str] binary file name
+        Returns:
+        -------
+            tuple(list of row names, list of col names)
+        """
+        with open(filename, 'rb') as f:
+            header = self.__read_binary_header(f)
+            if header is None:
+                raise Exception("Matrix.read_binary_names(): can't read " +
+                                "names from a 'sequential' binary file: " +
+                                filename)
+            return self.__read_binary_names(f, *header)
+
+    def from_binary(self, filename, row_names=None, chunk=10000000):
         """load from pest-compatible binary file
         Parameters:
         ----------
             filename : [str] filename to save binary file
+            row_names : [enumerable of str] optional subset of rows to load.
+                only the entries of these rows are kept in memory
+            chunk : [int] number of data records to read at a time
         Returns:
         -------
             None
@@ -914,49 +1002,62 @@ class Matrix(object):
 
         f = open(filename, 'rb')
         # the header datatype
-        itemp1, itemp2, icount = np.fromfile(f, self.binary_header_dt, 1)[0]
-        if itemp1 > 0 and itemp2 < 0 and icount < 0:
+        header = self.__read_binary_header(f)
+        if header is None:
             print(" WARNING: it appears this file was \n" +\
                   " written with 'sequential` " +\
                   " binary fortran specification\n...calling " +\
                   " Matrix.from_fortranfile()")
             f.close()
             self.from_fortranfile(filename)
+            if row_names is not None:
+                self.__x = self.get(row_names=row_names).x
+                self.row_names = [name.lower() for name in row_names]
             return
-        if itemp1 >= 0:
-           raise TypeError('Matrix.from_binary(): Jco produced by ' +
-                           'deprecated version of PEST,' +
-                           'Use JcoTRANS to convert to new format')
-        #icount = np.fromfile(f,np.int32,1)
-        #print(itemp1,itemp2,icount)
-        ncol, nrow = abs(itemp1), abs(itemp2)
-        self.__x = np.zeros((nrow, ncol))
-        # read all data records
-        # using this a memory hog, but really fast
-        data = np.fromfile(f, self.binary_rec_dt, icount)
-        icols = ((data['j'] - 1) // nrow) + 1
-        irows = data['j'] - ((icols - 1) * nrow)
-        self.__x[irows - 1, icols - 1] = data["dtemp"]
-        # read obs and parameter names
-        self.col_names = []
-        self.row_names = []
-        for j in range(self.shape[1]):
-            name = struct.unpack(str(self.par_length) + "s",
-                                 f.read(self.par_length))[0]\
-                                  .strip().lower().decode()
-            self.col_names.append(name)
-        for i in range(self.shape[0]):
-            name = struct.unpack(str(self.obs_length) + "s",
-                                 f.read(self.obs_length))[0]\
-                                  .strip().lower().decode()
-            self.row_names.append(name)
+        nrow, ncol, icount = header
+        # read obs and parameter names first - they trail the data records
+        file_row_names, self.col_names = \
+            self.__read_binary_names(f, nrow, ncol, icount)
+        if row_names is None:
+            self.row_names = file_row_names
+            row_map = None
+        else:
+            self.row_names = [name.lower() for name in row_names]
+            file_idx = dict([(name, i) for i, name in
+                             enumerate(file_row_names)])
+            missing = [name for name in self.row_names
+                       if name not in file_idx]
+            if len(missing) > 0:
+                f.close()
+                raise Exception("Matrix.from_binary(): row names not " +
+                                "found in " + filename + ": " +
+                                ','.join(missing))
+            # map from file row index to the index of the loaded row
+            row_map = np.zeros(nrow, dtype=np.int64) - 1
+            row_map[[file_idx[name] for name in self.row_names]] = \
+                np.arange(len(self.row_names))
+        self.__x = np.zeros((len(self.row_names), ncol))
+        # read the data records in chunks to bound the memory use
+        f.seek(self.binary_header_dt.itemsize)
+        nread = 0
+        while nread < icount:
+            data = np.fromfile(f, self.binary_rec_dt,
+                               min(chunk, icount - nread))
+            if data.shape[0] == 0:
+                f.close()
+                raise Exception("Matrix.from_binary(): unexpected end of " +
+                                "file reading data records: " + filename)
+            nread += data.shape[0]
+            j = data['j'].astype(np.int64) - 1
+            icols = j // nrow
+            irows = j - (icols * nrow)
+            dtemp = data["dtemp"]
+            if row_map is not None:
+                irows = row_map[irows]
+                keep = irows >= 0
+                irows, icols, dtemp = irows[keep], icols[keep], dtemp[keep]
+            self.__x[irows, icols] = dtemp
         f.close()
-        assert len(self.row_names) == self.shape[0],\
-          "Matrix.from_binary() len(row_names) (" + str(len(self.row_names)) +\
-          ") != self.shape[0] (" + str(self.shape[0]) + ")"
-        assert len(self.col_names) == self.shape[1],\
-          "Matrix.from_binary() len(col_names) (" + str(len(self.col_names)) +\
-          ") != self.shape[1] (" + str(self.shape[1]) + ")"
 
 
     def from_fortranfile(self,filename):
@@ -1242,6 +1343,8 @@ class Cov(Matrix):
         """
         self.__identity = None
         self.__zero = None
+        self.__factor = None
+        self.__factor_key = None
         if len(names) != 0 and len(row_names) == 0:
             row_names = names
         if len(names) != 0 and len(col_names) == 0:
@@ -1262,6 +1365,90 @@ class Cov(Matrix):
         return self.__identity
 
 
+    @property
+    def factor(self):
+        """get a factor L of self such that L * L^T == self.  Uses Cholesky
+            and falls back to an eigen decomposition for positive
+            semidefinite Covariances.  The factor is computed once and
+            cached.  The cache is keyed on a checksum of x, so it is
+            recomputed if x is replaced or changed in place
+        Returns:
+        -------
+            numpy.ndarray : the factor, or the vector of standard
+                deviations if self is diagonal
+        """
+        return self.get_factor()
+
+    def get_factor(self, names=None):
+        """get a factor L of the Covariance of names such that
+            L * L^T == self.get(names).  Only the names block of self is
+            factored.  The last factor is cached, keyed on names and a
+            checksum of x
+        Parameters:
+        ----------
+            names : [enumerable] names to factor, in the order of the
+                factor.  If None, all of self is factored
+        Returns:
+        -------
+            numpy.ndarray : the factor, or the vector of standard
+                deviations if self is diagonal
+        """
+        if names is not None:
+            names = [name.lower() for name in names]
+            if names == self.row_names:
+                names = None
+        # the checksum is O(n^2), but that is no more than a draw costs
+        key = (None if names is None else tuple(names),
+               zlib.crc32(np.ascontiguousarray(self.x)))
+        if self.__factor is None or self.__factor_key != key:
+            x = self.x
+            if names is not None:
+                idx = self.indices(names, axis=0)
+                if self.isdiagonal:
+                    x = x[idx, :]
+                else:
+                    x = x[idx, :][:, idx]
+            if self.isdiagonal:
+                factor = np.sqrt(x[:, 0])
+            else:
+                try:
+                    factor = la.cholesky(x, lower=True)
+                except la.LinAlgError:
+                    w, v = la.eigh(x)
+                    factor = v * np.sqrt(np.clip(w, 0.0, None))
+            self.__factor = factor
+            self.__factor_key = key
+        return self.__factor
+
+    def draw(self, num_reals=1, mean=None, seed=None, names=None):
+        """draw realizations from a multivariate Gaussian distribution
+            with self as the covariance, using the cached factor
+        Parameters:
+        ----------
+            num_reals : [int] number of realizations
+            mean : [enumerable] mean vector, aligned with self.row_names
+                (or names).  Zero if None
+            seed : None, int, numpy.random.RandomState or
+                numpy.random.Generator to draw with.  If None, the global
+                numpy.random state is used
+            names : [enumerable] only draw these elements - only their
+                block of self is factored.  If None, all of self is drawn
+        Returns:
+        -------
+            numpy.ndarray : realizations, shape (num_reals, self.shape[0])
+                or (num_reals, len(names))
+        """
+        factor = self.get_factor(names)
+        rng = get_random_state(seed)
+        reals = rng.standard_normal((num_reals, factor.shape[0]))
+        if self.isdiagonal:
+            reals *= factor
+        else:
+            reals = np.dot(reals, factor.transpose())
+        if mean is not None:
+            reals += np.asarray(mean, dtype=np.float64)
+        return reals
+
     @property
     def zero(self):
         """ get an instance of self with all zeros
@@ -1344,11 +1531,15 @@ class Cov(Matrix):
         """load Covariance from observation weights
         Parameters:
         ----------
-            pst_file : [str] pest control file name
+            pst_file : [str] pest control file name or an already
+                loaded Pst instance
         Returns:
         -------
             None
         """
+        if isinstance(pst_file,Pst):
+            self.from_observation_data(pst_file)
+            return
         if not pst_file.endswith(".pst"):
             pst_file += ".pst"
         self.from_observation_data(Pst(pst_file))
@@ -1394,11 +1585,15 @@ class Cov(Matrix):
         """load Covariances from a pest control file parameter data section
         Parameters:
         ----------
-            pst_file : [str] pest control file name
+            pst_file : [str] pest control file name or an already
+                loaded Pst instance
         Returns:
         -------
             None
         """
+        if isinstance(pst_file,Pst):
+            self.from_parameter_data(pst_file)
+            return
         if not pst_file.endswith(".pst"):
             pst_file += ".pst"
         new_pst = Pst(pst_file)
@@ -1,9 +1,12 @@
 from __future__ import print_function, division
 import os
 import numpy as np
+import pandas as pd
 from pyemu.la import LinearAnalysis
 from pyemu.en import ObservationEnsemble, ParameterEnsemble
 from pyemu.mat import Cov
+from pyemu.mat.mat_handler import get_random_state
+from pyemu.pst.pst_utils import write_psts
 
 class MonteCarlo(LinearAnalysis):
     """LinearAnalysis derived type for monte carlo analysis
@@ -58,8 +61,24 @@ class MonteCarlo(LinearAnalysis):
                  "{0} singular components".format(nsing))
         return v2_proj
 
+    def get_solution_space(self,nsing=None):
+        """ get the solution-space basis of XTQX
+
+        Parameters:
+        ----------
+            nsing: optional number of singular components to use
+                      if none, call self.get_nsing()
+        Returns:
+        -------
+            Matrix instance : V1 (npar X nsing), so that the null-space
+                projection is I - V1V1^T
+        """
+        if nsing is None:
+            nsing = self.get_nsing()
+        return self.xtqx.v[:,:nsing]
+
     def draw(self, num_reals=1, par_file = None, obs=False,
-             enforce_bounds=False,cov=None):
+             enforce_bounds=False,cov=None,seed=None):
         """draw stochastic realizations of parameters and
            optionally observations
 
@@ -71,7 +90,15 @@ class MonteCarlo(LinearAnalysis):
 
             obs (bool): add a realization of measurement noise to obs
 
-            enforce_bounds (bool): enforce parameter bounds in control file
+            enforce_bounds (bool or str): enforce parameter bounds in
+                control file.  Can also be "scale" - see
+                ParameterEnsemble.enforce()
+
+            cov (Cov): optional parameter covariance to draw from
+
+            seed (int, numpy.random.RandomState or Generator): random
+                number generator for reproducible draws.  If None, the
+                global numpy.random state is used
 
 
         Returns:
@@ -87,21 +114,96 @@ class MonteCarlo(LinearAnalysis):
         else:
             cov = self.parcov
 
+        # one generator for both ensembles so they are not correlated
+        rng = get_random_state(seed)
         self.log("generating {0:d} parameter realizations".format(num_reals))
-        self.parensemble.draw(cov,num_reals=num_reals)
+        self.parensemble.draw(cov,num_reals=num_reals,seed=rng)
         if enforce_bounds:
-            self.parensemble.enforce()
+            self.parensemble.enforce(how=enforce_bounds)
         self.log("generating {0:d} parameter realizations".format(num_reals))
         if obs:
             self.log("generating {0:d} observation realizations".format(num_reals))
-            self.obsensemble.draw(self.obscov,num_reals=num_reals)
+            self.obsensemble.draw(self.obscov,num_reals=num_reals,seed=rng)
             self.log("generating {0:d} observation realizations".format(num_reals))
 
 
 
 
+    def draw_chunks(self, num_reals, chunk_size=1000, par_file=None,
+                    enforce_bounds=False, project=False, nsing=None,
+                    cov=None, seed=None, parfile_prefix=None,
+                    binary_file=None):
+        """generator that draws parameter realizations in fixed-size
+           chunks so that peak memory is bounded by chunk_size rather
+           than num_reals.  self.parensemble is not changed
+
+        Parameters:
+        ----------
+            num_reals (int): total number of realizations to generate
+
+            chunk_size (int): number of realizations in each chunk
+
+            par_file (str): parameter file to use as mean values
+
+            enforce_bounds (bool or str): enforce parameter bounds on each
+                chunk.  Can also be "scale" - see ParameterEnsemble.enforce()
+
+            project (bool): null-space project each chunk with I - V1V1^T
+                from the solution-space basis
+
+            nsing (int): number of singular components for the projection.
+                If None, self.get_nsing() is used
+
+            cov (Cov): optional parameter covariance to draw from
+
+            seed (int, numpy.random.RandomState or Generator): random
+                number generator for reproducible draws.  If None, the
+                global numpy.random state is used
+
+            parfile_prefix (str): if not None, each chunk is written to
+                parameter files named prefix + realization + ".par"
+
+            binary_file (str): if not None, the chunks are written to this
+                binary ensemble file (see ParameterEnsemble.to_binary())
+
+        Yields:
+        ------
+            ParameterEnsemble of (at most) chunk_size realizations, indexed
+            by the realization number in the full ensemble
+        """
+        if par_file is not None:
+            self.pst.parrep(par_file)
+
+        if cov is not None:
+            assert isinstance(cov,Cov)
+        else:
+            cov = self.parcov
+        rng = get_random_state(seed)
+        v1 = None
+        if project:
+            v1 = self.get_solution_space(nsing)
+
+        for start in range(0,num_reals,chunk_size):
+            n = min(chunk_size,num_reals - start)
+            self.log("generating parameter realizations {0:d} to {1:d}".\
+                     format(start,start + n - 1))
+            en = ParameterEnsemble(pst=self.pst)
+            en.draw(cov,num_reals=n,seed=rng)
+            en.index = ["{0:d}".format(i) for i in range(start,start + n)]
+            if v1 is not None:
+                en.project(v1=v1,enforce=enforce_bounds)
+            elif enforce_bounds:
+                en.enforce(how=enforce_bounds)
+            if parfile_prefix is not None:
+                en.to_parfiles(parfile_prefix)
+            if binary_file is not None:
+                en.to_binary(binary_file,append=start > 0)
+            self.log("generating parameter realizations {0:d} to {1:d}".\
+                     format(start,start + n - 1))
+            yield en
+
     def project_parensemble(self,par_file=None,nsing=None,
-                            inplace=True):
+                            inplace=True,thin=False):
         """ perform the null-space projection operations for null-space monte carlo
 
         Parameters:
@@ -112,6 +214,10 @@ class MonteCarlo(LinearAnalysis):
             inplace: bool
                 overwrite the existing parameter ensemble with the
                 projected values
+            thin: bool
+                project with I - V1V1^T from the solution-space basis
+                rather than forming the npar X npar null-space projection
+                matrix
         Returns:
         -------
             if inplace is False, ParameterEnsemble instance, otherwise None
@@ -125,17 +231,26 @@ class MonteCarlo(LinearAnalysis):
 
         # project the ensemble
         self.log("projecting parameter ensemble")
-        en = self.parensemble.project(self.get_null_proj(nsing),inplace=inplace,log=self.log)
+        if thin:
+            en = self.parensemble.project(v1=self.get_solution_space(nsing),
+                                          inplace=inplace,log=self.log)
+        else:
+            en = self.parensemble.project(self.get_null_proj(nsing),
+                                          inplace=inplace,log=self.log)
         self.log("projecting parameter ensemble")
         return en
 
-    def write_psts(self,prefix):
+    def write_psts(self,prefix,num_workers=None):
         """ write parameter and optionally observation realizations
-            to pest control files
+            to pest control files.  The control file is only rendered
+            once - the realized values are spliced into the template
         Parameters:
         ----------
             prefix: str
                 pest control file prefix
+            num_workers: int
+                number of processes to use to write the files.  If None
+                or 1, the files are written in this process
         Returns:
         -------
             None
@@ -144,24 +259,36 @@ class MonteCarlo(LinearAnalysis):
         # get a copy of the pest control file
         pst = self.pst.get(par_names=self.pst.par_names,obs_names=self.pst.obs_names)
 
-        # set the indices
-        pst.parameter_data.index = pst.parameter_data.parnme
-        pst.observation_data.index = pst.observation_data.obsnme
-
         if self.parensemble.islog:
             par_en = self.parensemble._back_transform(inplace=False)
         else:
             par_en = self.parensemble
 
-        for i in range(self.num_reals):
-            pst_name = prefix + "{0:d}.pst".format(i)
-            self.log("writing realized pest control file " + pst_name)
-            pst.parameter_data.loc[par_en.columns,"parval1"] = par_en.iloc[i, :].T
-            if self.obsensemble.shape[0] == self.num_reals:
-                pst.observation_data.loc[self.obsensemble.columns,"obsval"] = \
-                    self.obsensemble.iloc[i, :].T
-            pst.write(pst_name)
-            self.log("writing realized pest control file " + pst_name)
+        pdata = pst.parameter_data
+        par_vals = np.tile(pdata.parval1.values.astype(np.float64),
+                           (self.num_reals, 1))
+        idx = pd.Index(pdata.parnme).get_indexer(par_en.columns)
+        if (idx < 0).any():
+            raise Exception("MonteCarlo.write_psts() error: parameters " +
+                            "not found in pst: " +
+                            ','.join(par_en.columns[idx < 0]))
+        par_vals[:, idx] = par_en.values.astype(np.float64)
+
+        odata = pst.observation_data
+        obs_vals = np.tile(odata.obsval.values.astype(np.float64),
+                           (self.num_reals, 1))
+        if self.obsensemble.shape[0] == self.num_reals:
+            idx = pd.Index(odata.obsnme).get_indexer(self.obsensemble.columns)
+            if (idx < 0).any():
+                raise Exception("MonteCarlo.write_psts() error: " +
+                                "observations not found in pst: " +
+                                ','.join(self.obsensemble.columns[idx < 0]))
+            obs_vals[:, idx] = self.obsensemble.values.astype(np.float64)
+
+        pst_names = [prefix + "{0:d}.pst".format(i)
+                     for i in range(self.num_reals)]
+        write_psts(pst, par_vals, pst_names, obs_values=obs_vals,
+                   num_workers=num_workers)
         self.log("writing realized pest control files")
 
 
@@ -33,37 +33,49 @@ ICOV ICOR IEIG [IRES] [JCOSAVE] [VERBOSEREC] [JCOSAVEITN] [REISAVEITN] [PARSAVEI
     .lower().split('\n')
 
 class ControlData(object):
-    def __init__(self):
-
-        super(ControlData,self).__setattr__("formatters",{np.int32:IFMT,np.float64:FFMT,str:SFMT})
-        super(ControlData,self).__setattr__("_df",self.get_dataframe())
-
-        # acceptable values for most optional string inputs
-        super(ControlData,self).__setattr__("accept_values",{'doaui':['aui','noaui'],
-                                                              'dosenreuse':['senreuse','nosenreuse'],
-                                                              'boundscale':['boundscale','noboundscale'],
-                                                              'jcosave':['jcosave','nojcosave'],
-                                                              'verboserec':['verboserec','noverboserec'],
-                                                              'jcosaveitn':['jcosaveitn','nojcosvaeitn'],
-                                                              'reisaveitn':['reisaveitn','noreisaveitn'],
-                                                              'parsaveitn':['parsaveitn','noparsaveitn'],
-                                                              'parsaverun':['parsaverun','noparsaverun']})
+    """the control data section of a pest control file.  Each control
+        variable is an attribute (e.g. ControlData.npar).  The values
+        are kept in the instance dict, so getting a value is a plain
+        attribute lookup, while setting one is checked and cast to the
+        variable type.  The dataframe view of the section is available
+        as ControlData._df
+    """
+    formatters = {np.int32:IFMT,np.float64:FFMT,str:SFMT}
+
+    # acceptable values for most optional string inputs
+    accept_values = {'doaui':['aui','noaui'],
+                     'dosenreuse':['senreuse','nosenreuse'],
+                     'boundscale':['boundscale','noboundscale'],
+                     'jcosave':['jcosave','nojcosave'],
+                     'verboserec':['verboserec','noverboserec'],
+                     'jcosaveitn':['jcosaveitn','nojcosvaeitn'],
+                     'reisaveitn':['reisaveitn','noreisaveitn'],
+                     'parsaveitn':['parsaveitn','noparsaveitn'],
+                     'parsaverun':['parsaverun','noparsaverun']}
 
-        self._df.index = self._df.name.apply(lambda x:x.replace('[',''))\
-            .apply(lambda x: x.replace(']',''))
+    def __init__(self):
+        self.__dict__.update(ControlData._defaults)
 
     def __setattr__(self, key, value):
-        if key == "_df":
-            super(ControlData,self).__setattr__("_df",value)
-            return
-        assert key in self._df.index, str(key)+" not found in attributes"
-        self._df.loc[key,"value"] = self._df.loc[key,"type"](value)
+        assert key in self._types, str(key)+" not found in attributes"
+        self.__dict__[key] = self._types[key](value)
 
     def __getattr__(self, item):
-        if item == "_df":
-            return self._df.copy()
-        assert item in self._df.index, str(item)+" not found in attributes"
-        return self._df.loc[item,"value"]
+        # only called if normal lookup fails - don't let copy/pickle
+        # probes for special methods get to the assert
+        if item.startswith("__"):
+            raise AttributeError(item)
+        assert False, str(item)+" not found in attributes"
+
+    @property
+    def _df(self):
+        """get a dataframe view of the control data section.  Changes to
+            the dataframe are not reflected in the ControlData
+        """
+        df = ControlData.get_dataframe()
+        df.index = pandas.Index(ControlData._names,name="name")
+        df.loc[:,"value"] = [self.__dict__[name] for name in df.index]
+        return df
 
     @staticmethod
     def get_dataframe():
@@ -131,15 +143,15 @@ class ControlData(object):
                 name = name.replace('[','').replace(']','')
                 
                 #if the parsed values type isn't right
-                if t != self._df.loc[name,"type"]:
+                if t != self._types[name]:
 
                     # if a float was expected and int return, not a problem
-                    if t == np.int32 and self._df.loc[name,"type"] == np.float64:
-                        self._df.loc[name,"value"] = np.float64(v)
+                    if t == np.int32 and self._types[name] == np.float64:
+                        self.__dict__[name] = np.float64(v)
 
 
                     # if this is a required input, throw
-                    elif self._df.loc[name,"required"]:
+                    elif self._required[name]:
                         raise Exception("wrong type found for variable " + name + ":" + str(t))
                     else:
                         
@@ -147,8 +159,8 @@ class ControlData(object):
                         found = False
                         for nname,avalues in self.accept_values.items():
                             if v in avalues:
-                                if t == self._df.loc[nname,"type"]:
-                                    self._df.loc[nname,"value"] = v
+                                if t == self._types[nname]:
+                                    self.__dict__[nname] = v
                                     found = True
                                     break
                         if not found:
@@ -157,18 +169,26 @@ class ControlData(object):
                             print("ignoring...")
 
                 else:
-                    self._df.loc[name,"value"] = v
+                    self.__dict__[name] = v
 
 
     def copy(self):
         cd = ControlData()
-        cd._df = self._df
+        cd.__dict__.update(self.__dict__)
         return cd
 
+    def to_dict(self):
+        """get the control data values
+        Returns:
+        -------
+            dict : variable name - value pairs
+        """
+        return dict([(name,self.__dict__[name]) for name in self._names])
 
     @property
     def formatted_values(self):
-        return self._df.apply(lambda x: self.formatters[x["type"]](x["value"]),axis=1)
+        return pandas.Series([self.formatters[self._types[name]](self.__dict__[name])
+                              for name in self._names],index=self._names)
 
     def write(self,f):
         """ write control data section to a file
@@ -184,8 +204,20 @@ class ControlData(object):
             f = open(f,'w')
             f.write("pcf\n")
             f.write("* control data\n")
+        formatted_values = self.formatted_values
         for line in CONTROL_VARIABLE_LINES:
-            [f.write(self.formatted_values[name.replace('[','').replace(']','')]) for name in line.split()]
-            f.write('\n')
+            f.write(''.join([formatted_values[name.replace('[','').replace(']','')]
+                             for name in line.split()]) + '\n')
+
 
+def _init_control_metadata():
+    """private: set the variable names, types and defaults on ControlData
+    """
+    df = ControlData.get_dataframe()
+    names = [name.replace('[','').replace(']','') for name in df.name]
+    ControlData._names = names
+    ControlData._types = dict(zip(names,df.type))
+    ControlData._required = dict(zip(names,df.required))
+    ControlData._defaults = dict(zip(names,df.value))
 
+_init_control_metadata()
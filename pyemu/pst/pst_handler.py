@@ -1,6 +1,9 @@
 from __future__ import print_function, division
 import os
+import io
 import copy
+import zlib
+import ctypes
 import numpy as np
 import pandas as pd
 pd.options.display.max_colwidth = 100
@@ -13,13 +16,45 @@ class Pst(object):
     """basic class for handling pest control files to support linear analysis
     as well as replicate some of the functionality of the pest utilities
     """
-    def __init__(self, filename, load=True, resfile=None):
+    # default for the use_cache argument of the constructor
+    use_cache = False
+    # attributes stored in the binary snapshot of a parsed control file
+    snapshot_attrs = ["parameter_groups","parameter_data","observation_data",
+                      "prior_information","tied","model_command",
+                      "template_files","input_files","instruction_files",
+                      "output_files","other_lines",
+                      "regul_lines","pestpp_options"]
+    snapshot_version = 1
+
+    # the sections that can be parsed on first access, with the label
+    # used in error messages
+    lazy_sections = {"parameter_groups":"parameter groups",
+                     "parameter_data":"parameter data",
+                     "observation_data":"observation data",
+                     "prior_information":"prior information"}
+
+    def __init__(self, filename, load=True, resfile=None, use_cache=None,
+                 lazy=False):
         """constructor of pst object
         Parameters:
         ----------
             filename : [str] pest control file name
             load : [bool] flag for loading
             resfile : [str] residual filename
+            use_cache : [bool] load from (and save) a binary snapshot of
+                the parsed control file in filename + ".cache".  The
+                snapshot is only used if the control file has not changed.
+                The residual file is cached the same way.  The snapshots
+                are pickles, so a snapshot planted next to the control
+                file runs its code when loaded - see
+                pst_utils.read_file_cache() before using this in a shared
+                directory.  If None, Pst.use_cache is used
+            lazy : [bool] only record the file offsets of the parameter
+                groups, parameter data, observation data and prior
+                information sections on load - each is read from the file
+                and parsed the first time it is accessed.  A current
+                snapshot is still used, but a lazy load doesn't write one
+                since that would parse every section
         Returns:
         -------
             None
@@ -27,7 +62,19 @@ class Pst(object):
 
         self.filename = filename
         self.resfile = resfile
+        if use_cache is None:
+            use_cache = Pst.use_cache
+        self.use_cache = use_cache
         self.__res = None
+        self.__source = None
+        self.__pending = {}
+        self.__views = {}
+        self.__parameter_groups = None
+        self.__parameter_data = None
+        self.__tied = None
+        self.__observation_data = None
+        self.__prior_information = None
+        self.__memos = {}
 
         for key,value in pst_utils.pst_config.items():
             self.__setattr__(key,copy.copy(value))
@@ -37,17 +84,60 @@ class Pst(object):
         if load:
             assert os.path.exists(filename),\
                 "pst file not found:{0}".format(filename)
-            self.load(filename)
+            if not use_cache or not self.load_snapshot(filename):
+                self.load(filename,lazy=lazy)
+                if use_cache and not lazy:
+                    self.write_snapshot(filename)
+
+    def write_snapshot(self,filename,snapshot_file=None):
+        """write a binary snapshot of the parsed control file so that
+            later instances can skip parsing
+        Parameters:
+        ----------
+            filename : str
+                the control file the snapshot was parsed from
+            snapshot_file : str
+                the snapshot file.  If None, filename + ".cache"
+        Returns:
+        -------
+            bool : True if the snapshot was written
+        """
+        snapshot = {"version":Pst.snapshot_version,
+                    "control_data":self.control_data.to_dict()}
+        for attr in Pst.snapshot_attrs:
+            snapshot[attr] = getattr(self,attr)
+        return pst_utils.write_file_cache(filename,snapshot,snapshot_file)
+
+    def load_snapshot(self,filename,snapshot_file=None):
+        """load a binary snapshot of a parsed control file, if it is
+            current (see pst_utils.read_file_cache()).  The snapshot is
+            unpickled, so it must come from a trusted source
+        Parameters:
+        ----------
+            filename : str
+                the control file
+            snapshot_file : str
+                the snapshot file.  If None, filename + ".cache"
+        Returns:
+        -------
+            bool : True if the snapshot was loaded
+        """
+        snapshot = pst_utils.read_file_cache(filename,snapshot_file)
+        if snapshot is None or \
+           snapshot.get("version",None) != Pst.snapshot_version:
+            return False
+        for attr in Pst.snapshot_attrs:
+            setattr(self,attr,snapshot[attr])
+        for name,value in snapshot["control_data"].items():
+            self.control_data.__setattr__(name,value)
+        return True
 
 
     @property
     def phi(self):
         """get the weighted total objective function
         """
-        sum = 0.0
-        for grp, contrib in self.phi_components.items():
-            sum += contrib
-        return sum
+        return sum(self.phi_components.values(),0.0)
 
     @property
     def phi_components(self):
@@ -60,25 +150,45 @@ class Pst(object):
             Dict{observation group : contribution}
         """
 
-        # calculate phi components for each obs group
-        components = {}
-        ogroups = self.observation_data.groupby("obgnme").groups
-        rgroups = self.res.groupby("group").groups
-        for og in ogroups.keys():
-            assert og in rgroups.keys(),"Pst.adjust_weights_res() obs group " +\
-                "not found: " + str(og)
-            og_res_df = self.res.ix[rgroups[og]]
-            og_res_df.index = og_res_df.name
-            og_df = self.observation_data.ix[ogroups[og]]
-            og_df.index = og_df.obsnme
-            og_res_df = og_res_df.loc[og_df.index,:]
-            assert og_df.shape[0] == og_res_df.shape[0],\
-            " Pst.phi_components error: group residual dataframe row length" +\
-            "doesn't match observation data group dataframe row length" + \
-                str(og_df.shape) + " vs. " + str(og_res_df.shape)
-            components[og] = np.sum((og_res_df["residual"] *
-                                     og_df["weight"]) ** 2)
-        return components
+        obs,res = self.observation_data,self.res
+        # the components are memoized until the weights or residuals change
+        components = self.__memoize("phi_components",
+                                    [obs.obsnme,obs.obgnme,obs.weight,
+                                     res.name,res.group,res.residual],
+                                    self._get_phi_components)
+        return dict(components)
+
+    @staticmethod
+    def _get_phi_components(obsnme,obgnme,weight,res_name,res_group,
+                            residual):
+        """private: calculate the phi components for each obs group in one
+            pass by joining the residuals to the observations on name
+        Parameters:
+        ----------
+            obsnme,obgnme,weight : numpy.ndarray
+                observation data columns
+            res_name,res_group,residual : numpy.ndarray
+                residual columns
+        Returns:
+        -------
+            Dict{observation group : contribution}
+        """
+        missing = set(obgnme) - set(res_group)
+        assert len(missing) == 0,"Pst.adjust_weights_res() obs group " +\
+            "not found: " + str(sorted(missing,key=str)[0])
+        res_index = pd.Index(res_name)
+        assert res_index.is_unique," Pst.phi_components error: " +\
+            "duplicate names in residuals"
+        # residuals are only used if they are in the same group
+        idx = res_index.get_indexer(obsnme)
+        found = idx >= 0
+        found[found] = res_group[idx[found]] == obgnme[found]
+        contrib = np.zeros(obsnme.shape[0])
+        contrib[found] = (residual[idx[found]].astype(np.float64) *
+                          weight[found].astype(np.float64)) ** 2
+        contrib[np.isnan(contrib)] = 0.0
+        components = pd.Series(contrib).groupby(obgnme).sum()
+        return components.to_dict()
 
     @property
     def phi_components_normalized(self):
@@ -94,16 +204,185 @@ class Pst(object):
 
         """
         # use a dictionary comprehension to go through and normalize each component of phi to the total
-        phi_components_normalized = {i: self.phi_components[i]/self.phi for i in self.phi_components}
+        phi_components = self.phi_components
+        phi = sum(phi_components.values(),0.0)
+        phi_components_normalized = {i: phi_components[i]/phi for i in phi_components}
         return phi_components_normalized
 
     def set_res(self,res):
+        self.__views.pop("res",None)
         self.__res = res
 
+    def __load_pending(self,name):
+        """private: parse a section that was indexed by a lazy load or
+            copy a subset that was indexed by a lazy get()
+        """
+        if name in self.__views:
+            columns,key = self.__views.pop(name)
+            setattr(self,"_Pst__" + name,self._frame_from_columns(columns,key))
+            return
+        if name not in self.__pending:
+            return
+        start,end,nrows = self.__pending.pop(name)
+        self.__parse_section(name,self.__read_lines(start,end),0,nrows)
+
+    def __read_lines(self,start,end):
+        """private: read the lines between two byte offsets of the control
+            file that was lazily loaded
+        """
+        filename,size,mtime = self.__source
+        if not os.path.exists(filename) or \
+                os.path.getsize(filename) != size or \
+                os.path.getmtime(filename) != mtime:
+            raise Exception("Pst error: {0} has changed since it was lazily "
+                            "loaded".format(filename))
+        with open(filename,'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        # decoded as open(filename,'r') would
+        return io.TextIOWrapper(io.BytesIO(data)).readlines()
+
+    @staticmethod
+    def _line_offsets(data):
+        """private: the byte offsets of the starts of the lines of a file
+        Parameters:
+        ----------
+            data : bytes
+                the contents of the file
+        Returns:
+        -------
+            numpy.ndarray : the offset of each line and, last, the file
+                size.  None if the file has old mac (carriage return only)
+                line endings
+        """
+        if b'\r' in data and b'\r' in data.replace(b'\r\n',b''):
+            return None
+        ends = np.flatnonzero(np.frombuffer(data,dtype=np.uint8) ==
+                              ord('\n')) + 1
+        if len(data) > 0 and not data.endswith(b'\n'):
+            ends = np.append(ends,len(data))
+        return np.concatenate([[0],ends])
+
+    def __memoize(self,name,columns,func):
+        """private: memoize a quantity derived from dataframe columns.  The
+            memo is reused as long as the fingerprints of the columns
+            (see Pst._fingerprint()) are unchanged, so it follows in-place
+            changes to the dataframes as well as replaced dataframes
+        Parameters:
+        ----------
+            name : str
+                name of the quantity
+            columns : list of pandas.Series
+                the columns the quantity is derived from
+            func : callable
+                derives the quantity from the column values
+        Returns:
+        -------
+            the derived quantity
+        """
+        values = [column.values for column in columns]
+        keys = [self._fingerprint(v) for v in values]
+        memo = self.__memos.get(name,None)
+        if memo is not None and memo[0] == keys:
+            return memo[2]
+        result = func(*values)
+        # object columns are fingerprinted by the addresses of their
+        # entries, so hold on to the entries - otherwise a freed entry's
+        # address could be reused by a new value
+        pinned = [v.copy() for v in values if v.dtype == object]
+        self.__memos[name] = (keys,pinned,result)
+        return result
+
+    @staticmethod
+    def _fingerprint(values):
+        """private: a cheap check value of the contents of a column array -
+            a crc32 of the data or, for object arrays, of the addresses of
+            the entries
+        Parameters:
+        ----------
+            values : numpy.ndarray
+        Returns:
+        -------
+            tuple(dtype, shape, int)
+        """
+        values = np.ascontiguousarray(values)
+        data = values
+        if values.dtype == object:
+            data = (ctypes.c_char * values.nbytes).\
+                from_address(values.ctypes.data)
+        return values.dtype,values.shape,zlib.crc32(data)
+
+    @property
+    def parameter_groups(self):
+        """get the parameter groups dataframe
+        """
+        self.__load_pending("parameter_groups")
+        return self.__parameter_groups
+
+    @parameter_groups.setter
+    def parameter_groups(self,value):
+        self.__pending.pop("parameter_groups",None)
+        self.__views.pop("parameter_groups",None)
+        self.__parameter_groups = value
+
+    @property
+    def parameter_data(self):
+        """get the parameter data dataframe
+        """
+        self.__load_pending("parameter_data")
+        return self.__parameter_data
+
+    @parameter_data.setter
+    def parameter_data(self,value):
+        self.__views.pop("parameter_data",None)
+        # the tied parameters are parsed with the parameter data
+        self.__load_pending("parameter_data")
+        self.__parameter_data = value
+
+    @property
+    def tied(self):
+        """get the tied parameter dataframe
+        """
+        if "parameter_data" in self.__pending:
+            self.__load_pending("parameter_data")
+        return self.__tied
+
+    @tied.setter
+    def tied(self,value):
+        if "parameter_data" in self.__pending:
+            self.__load_pending("parameter_data")
+        self.__tied = value
+
+    @property
+    def observation_data(self):
+        """get the observation data dataframe
+        """
+        self.__load_pending("observation_data")
+        return self.__observation_data
+
+    @observation_data.setter
+    def observation_data(self,value):
+        self.__pending.pop("observation_data",None)
+        self.__views.pop("observation_data",None)
+        self.__observation_data = value
+
+    @property
+    def prior_information(self):
+        """get the prior information dataframe
+        """
+        self.__load_pending("prior_information")
+        return self.__prior_information
+
+    @prior_information.setter
+    def prior_information(self,value):
+        self.__pending.pop("prior_information",None)
+        self.__prior_information = value
+
     @property
     def res(self):
         """get the residuals dataframe
         """
+        self.__load_pending("res")
         if self.__res is not None:
             return self.__res
         else:
@@ -119,10 +398,10 @@ class Pst(object):
                                         "could not residual file case.res" +
                                         " or case.rei")
 
-            res = pst_utils.read_resfile(self.resfile)
-            missing_bool = self.observation_data.obsnme.apply\
-                (lambda x: x not in res.name)
-            missing = self.observation_data.obsnme[missing_bool]
+            res = pst_utils.read_resfile(self.resfile,
+                                         use_cache=self.use_cache)
+            obsnme = self.observation_data.obsnme
+            missing = obsnme[~obsnme.isin(res.name)]
             if missing.shape[0] > 0:
                 raise Exception("Pst.res: the following observations " +
                                 "were not found in " +
@@ -152,11 +431,10 @@ class Pst(object):
 
     @property
     def nnz_obs(self):
-        nnz = 0
-        for w in self.observation_data.weight:
-            if w > 0.0:
-                nnz += 1
-        return nnz
+        """number of non-zero weighted observations
+        """
+        # not memoized - counting is cheaper than fingerprinting the weights
+        return int(np.sum(self.observation_data.weight.values > 0.0))
 
 
     @property
@@ -171,12 +449,9 @@ class Pst(object):
     def npar_adj(self):
         """number of adjustable parameters
         """
-        pass
-        np = 0
-        for t in self.parameter_data.partrans:
-            if t not in ["fixed", "tied"]:
-                np += 1
-        return np
+        return self.__memoize("npar_adj",[self.parameter_data.partrans],
+                              lambda t: int(np.sum((t != "fixed") &
+                                                   (t != "tied"))))
 
 
     @property
@@ -224,12 +499,15 @@ class Pst(object):
 
     @property
     def adj_par_names(self):
-        adj_names = []
-        for t,n in zip(self.parameter_data.partrans,
-                       self.parameter_data.parnme):
-            if t.lower() not in ["tied","fixed"]:
-                adj_names.append(n)
-        return adj_names
+        """adjustable parameter names
+        """
+        def get_names(partrans,parnme):
+            partrans = np.array([t.lower() for t in partrans],dtype=object)
+            return parnme[(partrans != "tied") &
+                          (partrans != "fixed")].tolist()
+        return list(self.__memoize("adj_par_names",
+                                   [self.parameter_data.partrans,
+                                    self.parameter_data.parnme],get_names))
 
     @property
     def obs_names(self):
@@ -242,12 +520,10 @@ class Pst(object):
     def nnz_obs_names(self):
         """non-zero weight obs names
         """
-        nz_names = []
-        for w,n in zip(self.observation_data.weight,
-                       self.observation_data.obsnme):
-            if w > 0.0:
-                nz_names.append(n)
-        return nz_names
+        return list(self.__memoize("nnz_obs_names",
+                                   [self.observation_data.weight,
+                                    self.observation_data.obsnme],
+                                   lambda w,n: n[w > 0.0].tolist()))
 
     @property
     def regul_section(self):
@@ -265,48 +541,241 @@ class Pst(object):
         return False
 
     @staticmethod
-    def _read_df(f,nrows,names,converters,defaults=None):
-        seek_point = f.tell()
-        df = pd.read_csv(f, header=None,names=names,
-                              nrows=nrows,delim_whitespace=True,
-                              converters=converters, index_col=False)
-
-        # in case there was some extra junk at the end of the lines
-        if df.shape[1] > len(names):
-            df = df.iloc[:,len(names)]
-            df.columns = names
-
-        if defaults is not None:
-            for name in names:
-                df.loc[:,name] = df.loc[:,name].fillna(defaults[name])
-        elif np.any(pd.isnull(df)):
-            raise Exception("NANs found")
-        f.seek(seek_point)
-        [f.readline() for _ in range(nrows)]
-        return df
-
-    def load(self, filename):
+    def _read_section(lines,start,nrows,names,dtype,converters,
+                      defaults=None,formats=None):
+        """private: tokenize a section of a control file into a dataframe
+            with typed columns in a single pass.  Blank lines are skipped.
+        Parameters:
+        ----------
+            lines : list of str
+                the lines of the control file
+            start : int
+                index of the first line of the section
+            nrows : int
+                number of entries in the section
+            names : list of str
+                column names
+            dtype : numpy.dtype
+                record dtype giving the type of each column
+            converters : dict
+                string columns that need converting (lowered)
+            defaults : dict
+                default values for missing trailing entries.  If None,
+                missing entries raise an exception
+            formats : dict
+                the write formatters of the section.  Numeric columns
+                without a formatter are written as read, so whole numbers
+                in these columns are kept as integers, as
+                pandas.read_csv() would type them
+        Returns:
+        -------
+            tuple(pandas.DataFrame, int) : the section and the index of
+                the line following the section
+        """
+        ncol = len(names)
+        end = start + nrows
+        if end > len(lines):
+            raise Exception("EOF while reading section")
+        str_names = [name for name in names if dtype[name].kind in "SU"]
+        # if all the string columns are lowered, lower the whole block once
+        lower_all = all([converters.get(name,None) is pst_utils.str_con
+                         for name in str_names])
+        text = ''.join(lines[start:end])
+        if lower_all:
+            text = text.lower()
+        cols = None
+        if pst_utils.BLANK_LINE.search('\n' + text) is None:
+            if not text.endswith('\n'):
+                text += '\n'
+            # mark the line ends so that every line can be checked for all
+            # its entries - otherwise the entries after a short line and
+            # before a long line would be shifted into the wrong columns
+            tokens = text.replace('\n',' \x00 ').split()
+            if len(tokens) == nrows * (ncol + 1) and \
+                    tokens[ncol::ncol + 1].count('\x00') == nrows:
+                cols = [tokens[j::ncol + 1] for j in range(ncol)]
+        if cols is None:
+            # blank lines or missing/extra entries - go line by line
+            rows = [line.split() for line in lines[start:end]]
+            if not all(rows):
+                rows = [row for row in rows if row]
+                while len(rows) < nrows:
+                    if end >= len(lines):
+                        raise Exception("EOF while reading section")
+                    row = lines[end].split()
+                    end += 1
+                    if row:
+                        rows.append(row)
+            if any(len(row) != ncol for row in rows):
+                if defaults is None and any(len(row) < ncol for row in rows):
+                    raise Exception("NANs found")
+                rows = [row[:ncol] + [None] * (ncol - len(row))
+                        for row in rows]
+            if lower_all:
+                rows = [[v if v is None else v.lower() for v in row]
+                        for row in rows]
+            if len(rows) > 0:
+                cols = [list(col) for col in zip(*rows)]
+            else:
+                cols = [[] for _ in range(ncol)]
+
+        data = {}
+        for name,col in zip(names,cols):
+            if defaults is not None and None in col:
+                default = defaults[name]
+                col = [default if v is None else v for v in col]
+            if name in str_names:
+                conv = converters.get(name,None)
+                if lower_all:
+                    pass
+                elif conv is pst_utils.str_con:
+                    col = [str(v).lower() for v in col]
+                elif conv is not None:
+                    col = [conv(v) for v in col]
+                data[name] = np.array(col,dtype=object)
+            else:
+                data[name] = pst_utils.str_to_numbers(col,dtype[name].kind,
+                                                      name)
+                if formats is not None and name not in formats and \
+                        all(isinstance(v,str) and v.lstrip("+-").isdigit()
+                            for v in col):
+                    data[name] = data[name].astype(np.int64)
+        return pd.DataFrame(data,columns=names),end
+
+    def __parse_section(self,name,lines,i,nrows):
+        """private: parse one of the lazy_sections starting at line i
+        Parameters:
+        ----------
+            name : str
+                section name (a key of Pst.lazy_sections)
+            lines : list
+                lines of the control file
+            i : int
+                index of the first line of the section
+            nrows : int
+                number of entries in the section
+        Returns:
+        -------
+            int : index of the line after the section
+        """
+        label = Pst.lazy_sections[name]
+        try:
+            if name == "parameter_groups":
+                self.__parameter_groups,i = self._read_section(lines,i,nrows,
+                                                  self.pargp_fieldnames,
+                                                  self.pargp_dtype,
+                                                  self.pargp_converters,
+                                                  self.pargp_defaults,
+                                                  self.pargp_format)
+            elif name == "parameter_data":
+                self.__parameter_data,i = self._read_section(lines,i,nrows,
+                                                  self.par_fieldnames,
+                                                  self.par_dtype,
+                                                  self.par_converters,
+                                                  self.par_defaults)
+                # oh the tied parameter bullshit, how do I hate thee
+                ntied = int(np.sum(self.__parameter_data.partrans.values
+                                   == "tied"))
+                if ntied > 0:
+                    label = "tied parameters"
+                    self.__tied,i = self._read_section(lines,i,ntied,
+                                                       self.tied_fieldnames,
+                                                       self.tied_dtype,
+                                                       self.tied_converters)
+            elif name == "observation_data":
+                self.__observation_data,i = self._read_section(lines,i,nrows,
+                                                  self.obs_fieldnames,
+                                                  self.obs_dtype,
+                                                  self.obs_converters)
+            elif name == "prior_information":
+                if i + nrows > len(lines):
+                    raise Exception("EOF during prior information " +
+                                    "section")
+                raws = [line.strip().split() for line in lines[i:i + nrows]]
+                i += nrows
+                self.__prior_information = pd.DataFrame(
+                    {"pilbl": [raw[0].lower() for raw in raws],
+                     "equation": [' '.join(raw[1:-2]) for raw in raws],
+                     "weight": np.array([raw[-2] for raw in raws],
+                                        dtype=np.float64),
+                     "obgnme": [raw[-1].lower() for raw in raws]})
+        except Exception as e:
+            raise Exception("Pst.load() error reading {0}: {1}".\
+                            format(label,str(e)))
+        return i
+
+    def __load_section(self,name,lines,i,nrows,offsets):
+        """private: parse a section now or, if the byte offsets of the lines
+            are passed (lazy load), record where the section starts and
+            ends in the file and skip to the next section header
+        """
+        if offsets is None:
+            return self.__parse_section(name,lines,i,nrows)
+        start = i
+        nlines = len(lines)
+        if name == "prior_information":
+            # pest++ options can follow the prior information
+            i = min(i + nrows,nlines)
+        # the section usually ends after nrows lines, unless there are
+        # blank lines or tied parameters to skip
+        elif i + nrows < nlines and \
+                lines[i + nrows].lstrip().startswith('*'):
+            i += nrows
+        else:
+            while i < nlines and not lines[i].lstrip().startswith('*'):
+                i += 1
+        self.__pending[name] = (offsets[start],offsets[i],nrows)
+        return i
+
+    def load(self, filename, lazy=False):
         """load the pest control file
         Parameters:
         ----------
             filename : str
                 pst filename
+            lazy : bool
+                if True, only the file offsets of the parameter groups,
+                parameter data, observation data and prior information
+                sections are recorded - each is read from the file and
+                parsed on first access.  Files with carriage return only
+                line endings are always parsed on load
         Returns:
         -------
             None
         """
 
-        f = open(filename, 'r')
-        f.readline()
+        offsets = None
+        if lazy:
+            with open(filename,'rb') as f:
+                data = f.read()
+            offsets = self._line_offsets(data)
+            # decoded as open(filename,'r') would
+            lines = io.TextIOWrapper(io.BytesIO(data)).readlines()
+            del data
+            self.__source = (filename,os.path.getsize(filename),
+                             os.path.getmtime(filename))
+        else:
+            with open(filename, 'r') as f:
+                lines = f.readlines()
+        nlines = len(lines)
+        i = 1
+        self.__pending = {}
+
+        def next_line():
+            if i >= nlines:
+                return ''
+            return lines[i]
 
         #control section
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* control data" in line,\
             "Pst.load() error: looking for control" +\
             " data section, found:" + line
         control_lines = []
         while True:
-            line = f.readline()
+            line = next_line()
+            i += 1
             if line == '':
                 raise Exception("Pst.load() EOF while " +\
                                 "reading control data section")
@@ -322,77 +791,64 @@ class Pst(object):
             if "* parameter groups" in line.lower():
                 break
             self.other_lines.append(line)
-            line = f.readline()
-        try:
-            self.parameter_groups = self._read_df(f,self.control_data.npargp,
-                                                  self.pargp_fieldnames,
-                                                  self.pargp_converters,
-                                                  self.pargp_defaults)
-        except Exception as e:
-            raise Exception("Pst.load() error reading parameter groups: {0}".format(str(e)))
+            line = next_line()
+            i += 1
+        i = self.__load_section("parameter_groups",lines,i,
+                                self.control_data.npargp,offsets)
 
         #parameter data
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* parameter data" in line.lower(),\
             "Pst.load() error: looking for parameter" +\
             " data section, found:" + line
-        try:
-            self.parameter_data = self._read_df(f,self.control_data.npar,
-                                                self.par_fieldnames,
-                                                self.par_converters,
-                                                self.par_defaults)
-        except:
-            raise Exception("Pst.load() error reading parameter data")
-
-        # oh the tied parameter bullshit, how do I hate thee
-        counts = self.parameter_data.partrans.value_counts()
-        if "tied" in counts.index:
-            # tied_lines = [f.readline().lower().strip().split() for _ in range(counts["tied"])]
-            # self.tied = pd.DataFrame(tied_lines,columns=["parnme","partied"])
-            # self.tied.index = self.tied.pop("parnme")
-            self.tied = self._read_df(f,counts["tied"],self.tied_fieldnames,
-                                      self.tied_converters)
+        self.__tied = None
+        i = self.__load_section("parameter_data",lines,i,
+                                self.control_data.npar,offsets)
 
         # obs groups - just read past for now
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* observation groups" in line.lower(),\
             "Pst.load() error: looking for obs" +\
             " group section, found:" + line
-        [f.readline() for _ in range(self.control_data.nobsgp)]
+        i += self.control_data.nobsgp
 
         # observation data
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* observation data" in line.lower(),\
             "Pst.load() error: looking for observation" +\
             " data section, found:" + line
         if self.control_data.nobs > 0:
-            try:
-                self.observation_data = self._read_df(f,self.control_data.nobs,
-                                                      self.obs_fieldnames,
-                                                      self.obs_converters)
-            except:
-                raise Exception("Pst.load() error reading observation data")
+            i = self.__load_section("observation_data",lines,i,
+                                    self.control_data.nobs,offsets)
         else:
             raise Exception("nobs == 0")
         #model command line
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* model command line" in line.lower(),\
             "Pst.load() error: looking for model " +\
             "command section, found:" + line
-        for i in range(self.control_data.numcom):
-            self.model_command.append(f.readline().strip())
+        for _ in range(self.control_data.numcom):
+            self.model_command.append(next_line().strip())
+            i += 1
 
         #model io
-        line = f.readline()
+        line = next_line()
+        i += 1
         assert "* model input/output" in line.lower(), \
             "Pst.load() error; looking for model " +\
             " i/o section, found:" + line
-        for i in range(self.control_data.ntplfle):
-            raw = f.readline().strip().split()
+        for _ in range(self.control_data.ntplfle):
+            raw = next_line().strip().split()
+            i += 1
             self.template_files.append(raw[0])
             self.input_files.append(raw[1])
-        for i in range(self.control_data.ninsfle):
-            raw = f.readline().strip().split()
+        for _ in range(self.control_data.ninsfle):
+            raw = next_line().strip().split()
+            i += 1
             self.instruction_files.append(raw[0])
             self.output_files.append(raw[1])
 
@@ -400,35 +856,24 @@ class Pst(object):
         if self.control_data.nprior == 0:
             self.prior_information = self.null_prior
         else:
-            pilbl, obgnme, weight, equation = [], [], [], []
-            line = f.readline()
+            line = next_line()
+            i += 1
             assert "* prior information" in line.lower(), \
                 "Pst.load() error; looking for prior " +\
                 " info section, found:" + line
-            for iprior in range(self.control_data.nprior):
-                line = f.readline()
-                if line == '':
-                    raise Exception("EOF during prior information " +
-                                    "section")
-                raw = line.strip().split()
-                pilbl.append(raw[0].lower())
-                obgnme.append(raw[-1].lower())
-                weight.append(float(raw[-2]))
-                eq = ' '.join(raw[1:-2])
-                equation.append(eq)
-            self.prior_information = pd.DataFrame({"pilbl": pilbl,
-                                                       "equation": equation,
-                                                       "weight": weight,
-                                                       "obgnme": obgnme})
+            i = self.__load_section("prior_information",lines,i,
+                                    self.control_data.nprior,offsets)
 
         if "regul" in self.control_data.pestmode:
-            line = f.readline()
+            line = next_line()
+            i += 1
             assert "* regul" in line.lower(), \
                 "Pst.load() error; looking for regul " +\
                 " section, found:" + line
-            [self.regul_lines.append(f.readline()) for _ in range(3)]
+            [self.regul_lines.append(line) for line in lines[i:i + 3]]
+            i += 3
 
-        for line in f:
+        for line in lines[i:]:
             if line.startswith("++") and '#' not in line:
                 args = line.replace('++','').strip().split()
                 #args = ['++'+arg.strip() for arg in args]
@@ -439,7 +884,6 @@ class Pst(object):
                     if key in self.pestpp_options:
                         print("Pst.load() warning: duplicate pest++ option found:" + str(key))
                     self.pestpp_options[key] = value
-        f.close()
         return
 
 
@@ -458,12 +902,22 @@ class Pst(object):
 
 
     def _rectify_pgroups(self):
+        self.parameter_groups = self._get_rectified_pgroups()
+
+    def _get_rectified_pgroups(self):
+        """private: get the parameter groups that are used in the
+            parameter data, adding defaults for any missing groups
+        Returns:
+        -------
+            pandas.DataFrame : new parameter groups dataframe
+        """
         # add any parameters groups
         pdata_groups = list(self.parameter_data.loc[:,"pargp"].\
             value_counts().keys())
         #print(pdata_groups)
         need_groups = []
-        existing_groups = list(self.parameter_groups.pargpnme)
+        parameter_groups = self.parameter_groups.copy()
+        existing_groups = list(parameter_groups.pargpnme)
         for pg in pdata_groups:
             if pg not in existing_groups:
                 need_groups.append(pg)
@@ -472,19 +926,127 @@ class Pst(object):
             defaults = copy.copy(pst_utils.pst_config["pargp_defaults"])
             for grp in need_groups:
                 defaults["pargpnme"] = grp
-                self.parameter_groups = \
-                    self.parameter_groups.append(defaults,ignore_index=True)
+                parameter_groups = \
+                    parameter_groups.append(defaults,ignore_index=True)
 
         # now drop any left over groups that aren't needed
-        for gp in self.parameter_groups.loc[:,"pargpnme"]:
+        for gp in parameter_groups.loc[:,"pargpnme"]:
             if gp in pdata_groups and gp not in need_groups:
                 need_groups.append(gp)
-        self.parameter_groups.index = self.parameter_groups.pargpnme
-        self.parameter_groups = self.parameter_groups.loc[need_groups,:]
+        parameter_groups.index = parameter_groups.pargpnme
+        return parameter_groups.loc[need_groups,:]
+
+    def _get_control_data(self,parameter_groups):
+        """private: get a copy of the control data with the counts
+            updated to match the sections
+        """
+        control_data = self.control_data.copy()
+        control_data.npar = self.parameter_data.shape[0]
+        control_data.nobs = self.observation_data.shape[0]
+        control_data.npargp = parameter_groups.shape[0]
+        control_data.nobsgp = self.observation_data.obgnme.\
+            value_counts().shape[0] + self.prior_information.obgnme.\
+            value_counts().shape[0]
+        control_data.nprior = self.prior_information.shape[0]
+        control_data.ntplfle = len(self.template_files)
+        control_data.ninsfle = len(self.instruction_files)
+        return control_data
 
+    @staticmethod
+    def _format_column(values,formatter):
+        """private: get the printf-style format that renders a column the
+            way DataFrame.to_string() does with formatter, including the
+            column width and the separating space
+        Parameters:
+        ----------
+            values : numpy.ndarray
+            formatter : callable
+        Returns:
+        -------
+            str : the format, or None if the column can't be formatted
+                this way
+        """
+        if formatter not in pst_utils.VECTOR_FMT or values.shape[0] == 0:
+            return None
+        width,conv = pst_utils.VECTOR_FMT[formatter]
+        kind = values.dtype.kind
+        if conv == 's':
+            if kind != 'O' or \
+               pd.api.types.infer_dtype(values,skipna=False) != "string":
+                return None
+            # to_string() puts a space in front of object columns
+            width = max(width,max(map(len,values))) + 1
+        elif kind not in "fiu":
+            return None
+        elif conv == 'd':
+            if kind == 'f' and not np.all(np.isfinite(values)):
+                return None
+            extremes = ["%d" % values.min(),"%d" % values.max()]
+            width = max([width] + [len(e) for e in extremes])
+        # the E format is never wider than 15
+        return " %{0:d}{1}".format(width,conv)
+
+    @staticmethod
+    def _render_df(df,index,columns,formatters):
+        """private: render the lines of a section the same as
+            DataFrame.to_string(col_space=0,formatters=formatters,
+            justify="right",header=False,index_names=False), with index
+            as the index, but formatting each line in one operation
+            rather than calling the formatters for each entry
+        Parameters:
+        ----------
+            df : pandas.DataFrame
+                the section.  It is not modified
+            index : list of str
+                the first entry of each line
+            columns : list of str
+                the columns to write
+            formatters : dict
+                formatter for each column
+        Returns:
+        -------
+            str : the lines of the section, including a trailing newline
+        """
+        line_fmt = None
+        if df.shape[0] > 0 and len(columns) > 0 and \
+           all([isinstance(i,str) for i in index]):
+            line_fmt = "%-{0:d}s".format(max(map(len,index)))
+            values = [index]
+            for col in columns:
+                col_values = df.loc[:,col].values
+                fmt = Pst._format_column(col_values,
+                                         formatters.get(col,None))
+                if fmt is None:
+                    # let pandas render this column.  A blank index, rather
+                    # than index=False, keeps the separator pandas puts
+                    # between columns (index=False drops a leading space
+                    # in newer pandas)
+                    frame = pd.DataFrame({col:col_values},
+                                         index=[''] * df.shape[0])
+                    strs = frame.to_string(col_space=0,
+                                           formatters=formatters,
+                                           justify="right",header=False,
+                                           index_names=False).split('\n')
+                    if len(strs) != df.shape[0]:
+                        line_fmt = None
+                        break
+                    fmt = "%s"
+                    col_values = strs
+                else:
+                    col_values = col_values.tolist()
+                line_fmt += fmt
+                values.append(col_values)
+        if line_fmt is None:
+            frame = df.loc[:,columns].copy()
+            frame.index = index
+            return frame.to_string(col_space=0,formatters=formatters,
+                                   justify="right",header=False,
+                                   index_names=False) + '\n'
+        line_fmt += '\n'
+        return ''.join([line_fmt % row for row in zip(*values)])
 
     def write(self,new_filename,update_regul=False):
-        """write a pest control file
+        """write a pest control file.  The Pst instance is not modified
         Parameters:
         ----------
             new_filename (str) : name of the new pest control file
@@ -493,146 +1055,202 @@ class Pst(object):
             None
         """
 
+        parameter_groups = self._get_rectified_pgroups()
+        control_data = self._get_control_data(parameter_groups)
+
+        with open(new_filename, 'w') as f_out:
+            f_out.write("pcf\n* control data\n")
+            control_data.write(f_out)
+
+            for line in self.other_lines:
+                f_out.write(line)
+
+            f_out.write("* parameter groups\n")
+            # to catch the byte code ugliness in python 3
+            pargpnme = [self.pargp_format["pargpnme"](name) for name
+                        in parameter_groups.pargpnme]
+            f_out.write(self._render_df(parameter_groups,pargpnme,
+                                        [c for c in parameter_groups.columns
+                                         if c != "pargpnme"],
+                                        self.pargp_format))
+
+            f_out.write("* parameter data\n")
+            f_out.write(self._render_df(self.parameter_data,
+                                        list(self.parameter_data.parnme),
+                                        ['partrans','parchglim',
+                                         'parval1','parlbnd','parubnd',
+                                         'pargp','scale','offset','dercom'],
+                                        self.par_format))
+
+            if self.tied is not None:
+                f_out.write(self._render_df(self.tied,list(self.tied.parnme),
+                                            [c for c in self.tied.columns
+                                             if c != "parnme"],
+                                            self.tied_format))
+            f_out.write("* observation groups\n")
+            [f_out.write(str(group)+'\n') for group in self.obs_groups]
+            [f_out.write(str(group)+'\n') for group in self.prior_groups]
+
+            f_out.write("* observation data\n")
+            f_out.write(self._render_df(self.observation_data,
+                                        list(self.observation_data.obsnme),
+                                        [c for c in
+                                         self.observation_data.columns
+                                         if c != "obsnme"],
+                                        self.obs_format))
+
+            f_out.write("* model command line\n")
+            for cline in self.model_command:
+                f_out.write(cline+'\n')
+
+            f_out.write("* model input/output\n")
+            for tplfle,infle in zip(self.template_files,self.input_files):
+                f_out.write(tplfle+' '+infle+'\n')
+            for insfle,outfle in zip(self.instruction_files,self.output_files):
+                f_out.write(insfle+' '+outfle+'\n')
+
+            if self.prior_information.shape[0] > 0:
+                f_out.write("* prior information\n")
+                f_out.write(self._render_df(self.prior_information,
+                                            list(self.prior_information.pilbl),
+                                            self.prior_fieldnames,
+                                            self.prior_format))
+            if control_data.pestmode.startswith("regul"):
+                f_out.write("* regularisation\n")
+                if update_regul or len(self.regul_lines) == 0:
+                    f_out.write(self.regul_section)
+                else:
+                    [f_out.write(line) for line in self.regul_lines]
 
-        self._rectify_pgroups()
-        self._update_control_section()
-
-        f_out = open(new_filename, 'w')
-        f_out.write("pcf\n* control data\n")
-        self.control_data.write(f_out)
-
-        for line in self.other_lines:
-            f_out.write(line)
-
-        f_out.write("* parameter groups\n")
-
-
-        # to catch the byte code ugliness in python 3
-        pargpnme = self.parameter_groups.loc[:,"pargpnme"].copy()
-        self.parameter_groups.loc[:,"pargpnme"] = \
-            self.parameter_groups.pargpnme.apply(self.pargp_format["pargpnme"])
-
-        self.parameter_groups.index = self.parameter_groups.pop("pargpnme")
-
-        f_out.write(self.parameter_groups.to_string(col_space=0,
-                                                  formatters=self.pargp_format,
-                                                  justify="right",
-                                                  header=False,
-                                                  index_names=False) + '\n')
-        self.parameter_groups.loc[:,"pargpnme"] = pargpnme.values
-        self.parameter_groups.index = pargpnme
-
-        f_out.write("* parameter data\n")
-        self.parameter_data.index = self.parameter_data.pop("parnme")
-        f_out.write(self.parameter_data.to_string(col_space=0,
-                                                  columns=[
-                                                  'partrans','parchglim',
-                                                  'parval1','parlbnd','parubnd',
-                                                  'pargp','scale','offset','dercom'],
-                                                  formatters=self.par_format,
-                                                  justify="right",
-                                                  header=False,
-                                                  index_names=False) + '\n')
-        self.parameter_data.loc[:,"parnme"] = self.parameter_data.index
+            for key,value in self.pestpp_options.items():
+                f_out.write("++{0}({1})\n".format(str(key),str(value)))
 
-        if self.tied is not None:
-            self.tied.index = self.tied.pop("parnme")
-            f_out.write(self.tied.to_string(col_space=0,
-                                            formatters=self.tied_format,
-                                            justify='right',
-                                            header=False,
-                                            index_names=False)+'\n')
-            self.tied.loc[:,"parnme"] = self.tied.index
-        f_out.write("* observation groups\n")
-        [f_out.write(str(group)+'\n') for group in self.obs_groups]
-        [f_out.write(str(group)+'\n') for group in self.prior_groups]
-
-        f_out.write("* observation data\n")
-        self.observation_data.index = self.observation_data.pop("obsnme")
-        f_out.write(self.observation_data.to_string(col_space=0,
-                                                  formatters=self.obs_format,
-                                                  justify="right",
-                                                  header=False,
-                                                  index_names=False) + '\n')
-        self.observation_data.loc[:,"obsnme"] = self.observation_data.index
-
-        f_out.write("* model command line\n")
-        for cline in self.model_command:
-            f_out.write(cline+'\n')
-
-        f_out.write("* model input/output\n")
-        for tplfle,infle in zip(self.template_files,self.input_files):
-            f_out.write(tplfle+' '+infle+'\n')
-        for insfle,outfle in zip(self.instruction_files,self.output_files):
-            f_out.write(insfle+' '+outfle+'\n')
-
-        if self.nprior > 0:
-            f_out.write("* prior information\n")
-            self.prior_information.index = self.prior_information.pop("pilbl")
-            f_out.write(self.prior_information.to_string(col_space=0,
-                                              columns=self.prior_fieldnames,
-                                              formatters=self.prior_format,
-                                              justify="right",
-                                              header=False,
-                                              index_names=False) + '\n')
-            self.prior_information["pilbl"] = self.prior_information.index
-        if self.control_data.pestmode.startswith("regul"):
-            f_out.write("* regularisation\n")
-            if update_regul or len(self.regul_lines) == 0:
-                f_out.write(self.regul_section)
-            else:
-                [f_out.write(line) for line in self.regul_lines]
 
+    @staticmethod
+    def _get_subset(df,key,idx):
+        """private: copy the rows of a dataframe, indexed by a column
+        Parameters:
+        ----------
+            df : pandas.DataFrame
+            key : str
+                the column to index the subset by
+            idx : numpy.ndarray or list
+                integer positions of the rows or, if the names can't be
+                matched by position, a list of the names.  If None, all
+                rows are copied
+        Returns:
+        -------
+            pandas.DataFrame
+        """
+        if isinstance(idx,list):
+            subset = df.copy()
+            subset.index = subset.loc[:,key]
+            return subset.loc[idx,:]
+        return Pst._frame_from_columns(Pst._get_columns(df,idx),key)
 
-        for key,value in self.pestpp_options.items():
-            f_out.write("++{0}({1})\n".format(str(key),str(value)))
+    @staticmethod
+    def _get_columns(df,idx):
+        """private: copy the column arrays of the rows of a dataframe
+        Parameters:
+        ----------
+            df : pandas.DataFrame
+            idx : numpy.ndarray
+                integer positions of the rows.  If None, all rows are
+                copied
+        Returns:
+        -------
+            list of (column name, numpy.ndarray) tuples
+        """
+        if idx is None:
+            return [(c,df.loc[:,c].values.copy()) for c in df.columns]
+        return [(c,df.loc[:,c].values[idx]) for c in df.columns]
 
-        f_out.close()
+    @staticmethod
+    def _frame_from_columns(columns,key):
+        """private: build a dataframe, indexed by a column, from the
+            arrays of Pst._get_columns()
+        """
+        # built column by column so the frame is not flagged as a
+        # copy of another dataframe
+        subset = pd.DataFrame(dict(columns),columns=[c for c,_ in columns])
+        subset.index = subset.loc[:,key]
+        return subset
 
+    @staticmethod
+    def _get_indexer(df,key,names):
+        """private: get the integer positions of names in a column of
+            df for Pst._get_subset()
+        """
+        if names is None:
+            return None
+        index = pd.Index(df.loc[:,key])
+        if not index.is_unique:
+            return list(names)
+        idx = index.get_indexer(names)
+        if (idx < 0).any():
+            return list(names)
+        return idx
+
+    def _shallow_copy(self):
+        """private: get a copy of self that shares the dataframes (and the
+            sections that are still to be parsed) with self.  Replace,
+            rather than change in place, the dataframes of the copy
+        Returns:
+        -------
+            Pst instance
+        """
+        new_pst = copy.copy(self)
+        new_pst.__pending = dict(self.__pending)
+        new_pst.__views = dict(self.__views)
+        new_pst.__memos = {}
+        return new_pst
 
-    def get(self, par_names=None, obs_names=None):
+    def get(self, par_names=None, obs_names=None, lazy=False):
         """get a new pst object with subset of parameters and observations
         Args:
             par_names (list of str) : parameter names
             obs_names (list of str) : observation names
+            lazy (bool) : only copy the column arrays of the subsets of
+                the parameter data, observation data and residuals - each
+                dataframe is built the first time it is accessed in the
+                new instance.  Changes made to this instance after get()
+                are not seen by the new instance
         Returns:
             new pst instance
         Raises:
             None
         """
-        pass
-        #if par_names is None and obs_names is None:
-        #    return copy.deepcopy(self)
-        if par_names is None:
-            par_names = self.parameter_data.parnme
-        if obs_names is None:
-            obs_names = self.observation_data.obsnme
-
-        new_par = self.parameter_data.copy()
-        if par_names is not None:
-            new_par.index = new_par.parnme
-            new_par = new_par.loc[par_names, :]
-        new_obs = self.observation_data.copy()
-        new_res = None
-
-        if obs_names is not None:
-            new_obs.index = new_obs.obsnme
-            new_obs = new_obs.loc[obs_names]
-            if self.__res is not None:
-                new_res = copy.deepcopy(self.res)
-                new_res.index = new_res.name
-                new_res = new_res.loc[obs_names, :]
+        pdata,odata = self.parameter_data,self.observation_data
+        par_idx = self._get_indexer(pdata,"parnme",par_names)
+        obs_idx = self._get_indexer(odata,"obsnme",obs_names)
+        # the residuals are only subset if they have been loaded
+        views = {"parameter_data":(pdata,"parnme",par_idx),
+                 "observation_data":(odata,"obsnme",obs_idx)}
+        if self.__res is not None:
+            views["res"] = (self.__res,"name",self._get_indexer(
+                self.__res,"name",odata.obsnme if obs_names is None
+                else obs_names))
+
+        new_pst = Pst(self.filename, resfile=self.resfile, load=False,
+                      use_cache=self.use_cache)
+        for name,(df,key,idx) in views.items():
+            if lazy and not isinstance(idx,list):
+                new_pst.__views[name] = (self._get_columns(df,idx),key)
+            else:
+                setattr(new_pst,"_Pst__" + name,self._get_subset(df,key,idx))
 
+        if par_idx is None:
+            pargps = pdata.pargp
+        elif isinstance(par_idx,list):
+            pargps = self._get_subset(pdata,"parnme",par_idx).pargp
+        else:
+            pargps = pd.Series(pdata.pargp.values[par_idx])
         new_pargp = self.parameter_groups.copy()
         new_pargp.index = new_pargp.pargpnme
-        new_pargp_names = new_par.pargp.value_counts().index
+        new_pargp_names = pargps.value_counts().index
         new_pargp = new_pargp.loc[new_pargp_names,:]
 
-        new_pst = Pst(self.filename, resfile=self.resfile, load=False)
-        new_pst.parameter_data = new_par
-        new_pst.observation_data = new_obs
         new_pst.parameter_groups = new_pargp
-        new_pst.__res = new_res
         new_pst.prior_information = self.null_prior
         new_pst.control_data = self.control_data.copy()
 
@@ -729,7 +1347,8 @@ class Pst(object):
 
     def adjust_weights_recfile(self, recfile=None):
         """adjusts the weights of the observations based on the phi components
-        in a recfile
+        in a recfile.  The last phi components in the recfile that have a
+        contribution for every observation group are used
         Parameters:
         ----------
             recfile (str) : record file name.  If None, try to use a record file
@@ -743,26 +1362,16 @@ class Pst(object):
         assert os.path.exists(recfile), \
             "Pst.adjust_weights_recfile(): recfile not found: " +\
             str(recfile)
-        iter_components = pst_utils.get_phi_comps_from_recfile(recfile)
-        iters = iter_components.keys()
-        iters.sort()
-        obs = self.observation_data
-        ogroups = obs.groupby("obgnme").groups
-        last_complete_iter = None
-        for ogroup, idxs in ogroups.iteritems():
-            for iiter in iters[::-1]:
-                incomplete = False
-                if ogroup not in iter_components[iiter]:
-                    incomplete = True
-                    break
-                if not incomplete:
-                    last_complete_iter = iiter
-                    break
-        if last_complete_iter is None:
+        groups = self.observation_data.obgnme.unique()
+        if self.control_data.pestmode.startswith("regul"):
+            groups = [g for g in groups if "regul" not in g.lower()]
+        df = pst_utils.read_recfile_phi_components(recfile,last=True,
+                                                   groups=groups)
+        if df.shape[0] == 0:
             raise Exception("Pst.pwtadj2(): no complete phi component" +
                             " records found in recfile")
         self.adjust_weights_by_phi_components(
-            iter_components[last_complete_iter])
+            dict(zip(df.group,df.contribution)))
 
     def adjust_weights_resfile(self, resfile=None):
         """adjust the weights by phi components in a residual file
@@ -791,25 +1400,24 @@ class Pst(object):
             None
         """
         obs = self.observation_data
-        nz_groups = obs.groupby(obs["weight"].map(lambda x: x == 0)).groups
-        ogroups = obs.groupby("obgnme").groups
-        for ogroup, idxs in ogroups.items():
+        # number of nonzero weighted obs in each group
+        nz_counts = (obs.weight != 0).groupby(obs.obgnme).sum()
+        factors = {}
+        for ogroup,og_nzobs in nz_counts.items():
             if self.control_data.pestmode.startswith("regul") \
                     and "regul" in ogroup.lower():
                 continue
             og_phi = components[ogroup]
-            nz_groups = obs.loc[idxs,:].groupby(obs.loc[idxs,"weight"].\
-                                                map(lambda x: x == 0)).groups
-            og_nzobs = 0
-            if False in nz_groups.keys():
-                og_nzobs = len(nz_groups[False])
+            og_nzobs = int(og_nzobs)
             if og_nzobs == 0 and og_phi > 0:
                 raise Exception("Pst.adjust_weights_by_phi_components():"
                                 " no obs with nonzero weight," +
                                 " but phi > 0 for group:" + str(ogroup))
             if og_phi > 0:
-                factor = np.sqrt(float(og_nzobs) / float(og_phi))
-                obs.loc[idxs,"weight"] = obs.weight[idxs] * factor
+                factors[ogroup] = np.sqrt(float(og_nzobs) / float(og_phi))
+        if len(factors) > 0:
+            factor = obs.obgnme.map(factors).fillna(1.0)
+            obs.loc[:,"weight"] = obs.weight * factor
         self.observation_data = obs
 
     def __reset_weights(self, target_phis, res_idxs, obs_idxs):
@@ -1,10 +1,15 @@
 from __future__ import print_function, division
 import os, sys
+import re
 import stat
+import pickle
+import hashlib
+import tempfile
 import multiprocessing as mp
 import subprocess as sp
 import socket
 import shutil
+import warnings
 from datetime import datetime
 import numpy as np
 import pandas as pd
@@ -25,12 +30,60 @@ SFMT_LONG = lambda x: "{0:>50s}".format(str(x))
 IFMT = lambda x: "{0:>10d}".format(int(x))
 FFMT = lambda x: "{0:>15.6E}".format(float(x))
 
+# (width, printf-style conversion) equivalents of the formatters, used
+# to format whole lines at once when writing
+VECTOR_FMT = {SFMT: (20, "s"), SFMT_LONG: (50, "s"), IFMT: (10, "d"),
+              FFMT: (15, ".6E")}
+
 
 def str_con(item):
     if len(item) == 0:
         return np.NaN
     return item.lower().strip()
 
+# a line with nothing but whitespace
+BLANK_LINE = re.compile(r"\n[ \t\r\f\v]*\n")
+
+def str_to_numbers(values,kind='f',name=None):
+    """ convert a sequence of strings to a numpy array in one pass,
+        accepting fortran-style 'd' exponents
+
+    Parameters:
+    ----------
+        values : sequence of str
+        kind : str
+            numpy dtype kind: 'f' for float64, 'i' for int64
+        name : str
+            name to report if conversion fails
+    Returns:
+    -------
+        numpy.ndarray
+    """
+    dtype = np.int64 if kind == 'i' else np.float64
+    if kind != 'i' and len(values) > 0:
+        # the C parser in fromstring() is much faster than array()
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                arr = np.fromstring(' '.join(values),dtype=np.float64,
+                                    sep=' ')
+            if arr.shape[0] == len(values):
+                return arr
+        except (ValueError,TypeError):
+            pass
+    try:
+        return np.array(values,dtype=dtype)
+    except (ValueError,TypeError):
+        pass
+    try:
+        arr = np.array([str(v).lower().replace('d','e') for v in values],
+                       dtype=np.float64)
+    except ValueError:
+        raise Exception("unable to convert {0} to numbers".format(name))
+    if kind == 'i':
+        arr = arr.astype(np.int64)
+    return arr
+
 pst_config = {}
 
 # parameter stuff
@@ -114,33 +167,181 @@ pst_config["regul_lines"] = []
 pst_config["pestpp_options"] = {}
 
 
-def read_resfile(resfile):
+def file_signature(filename,hash=True):
+    """get the size, modification time and (optionally) the sha1 hash
+        of a file
+
+    Parameters:
+    ----------
+        filename : str
+            the file
+        hash : bool
+            flag to calculate the sha1 hash
+    Returns:
+    -------
+        dict with "size", "mtime" and "sha1" keys
+    """
+    st = os.stat(filename)
+    sig = {"size":st.st_size,"mtime":st.st_mtime,"sha1":None}
+    if hash:
+        h = hashlib.sha1()
+        with open(filename,'rb') as f:
+            for chunk in iter(lambda: f.read(2**20),b''):
+                h.update(chunk)
+        sig["sha1"] = h.hexdigest()
+    return sig
+
+
+def replace_file(src,dst):
+    """rename src to dst, replacing dst if it exists.  os.rename() fails
+        on windows if dst exists, and os.replace() is python 3 only
+
+    Parameters:
+    ----------
+        src : str
+            file to rename
+        dst : str
+            new name
+    Returns:
+    -------
+        None
+    """
+    if hasattr(os,"replace"):
+        os.replace(src,dst)
+    else:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src,dst)
+
+
+def write_file_cache(filename,data,cache_file=None):
+    """write a binary (pickle) cache of data read from a file.  The
+        cache is written to a temp file and renamed, so readers never
+        see a partial cache
+
+    Parameters:
+    ----------
+        filename : str
+            the file data was read from
+        data : object
+            the data to cache
+        cache_file : str
+            the cache file.  If None, filename + ".cache"
+    Returns:
+    -------
+        bool : True if the cache was written
+    """
+    if cache_file is None:
+        cache_file = filename + ".cache"
+    tmp = cache_file + ".{0:d}.tmp".format(os.getpid())
+    try:
+        cache = {"signature":file_signature(filename),"data":data}
+        with open(tmp,'wb') as f:
+            pickle.dump(cache,f,protocol=pickle.HIGHEST_PROTOCOL)
+        replace_file(tmp,cache_file)
+    except Exception as e:
+        print("write_file_cache() warning: unable to write " +
+              "cache {0}: {1}".format(cache_file,str(e)))
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def read_file_cache(filename,cache_file=None):
+    """read a binary cache written by write_file_cache(), if it is
+        current.  The cache is current if the size of the file matches
+        and either its modification time or its sha1 hash matches.
+
+        The cache is a pickle, and unpickling can run arbitrary code.
+        Only the source file is checked - nothing checks who wrote the
+        cache file itself - so only read caches from directories where
+        no one else can write
+
+    Parameters:
+    ----------
+        filename : str
+            the file the data was read from
+        cache_file : str
+            the cache file.  If None, filename + ".cache"
+    Returns:
+    -------
+        the cached data or None if there is no current cache
+    """
+    if cache_file is None:
+        cache_file = filename + ".cache"
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file,'rb') as f:
+            cache = pickle.load(f)
+        if not isinstance(cache,dict) or "data" not in cache:
+            return None
+        cached = cache["signature"]
+        sig = file_signature(filename,hash=False)
+        if sig["size"] != cached["size"]:
+            return None
+        if sig["mtime"] != cached["mtime"] and \
+           file_signature(filename)["sha1"] != cached["sha1"]:
+            return None
+    except Exception as e:
+        print("read_file_cache() warning: unable to read " +
+              "cache {0}: {1}".format(cache_file,str(e)))
+        return None
+    return cache["data"]
+
+
+def read_resfile(resfile,use_cache=False):
         """load a residual file into a pandas dataframe
 
         Parameters:
         ----------
             resfile : str
                 residual file
+            use_cache : bool
+                load from (and save) a binary cache of the residuals in
+                resfile + ".cache".  The cache is only used if the
+                residual file has not changed.  The cache is a pickle -
+                see read_file_cache() before using it in a shared
+                directory
         Returns:
         -------
             pandas DataFrame
         """
         assert os.path.exists(resfile),"read_resfile() error: resfile " +\
                                        "{0} not found".format(resfile)
-        converters = {"name": str_con, "group": str_con}
-        f = open(resfile, 'r')
-        while True:
-            line = f.readline()
-            if line == '':
-                raise Exception("Pst.get_residuals: EOF before finding "+
-                                "header in resfile: " + resfile)
-            if "name" in line.lower():
-                header = line.lower().strip().split()
-                break
-        res_df = pd.read_csv(f, header=None, names=header, sep="\s+",
-                                 converters=converters)
+        if use_cache:
+            res_df = read_file_cache(resfile)
+            if res_df is not None:
+                return res_df
+        str_cols = ["name","group"]
+        with open(resfile, 'r') as f:
+            while True:
+                line = f.readline()
+                if line == '':
+                    raise Exception("Pst.get_residuals: EOF before finding "+
+                                    "header in resfile: " + resfile)
+                if "name" in line.lower():
+                    header = line.lower().strip().split()
+                    break
+            # the C parser, without per-value converters or NA checks
+            res_df = pd.read_csv(f, header=None, names=header,
+                                 delim_whitespace=True, na_filter=False,
+                                 dtype=dict([(c,object) for c in str_cols
+                                             if c in header]))
+        for c in res_df.columns:
+            if c in str_cols:
+                # whitespace-delimited tokens are never empty and can't
+                # hold a newline, so lower case the column in one go
+                values = '\n'.join(res_df.loc[:,c].values).lower()
+                res_df[c] = np.array(values.split('\n'),dtype=object)
+            elif res_df.loc[:,c].dtype == object:
+                # NA strings (e.g. "nan") in a numeric column.  Replace
+                # the column - newer pandas keeps the dtype with .loc
+                res_df[c] = pd.to_numeric(res_df.loc[:,c],errors="coerce")
         res_df.index = res_df.name
-        f.close()
+        if use_cache:
+            write_file_cache(resfile,res_df)
         return res_df
 
 
@@ -166,7 +367,12 @@ def read_parfile(parfile):
     return par_df
 
 def write_parfile(df,parfile):
-    """ write a pest parameter file from a dataframe
+    """ write a pest parameter file from a dataframe.  Each line is a
+        space, the names left justified to 20 characters and then right
+        justified to the longest name, and the values in " %20.7E" format.
+        This is what the DataFrame.to_string(index=False) writer gave under
+        pandas 0.24 (newer pandas drops the leading space), but it doesn't
+        depend on the pandas version
 
     Parameters:
     ----------
@@ -181,23 +387,328 @@ def write_parfile(df,parfile):
 
     """
     columns = ["parnme","parval1","scale","offset"]
-    formatters = {"parnme":lambda x:"{0:20s}".format(x),
-                  "parval1":lambda x:"{0:20.7E}".format(x),
-                  "scale":lambda x:"{0:20.7E}".format(x),
-                  "offset":lambda x:"{0:20.7E}".format(x)}
-
     for col in columns:
         assert col in df.columns,"write_parfile() error: " +\
                                  "{0} not found in df".format(col)
+    heads, tails = parfile_line_parts(df)
+    write_parfile_values(parfile, heads,
+                         df.loc[:,"parval1"].values.astype(np.float64),
+                         tails)
+
+
+def parfile_line_parts(df):
+    """ preformat the invariant parts of the lines of a pest parameter
+        file - the name and the scale and offset columns - so that files
+        with different parval1 values can be written without reformatting
+
+    Parameters:
+    ----------
+        df : pandas DataFrame
+            with parnme, scale and offset columns
+    Returns:
+    -------
+        tuple(list of str, list of str) : the start of each line up to the
+            value and the end of each line after the value
+    """
+    names = ["{0:20s}".format(name) for name in df.loc[:,"parnme"]]
+    width = max([len(name) for name in names] + [0])
+    heads = [' ' + name.rjust(width) + ' ' for name in names]
+    tails = np.char.add(np.char.mod(" %20.7E",
+                            df.loc[:,"scale"].values.astype(np.float64)),
+                        np.char.mod(" %20.7E\n",
+                            df.loc[:,"offset"].values.astype(np.float64)))
+    return heads, list(tails)
+
+
+def write_parfile_values(parfile, heads, values, tails):
+    """ write a pest parameter file from preformatted line parts and
+        a vector of values
+
+    Parameters:
+    ----------
+        parfile : str
+            name of the parameter file to write
+        heads : list of str
+            start of each line (from parfile_line_parts())
+        values : numpy.ndarray
+            parameter values, aligned with heads
+        tails : list of str
+            end of each line (from parfile_line_parts())
+    Returns:
+    -------
+        None
+    """
+    vals = np.char.mod("%20.7E", values)
     with open(parfile,'w') as f:
         f.write("single point\n")
-        f.write(df.to_string(col_space=0,
-                      columns=columns,
-                      formatters=formatters,
-                      justify="right",
-                      header=False,
-                      index=False,
-                      index_names=False) + '\n')
+        f.write(''.join([h + v + t for h, v, t in zip(heads, vals, tails)]))
+
+
+def read_parfile_values(parfile):
+    """ fast reader for the names and values in a pest parameter file
+
+    Parameters:
+    ----------
+        parfile : str
+            pest parameter file
+    Returns:
+    -------
+        tuple(list of str, numpy.ndarray) : parameter names and values
+    """
+    with open(parfile, 'r') as f:
+        f.readline()
+        tokens = f.read().split()
+    if len(tokens) % 4 != 0:
+        raise Exception("read_parfile_values() error: wrong number of " +
+                        "entries in parfile: " + parfile)
+    names = tokens[0::4]
+    try:
+        values = np.array(tokens[1::4], dtype=np.float64)
+    except ValueError:
+        # fortran double precision exponents
+        values = np.array([v.upper().replace('D', 'E')
+                           for v in tokens[1::4]], dtype=np.float64)
+    return names, values
+
+
+def _write_parfile_chunk(args):
+    heads, tails, parfile_names, values = args
+    for parfile, vals in zip(parfile_names, values):
+        write_parfile_values(parfile, heads, vals, tails)
+
+
+def read_parfiles(parfile_names, num_workers=None):
+    """ read the names and values from many pest parameter files,
+        optionally with a pool of processes
+
+    Parameters:
+    ----------
+        parfile_names : list of str
+            pest parameter files
+        num_workers : int
+            number of processes to use.  If None or 1, files are read
+            in this process
+    Returns:
+    -------
+        list of tuple(list of str, numpy.ndarray), one per file
+    """
+    if num_workers is None or num_workers <= 1 or len(parfile_names) < 2:
+        return [read_parfile_values(pfile) for pfile in parfile_names]
+    pool = mp.Pool(num_workers)
+    try:
+        results = pool.map(read_parfile_values, parfile_names,
+                           chunksize=max(1, len(parfile_names) //
+                                            (4 * num_workers)))
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def write_parfiles(df, values, parfile_names, num_workers=None):
+    """ write many pest parameter files that differ only by parval1,
+        optionally with a pool of processes
+
+    Parameters:
+    ----------
+        df : pandas DataFrame
+            with parnme, scale and offset columns
+        values : numpy.ndarray
+            parameter values, one row per file, columns aligned with df
+        parfile_names : list of str
+            names of the parameter files to write
+        num_workers : int
+            number of processes to use.  If None or 1, files are written
+            in this process
+    Returns:
+    -------
+        None
+    """
+    assert len(parfile_names) == values.shape[0],"write_parfiles() error: " +\
+        "number of files != number of rows in values"
+    heads, tails = parfile_line_parts(df)
+    if num_workers is None or num_workers <= 1 or len(parfile_names) < 2:
+        _write_parfile_chunk((heads, tails, parfile_names, values))
+        return
+    chunks = []
+    for idx in np.array_split(np.arange(len(parfile_names)), num_workers):
+        if len(idx) > 0:
+            chunks.append((heads, tails, [parfile_names[i] for i in idx],
+                           values[idx]))
+    pool = mp.Pool(num_workers)
+    try:
+        pool.map(_write_parfile_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _render_pst(pst, par_values, obs_values):
+    """private: write a pst with the given parval1 and obsval vectors to
+        a temporary file and return the lines of the file.  pst is not
+        modified - the values are set in copies of its dataframes
+    """
+    render = pst._shallow_copy()
+    render.parameter_data = render.parameter_data.assign(parval1=par_values)
+    render.observation_data = \
+        render.observation_data.assign(obsval=obs_values)
+    fd, tmp = tempfile.mkstemp(suffix=".pst")
+    os.close(fd)
+    try:
+        render.write(tmp)
+        with open(tmp, 'r') as f:
+            lines = f.readlines()
+    finally:
+        os.remove(tmp)
+    return lines
+
+
+def _split_section(lines_a, lines_b, start, count, values_b, fmt):
+    """private: split the lines of a section into the text before and
+        after the value that differs between two renderings
+    """
+    vals_b = np.char.mod(fmt, values_b)
+    width = len(vals_b[0]) if count > 0 else 0
+    heads, tails = [], []
+    for i in range(start, start + count):
+        la, lb = lines_a[i], lines_b[i]
+        if len(la) != len(lb) or la == lb:
+            raise Exception("pst_template_parts() error: unable to locate " +
+                            "value on line: " + lb.strip())
+        end = len(la) - len(os.path.commonprefix([la[::-1], lb[::-1]]))
+        if lb[end - width:end] != vals_b[i - start] or \
+           la[end:] != lb[end:] or la[:end - width] != lb[:end - width]:
+            raise Exception("pst_template_parts() error: value format " +
+                            "mismatch on line: " + lb.strip())
+        heads.append(la[:end - width])
+        tails.append(la[end:])
+    return heads, tails
+
+
+def pst_template_parts(pst, fmt="%15.6E"):
+    """ render the invariant parts of a pest control file once so that
+        files that differ only by parval1 and obsval can be written
+        without reformatting the control file
+
+    Parameters:
+    ----------
+        pst : pyemu.Pst
+            the control file to use as a template.  It is not modified
+        fmt : str
+            printf-style format of the parval1 and obsval entries.  Must
+            match the formatters of pst
+    Returns:
+    -------
+        tuple(list of str, list of str, list of str, list of str, list of str)
+            the text before, between and after the parameter and
+            observation data lines, and the (heads, tails) of the
+            parameter and observation data lines
+    """
+    npar, nobs = pst.npar, pst.nobs
+    par_b, obs_b = np.ones(npar) * 2.222222e+22, np.ones(nobs) * 2.222222e+22
+    lines_a = _render_pst(pst, np.ones(npar) * 1.111111e+11,
+                          np.ones(nobs) * 1.111111e+11)
+    lines_b = _render_pst(pst, par_b, obs_b)
+    if len(lines_a) != len(lines_b):
+        raise Exception("pst_template_parts() error: inconsistent rendering")
+    pstart = lines_a.index("* parameter data\n") + 1
+    ostart = lines_a.index("* observation data\n") + 1
+    par_heads, par_tails = _split_section(lines_a, lines_b, pstart, npar,
+                                          par_b, fmt)
+    obs_heads, obs_tails = _split_section(lines_a, lines_b, ostart, nobs,
+                                          obs_b, fmt)
+    pieces = [''.join(lines_a[:pstart]),
+              ''.join(lines_a[pstart + npar:ostart]),
+              ''.join(lines_a[ostart + nobs:])]
+    return pieces, (par_heads, par_tails), (obs_heads, obs_tails), fmt
+
+
+def write_pst_values(pst_file, parts, par_values, obs_values):
+    """ write a pest control file from preformatted parts and vectors of
+        parval1 and obsval values
+
+    Parameters:
+    ----------
+        pst_file : str
+            name of the control file to write
+        parts : tuple
+            from pst_template_parts()
+        par_values : numpy.ndarray
+            parval1 values, aligned with the parameter data of the template
+        obs_values : numpy.ndarray
+            obsval values, aligned with the observation data of the template
+    Returns:
+    -------
+        None
+    """
+    pieces, (par_heads, par_tails), (obs_heads, obs_tails), fmt = parts
+    pvals = np.char.mod(fmt, par_values)
+    ovals = np.char.mod(fmt, obs_values)
+    with open(pst_file, 'w') as f:
+        f.write(pieces[0])
+        f.write(''.join([h + v + t for h, v, t in
+                         zip(par_heads, pvals, par_tails)]))
+        f.write(pieces[1])
+        f.write(''.join([h + v + t for h, v, t in
+                         zip(obs_heads, ovals, obs_tails)]))
+        f.write(pieces[2])
+
+
+def _write_pst_chunk(args):
+    parts, pst_names, par_values, obs_values = args
+    for pst_file, pvals, ovals in zip(pst_names, par_values, obs_values):
+        write_pst_values(pst_file, parts, pvals, ovals)
+
+
+def write_psts(pst, par_values, pst_names, obs_values=None, num_workers=None):
+    """ write many pest control files that differ only by parval1 and
+        obsval, optionally with a pool of processes.  The control file is
+        only rendered once; the values are spliced into the template
+
+    Parameters:
+    ----------
+        pst : pyemu.Pst
+            the control file to use as a template.  It is not modified
+        par_values : numpy.ndarray
+            parval1 values, one row per file, columns aligned with
+            pst.parameter_data
+        pst_names : list of str
+            names of the control files to write
+        obs_values : numpy.ndarray
+            obsval values, one row per file, columns aligned with
+            pst.observation_data.  If None, the obsval of pst are used
+        num_workers : int
+            number of processes to use.  If None or 1, files are written
+            in this process
+    Returns:
+    -------
+        None
+    """
+    par_values = np.atleast_2d(np.asarray(par_values, dtype=np.float64))
+    assert len(pst_names) == par_values.shape[0],"write_psts() error: " +\
+        "number of files != number of rows in par_values"
+    if obs_values is None:
+        obs_values = np.tile(pst.observation_data.obsval.values.
+                             astype(np.float64), (len(pst_names), 1))
+    obs_values = np.atleast_2d(np.asarray(obs_values, dtype=np.float64))
+    assert len(pst_names) == obs_values.shape[0],"write_psts() error: " +\
+        "number of files != number of rows in obs_values"
+    parts = pst_template_parts(pst)
+    if num_workers is None or num_workers <= 1 or len(pst_names) < 2:
+        _write_pst_chunk((parts, pst_names, par_values, obs_values))
+        return
+    chunks = []
+    for idx in np.array_split(np.arange(len(pst_names)), num_workers):
+        if len(idx) > 0:
+            chunks.append((parts, [pst_names[i] for i in idx],
+                           par_values[idx], obs_values[idx]))
+    pool = mp.Pool(num_workers)
+    try:
+        pool.map(_write_pst_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
 
 def parse_tpl_file(tpl_file):
     """ parse a pest template file to get the parameter names
@@ -404,6 +915,154 @@ def pst_from_io_files(tpl_files,in_files,ins_files,out_files,pst_filename=None):
     return new_pst
 
 
+# the lines that start a block of phi contributions in a record file
+RECFILE_PHI_HEADERS = ("starting phi for this iteration","final phi")
+# a line of a phi contribution block
+RECFILE_PHI_CONTRIB = re.compile("\n([^\n]*contribution to phi[^\n]*)")
+
+
+def _parse_recfile_phi_blocks(text):
+    """private: find the phi contribution blocks in lower case record file
+        text that holds whole lines
+    Parameters:
+    ----------
+        text (str) : lower case record file text
+    Returns:
+    -------
+        tuple(list of dict{group:contribution}, int) : the complete
+        blocks and the position in text where the first incomplete block
+        starts (len(text) if there isn't one)
+    """
+    blocks = []
+    pos = 0
+    # next position of each header - str.find() is much faster than an
+    # alternation regex on large chunks
+    found = [text.find(h) for h in RECFILE_PHI_HEADERS]
+    while True:
+        found = [text.find(h,pos) if 0 <= f < pos else f
+                 for h,f in zip(RECFILE_PHI_HEADERS,found)]
+        found_pos = [f for f in found if f >= 0]
+        if len(found_pos) == 0:
+            return blocks,len(text)
+        header = min(found_pos)
+        line_start = text.rfind('\n',0,header) + 1
+        pos = text.find('\n',header)
+        if pos == -1:
+            return blocks,line_start
+        contributions = {}
+        while True:
+            c = RECFILE_PHI_CONTRIB.match(text,pos)
+            if c is None:
+                break
+            raw = c.group(1).strip().split()
+            contributions[raw[-3].replace('\"', '')] = float(raw[-1])
+            pos = c.end()
+        # a block is complete once a line follows it
+        if pos + 1 >= len(text):
+            return blocks,line_start
+        blocks.append(contributions)
+        pos += 1
+
+
+def iter_recfile_phi_blocks(recfile,chunk_size=2**24):
+    """stream the phi contribution blocks ("starting phi for this
+        iteration" and "final phi") of a record file, reading it in
+        chunks so that memory use doesn't depend on the file size
+    Parameters:
+    ----------
+        recfile (str) : record file
+        chunk_size (int) : number of bytes to read at a time
+    Returns:
+    -------
+        generator of dict{group:contribution}, one per complete block
+    """
+    assert os.path.exists(recfile),"iter_recfile_phi_blocks(): recfile " +\
+        "not found: " + str(recfile)
+    with open(recfile,'rb') as f:
+        text = ''
+        while True:
+            chunk = f.read(chunk_size)
+            if len(chunk) == 0:
+                break
+            text += chunk.decode("latin-1").lower()
+            # only parse whole lines
+            end = text.rfind('\n') + 1
+            blocks,pos = _parse_recfile_phi_blocks(text[:end])
+            for contributions in blocks:
+                yield contributions
+            text = text[pos:]
+        # a block that ends the file is complete if a line follows it
+        if len(text) > 0 and not text.endswith('\n'):
+            text += '\n'
+        for contributions in _parse_recfile_phi_blocks(text)[0]:
+            yield contributions
+
+
+def read_recfile_phi_components(recfile,last=False,groups=None,
+                                chunk_size=2**24):
+    """read the phi components from a record file into a dataframe
+    Parameters:
+    ----------
+        recfile (str) : record file
+        last (bool) : only read the last phi contribution block.  The
+            file is read backwards from the end, so only the tail of
+            the file is read
+        groups (list of str) : with last, the last block that has a
+            contribution for each of these groups is read
+        chunk_size (int) : number of bytes to read at a time
+    Returns:
+    -------
+        pandas.DataFrame with "iteration", "group" and "contribution"
+        columns.  Iterations are numbered from 1 or, if last is True,
+        backwards from -1 for the last block in the file
+    """
+    if not last:
+        records = [(iiter,group,contrib) for iiter,contributions in
+                   enumerate(iter_recfile_phi_blocks(recfile,chunk_size),1)
+                   for group,contrib in contributions.items()]
+    else:
+        records = []
+        iiter,contributions = _find_last_recfile_phi_block(recfile,groups,
+                                                           chunk_size)
+        if contributions is not None:
+            records = [(iiter,group,contrib) for group,contrib in
+                       contributions.items()]
+    return pd.DataFrame(records,columns=["iteration","group","contribution"])
+
+
+def _find_last_recfile_phi_block(recfile,groups=None,chunk_size=2**24):
+    """private: find the last phi contribution block of a record file
+        (optionally, the last one with a contribution from each of groups)
+        by reading a growing window at the end of the file
+    Returns:
+    -------
+        tuple(int,dict{group:contribution}) : the block number counted
+        back from -1 for the last block and the block, or (None,None)
+    """
+    assert os.path.exists(recfile),"read_recfile_phi_components(): " +\
+        "recfile not found: " + str(recfile)
+    size = os.path.getsize(recfile)
+    window = chunk_size
+    with open(recfile,'rb') as f:
+        while True:
+            start = max(0,size - window)
+            f.seek(start)
+            text = f.read().decode("latin-1").lower()
+            if start > 0:
+                # drop the partial first line
+                text = text[text.find('\n') + 1:]
+            if len(text) > 0 and not text.endswith('\n'):
+                text += '\n'
+            blocks = _parse_recfile_phi_blocks(text)[0]
+            for i in range(len(blocks) - 1,-1,-1):
+                if groups is None or \
+                   all([g in blocks[i] for g in groups]):
+                    return i - len(blocks),blocks[i]
+            if start == 0:
+                return None,None
+            window *= 2
+
+
 def get_phi_comps_from_recfile(recfile):
         """read the phi components from a record file
         Parameters:
@@ -413,29 +1072,7 @@ def get_phi_comps_from_recfile(recfile):
         -------
             dict{iteration number:{group,contribution}}
         """
-        iiter = 1
-        iters = {}
-        f = open(recfile,'r')
-        while True:
-            line = f.readline()
-            if line == '':
-                break
-            if "starting phi for this iteration" in line.lower() or \
-                "final phi" in line.lower():
-                contributions = {}
-                while True:
-                    line = f.readline()
-                    if line == '':
-                        break
-                    if "contribution to phi" not in line.lower():
-                        iters[iiter] = contributions
-                        iiter += 1
-                        break
-                    raw = line.strip().split()
-                    val = float(raw[-1])
-                    group = raw[-3].lower().replace('\"', '')
-                    contributions[group] = val
-        return iters
+        return dict(enumerate(iter_recfile_phi_blocks(recfile),1))
 
 def smp_to_ins(smp_filename,ins_filename=None):
     """ create an instruction file from an smp file
@@ -0,0 +1,100 @@
+# timing of the Pst operations on large control files - these are not
+# run by the test suite, run this script directly
+
+
+def load_benchmark():
+    import os
+    import time
+    from pyemu import Pst,pst_utils
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    # synthetic control files of growing size
+    for nobs in [1000,10000,100000]:
+        pst_file = os.path.join(temp_dir,"bench_{0}.pst".format(nobs))
+        pst = pst_utils.generic_pst(par_names=["p{0}".format(i)
+                                               for i in range(100)],
+                                    obs_names=["o{0}".format(i)
+                                               for i in range(nobs)])
+        pst.write(pst_file)
+        start = time.time()
+        pst = Pst(pst_file)
+        print("Pst.load(): {0:d} obs took {1:6.3f} sec".\
+              format(nobs,time.time() - start))
+
+
+def lazy_load_benchmark():
+    import os
+    import time
+    from pyemu import Pst,pst_utils
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    pst_file = os.path.join(temp_dir,"lazy_bench.pst")
+    pst = pst_utils.generic_pst(par_names=["p{0}".format(i)
+                                           for i in range(100)],
+                                obs_names=["o{0}".format(i)
+                                           for i in range(100000)])
+    pst.write(pst_file)
+    start = time.time()
+    Pst(pst_file)
+    print("Pst.load(): {0:6.3f} sec".format(time.time() - start))
+    start = time.time()
+    lazy = Pst(pst_file,lazy=True)
+    lazy.parameter_data
+    print("Pst.load(lazy=True) + parameter_data: {0:6.3f} sec".\
+          format(time.time() - start))
+
+
+def phi_components_benchmark():
+    import time
+    import numpy as np
+    import pandas as pd
+    from pyemu import Pst,pst_utils
+    nobs,ngrp = 1000000,1000
+    names = ["o{0}".format(i) for i in range(nobs)]
+    pst = pst_utils.generic_pst(par_names=["p1"],obs_names=names)
+    pst.observation_data.loc[:,"obgnme"] = \
+        ["g{0}".format(i % ngrp) for i in range(nobs)]
+    pst.observation_data.loc[:,"weight"] = 1.0
+    res = pd.DataFrame({"name":names,
+                        "group":pst.observation_data.obgnme.values,
+                        "residual":np.ones(nobs)})
+    pst.set_res(res.iloc[np.random.permutation(nobs),:])
+    start = time.time()
+    pst.adjust_weights_resfile()
+    print("adjust_weights_resfile(), 1M obs: {0:6.3f} sec".\
+          format(time.time() - start))
+    obs,res = pst.observation_data,pst.res
+    start = time.time()
+    Pst._get_phi_components(obs.obsnme.values,obs.obgnme.values,
+                            obs.weight.values,res.name.values,
+                            res.group.values,res.residual.values)
+    fresh = time.time() - start
+    pst.phi_components
+    start = time.time()
+    pst.phi_components
+    print("phi_components, 1M obs: fresh {0:6.3f} sec, memo hit {1:6.3f} sec".\
+          format(fresh,time.time() - start))
+
+
+def get_benchmark():
+    import time
+    from pyemu import pst_utils
+    pst = pst_utils.generic_pst(par_names=["p{0}".format(i)
+                                           for i in range(1000)],
+                                obs_names=["o{0}".format(i)
+                                           for i in range(1000000)])
+    for lazy in [False,True]:
+        start = time.time()
+        new_pst = pst.get(par_names=pst.par_names[:10],lazy=lazy)
+        new_pst.parameter_data
+        print("Pst.get(lazy={0}), 1M obs: {1:6.3f} sec".\
+              format(lazy,time.time() - start))
+
+
+if __name__ == "__main__":
+    load_benchmark()
+    lazy_load_benchmark()
+    phi_components_benchmark()
+    get_benchmark()
@@ -83,8 +83,170 @@ def errvar_test():
     print(ev.prior_forecast)
     print(ev.get_errvar_dataframe())
 
+def errvar_sweep_test():
+    import os
+    import numpy as np
+    from pyemu import ErrVar, Pst, Cov
+    w_dir = os.path.join("..","..","verification","henry")
+    forecasts = ["pd_ten","c_obs10_2"]
+    pst = Pst(os.path.join(w_dir,"pest.pst"))
+    omitted = [pname for pname in pst.par_names
+               if pname.startswith("kr01")][:10]
+    ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                omitted_parameters=omitted)
+    svs = [0,1,5,10,20,100,700]
+    df = ev.get_errvar_dataframe(svs)
+    for sv in svs:
+        for key,val in ev.variance_at(sv).items():
+            d = np.abs(df.loc[sv,key] - val)
+            assert d <= 1.0e-6 * max(np.abs(val),1.0e-10),\
+                "{0}:{1}:{2}".format(sv,str(key),d)
+
+    # a non-diagonal parcov
+    parcov = Cov()
+    parcov.from_parameter_data(pst)
+    sd = np.sqrt(parcov.x[:,0])
+    idx = np.arange(sd.shape[0])
+    x = np.exp(-np.abs(idx[:,np.newaxis] - idx) / 5.0) * np.outer(sd,sd)
+    for use_qhalfx in [False,True]:
+        ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                    omitted_parameters=omitted,use_qhalfx=use_qhalfx,
+                    parcov=Cov(x=x,names=parcov.row_names))
+        df = ev.get_errvar_dataframe(svs)
+        for sv in svs:
+            for key,val in ev.variance_at(sv).items():
+                d = np.abs(df.loc[sv,key] - val)
+                assert d <= 1.0e-6 * max(np.abs(val),1.0e-10),\
+                    "{0}:{1}:{2}".format(sv,str(key),d)
+
+def errvar_qhalfx_test():
+    import os
+    import numpy as np
+    from pyemu import ErrVar, Pst
+    w_dir = os.path.join("..","..","verification","henry")
+    forecasts = ["pd_ten","c_obs10_2"]
+    pst = Pst(os.path.join(w_dir,"pest.pst"))
+    omitted = [pname for pname in pst.par_names
+               if pname.startswith("kr01")][:10]
+    ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                omitted_parameters=omitted)
+    evq = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                 omitted_parameters=omitted,use_qhalfx=True)
+    svs = [0,1,5,10,15,700]
+    df = ev.get_errvar_dataframe(svs)
+    dfq = evq.get_errvar_dataframe(svs)
+    d = (np.abs(df - dfq) / np.abs(df).clip(lower=1.0e-10)).max().max()
+    assert d < 1.0e-6,d
+    for sv in svs[:-1]:
+        d = np.abs((ev.G(sv) - evq.G(sv)).x).max()
+        assert d < 1.0e-6,"G @{0}:{1}".format(sv,d)
+        d = np.abs((ev.I_minus_R(sv) - evq.I_minus_R(sv)).x).max()
+        assert d < 1.0e-6,"I-R @{0}:{1}".format(sv,d)
+
+def la_diagonal_obscov_test():
+    import os
+    import numpy as np
+    from pyemu import Schur
+    w_dir = os.path.join("..","..","verification","henry")
+    sc = Schur(jco=os.path.join(w_dir,"pest.jcb"))
+    assert sc.obscov.isdiagonal
+    # compare the weighted-jco kernels to the explicit obscov products,
+    # with a reordered and incomplete obscov to exercise the alignment
+    obscov = sc.obscov.get(row_names=sc.obscov.row_names[::-1][:-3])
+    sc.reset_obscov(obscov)
+    xtqx = sc.jco.T * (obscov ** -1) * sc.jco
+    d = np.abs((sc.xtqx - xtqx).x).max() / np.abs(xtqx.x).max()
+    assert d < 1.0e-10,d
+    qhalfx = sc.qhalf * sc.jco
+    assert sc.qhalfx.shape == qhalfx.shape
+    idx = [qhalfx.row_names.index(name) for name in sc.qhalfx.row_names]
+    assert np.abs(sc.qhalfx.x - qhalfx.x[idx]).max() < 1.0e-10
+
+def la_lazy_test():
+    import os
+    import numpy as np
+    from pyemu import Schur
+    from pyemu.mat import Jco
+    w_dir = os.path.join("..","..","verification","henry")
+    forecasts = ["pd_ten","c_obs10_2"]
+    sc = Schur(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts)
+    # only the forecast rows are read for the prior forecast variance
+    prior = sc.prior_forecast
+    assert sc._LinearAnalysis__jco is None
+    jco = Jco()
+    jco.from_binary(os.path.join(w_dir,"pest.jcb"))
+    for prediction in sc.forecasts:
+        name = prediction.col_names[0]
+        y = jco.get(row_names=[name]).x
+        assert np.abs(prediction.x[:,0] - y[0,:]).max() == 0.0
+    # prior info and forecast rows are dropped once the full jco is loaded
+    assert sc.jco.shape == (sc.pst.nobs - len(forecasts),jco.shape[1])
+    for name in forecasts:
+        assert name not in sc.jco.row_names
+        assert name not in sc.obscov.row_names
+    print(sc.posterior_forecast)
+
+def la_cache_test():
+    import os
+    import shutil
+    import numpy as np
+    from pyemu import ErrVar, Schur, MatrixCache
+    w_dir = os.path.join("..","..","verification","henry")
+    forecasts = ["pd_ten","c_obs10_2"]
+    cache_dir = "cache"
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    cache = MatrixCache(cache_dir)
+    # count the writes - xtqx and then its svd
+    puts = []
+    put = cache.put
+    cache.put = lambda key,mat: puts.append(key) or put(key,mat)
+    ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                cache_dir=cache)
+    for _ in range(3):
+        ev.xtqx
+    assert len(puts) == 1
+    df = ev.get_errvar_dataframe([0,5,10])
+    for _ in range(3):
+        ev.xtqx
+    assert len(puts) == 2
+    cache.put = put
+    keys = [key for key,size in cache.entries]
+    assert len(keys) == 1 and keys[0].startswith("xtqx")
+    assert cache.has_svd(keys[0])
+
+    # a new analysis with the same jco loads xtqx and its svd
+    ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                cache_dir=cache)
+    assert np.abs(ev.get_errvar_dataframe([0,5,10]) - df).max().max() == 0.0
+    sc = Schur(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+               cache_dir=cache)
+    print(sc.posterior_forecast)
+
+    # the jco and obscov are hashed once for all the intermediates
+    hashes = []
+    cache.hash_matrix = lambda mat: hashes.append(mat.shape) or \
+        MatrixCache.hash_matrix(mat)
+    ev = ErrVar(jco=os.path.join(w_dir,"pest.jcb"),forecasts=forecasts,
+                cache_dir=cache)
+    ev.qhalfx,ev.xtqx
+    assert len(hashes) == 2
+    del cache.hash_matrix
+
+    # eviction
+    keys = [key for key,size in cache.entries]
+    cache.max_size = 1
+    assert cache.evict() == keys
+    assert cache.size == 0
+    shutil.rmtree(cache_dir)
+
 if __name__ == "__main__":
     schur_test_nonpest()
     schur_test()
     errvar_test_nonpest()
-    errvar_test()
\ No newline at end of file
+    errvar_test()
+    errvar_sweep_test()
+    errvar_qhalfx_test()
+    la_cache_test()
+    la_diagonal_obscov_test()
+    la_lazy_test()
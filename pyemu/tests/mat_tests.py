@@ -76,5 +76,44 @@ def mat_test():
     assert first.shape == (3,2)
 
 
+def cov_draw_test():
+    import numpy as np
+    from pyemu.mat import Cov
+    names = ["p1","p2","p3"]
+    x = np.array([[2.0,0.5,0.0],[0.5,1.0,0.3],[0.0,0.3,0.5]])
+    cov = Cov(x=x,names=names)
+    factor = cov.factor
+    assert np.allclose(np.dot(factor,factor.T),x)
+    # the factor is cached
+    assert cov.factor is factor
+    # same seed, same realizations - int or RandomState
+    r1 = cov.draw(10,seed=1)
+    r2 = cov.draw(10,seed=np.random.RandomState(1))
+    assert np.all(r1 == r2)
+    reals = cov.draw(20000,mean=[1.0,2.0,3.0],seed=2)
+    assert reals.shape == (20000,3)
+    assert np.abs(reals.mean(axis=0) - [1.0,2.0,3.0]).max() < 0.05
+    assert np.abs(np.cov(reals.T) - x).max() < 0.05
+    # in-place changes to x are picked up
+    cov.x[0,0] = 4.0
+    assert cov.factor is not factor
+    assert np.allclose(np.dot(cov.factor,cov.factor.T),cov.x)
+    # only the block of names is factored
+    cov.x[2,2] = np.nan
+    factor = cov.get_factor(["p2","P1"])
+    assert np.allclose(np.dot(factor,factor.T),[[1.0,0.5],[0.5,4.0]])
+    assert cov.get_factor(["p2","p1"]) is factor
+    assert cov.draw(10,seed=1,names=["p2","p1"]).shape == (10,2)
+    # semidefinite falls back to eigen factor
+    x = np.array([[1.0,1.0],[1.0,1.0]])
+    cov = Cov(x=x,names=["a","b"])
+    assert np.allclose(np.dot(cov.factor,cov.factor.T),x)
+    # diagonal
+    cov = Cov(x=np.array([[4.0],[9.0]]),names=["a","b"],isdiagonal=True)
+    assert np.allclose(cov.factor,[2.0,3.0])
+    reals = cov.draw(20000,seed=3)
+    assert np.abs(reals.std(axis=0) - [2.0,3.0]).max() < 0.1
+
 if __name__ == "__main__":
     mat_test()
+    cov_draw_test()
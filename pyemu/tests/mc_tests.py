@@ -31,5 +31,285 @@ def mc_test():
     print("posterior ensemble variance:",
           np.var(mc.parensemble.loc[:,"mult1"]))
 
+def ensemble_draw_test():
+    import os
+    import numpy as np
+    from pyemu import Pst, Cov
+    from pyemu.en import ParameterEnsemble
+    pst = Pst(os.path.join("pst","pest.pst"))
+    cov = Cov()
+    cov.from_parameter_data(pst)
+    # leave a parameter out of cov - it should be set to its mean value
+    names = cov.row_names[1:]
+    cov = cov.get(names)
+    pe = ParameterEnsemble(pst=pst)
+    pe.draw(cov,num_reals=50)
+    assert pe.shape == (50,pst.npar)
+    assert list(pe.index) == ["{0:d}".format(i) for i in range(50)]
+    missing = pst.parameter_data.parnme[0]
+    assert np.allclose(pe.loc[:,missing],
+                       pst.parameter_data.loc[missing,"parval1"])
+    assert pe.loc[:,names].std().min() > 0.0
+    # cov elements the ensemble doesn't use are not factored
+    x = np.diag(np.append(cov.as_2d.diagonal(),np.nan))
+    cov = Cov(x=x,names=names + ["not_in_pst"])
+    pe = ParameterEnsemble(pst=pst)
+    pe.draw(cov,num_reals=50)
+    assert np.all(np.isfinite(pe.values))
+    assert pe.loc[:,names].std().min() > 0.0
+
+def ensemble_diagonal_draw_test():
+    import os
+    import numpy as np
+    from pyemu import Pst, Cov
+    from pyemu.en import ObservationEnsemble
+    pst = Pst(os.path.join("pst","pest.pst"))
+    cov = Cov()
+    cov.from_observation_data(pst)
+    assert cov.isdiagonal
+    oe = ObservationEnsemble(pst=pst)
+    np.random.seed(0)
+    oe.draw(cov,num_reals=5000)
+    names = pst.nnz_obs_names
+    obs = pst.observation_data.loc[names,:]
+    assert np.allclose(oe.loc[:,names].mean(),obs.obsval,
+                       atol=0.1 / obs.weight.min())
+    std = oe.loc[:,names].std() * obs.weight
+    assert np.abs(std - 1.0).max() < 0.05,std
+
+def mc_chunks_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    jco = os.path.join("pst","pest.jcb")
+    out_dir = os.path.join("mc_chunks")
+    if not os.path.exists(out_dir):
+        os.mkdir(out_dir)
+    prefix = os.path.join(out_dir,"real_")
+    mc = MonteCarlo(jco=jco)
+    chunks = [en for en in mc.draw_chunks(25,chunk_size=10,seed=1,
+                                          parfile_prefix=prefix)]
+    assert [en.shape[0] for en in chunks] == [10,10,5]
+    index = [real for en in chunks for real in en.index]
+    assert index == ["{0:d}".format(i) for i in range(25)]
+    assert os.path.exists(prefix + "24.par")
+    # the same realizations as drawing them all at once
+    mc.draw(25,seed=1)
+    values = np.vstack([en.values for en in chunks])
+    assert np.abs(values - mc.parensemble.values).max() < 1.0e-10
+
+    for en in mc.draw_chunks(20,chunk_size=8,project=True,
+                             enforce_bounds=True):
+        ub = en.pst.parameter_data.parubnd.values
+        assert (en.values <= ub * (1.0 + 1.0e-10)).all()
+
+def mc_project_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    jco = os.path.join("pst","pest.jcb")
+    mc = MonteCarlo(jco=jco)
+    mc.draw(50,seed=2)
+    en = mc.project_parensemble(inplace=False)
+    mc.draw(50,seed=2)
+    en_thin = mc.project_parensemble(inplace=False,thin=True)
+    d = np.abs(en.values - en_thin.values).max() / np.abs(en.values).max()
+    assert d < 1.0e-10,d
+    # the projected difference vectors have no solution-space component
+    mc.draw(50,seed=2)
+    mc.parensemble.project(v1=mc.get_solution_space(),enforce=False)
+    mc.parensemble._transform()
+    names = mc.parensemble.adj_names
+    v1 = mc.get_solution_space().get(row_names=names).x
+    diff = mc.parensemble.loc[:,names].values - \
+           mc.parensemble.mean_values.loc[names].values
+    assert np.abs(np.dot(diff,v1)).max() < 1.0e-8
+
+def ensemble_enforce_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    jco = os.path.join("pst","pest.jcb")
+    mc = MonteCarlo(jco=jco)
+    mc.draw(100,seed=3)
+    pe = mc.parensemble
+    pe._transform()
+    ub = pe.ubnd.loc[pe.columns].values
+    lb = pe.lbnd.loc[pe.columns].values
+    base = pe.mean_values.loc[pe.columns].values
+    before = pe.values.copy()
+    assert (before > ub).any() or (before < lb).any()
+    pe.enforce(how="scale")
+    after = pe.values
+    assert (after <= ub + 1.0e-10).all() and (after >= lb - 1.0e-10).all()
+    # each realization is shrunk along its difference vector
+    for b,a in zip(before - base,after - base):
+        fac = np.dot(a,b) / np.dot(b,b)
+        assert 0.0 <= fac <= 1.0 + 1.0e-10
+        assert np.allclose(a,b * fac)
+
+    mc.draw(100,seed=3)
+    mc.parensemble.enforce()
+    vals = mc.parensemble.values
+    ub = mc.parensemble.ubnd.loc[mc.parensemble.columns].values
+    lb = mc.parensemble.lbnd.loc[mc.parensemble.columns].values
+    assert (vals <= ub).all() and (vals >= lb).all()
+
+def ensemble_transform_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    jco = os.path.join("pst","pest.jcb")
+    mc = MonteCarlo(jco=jco)
+    mc.draw(20,seed=4)
+    pe = mc.parensemble
+    before = pe.values.copy()
+    islog = (pe.pst.parameter_data.partrans == "log").values
+    log_en = pe._transform(inplace=False)
+    assert log_en.islog and not pe.islog
+    assert log_en.pst is pe.pst
+    assert list(log_en.index) == list(pe.index)
+    assert np.allclose(log_en.values[:,islog],np.log10(before[:,islog]))
+    assert np.all(log_en.values[:,~islog] == before[:,~islog])
+    pe._transform()
+    assert np.allclose(pe.values,log_en.values)
+    pe._back_transform()
+    assert np.allclose(pe.values,before)
+    # projecting a copy leaves self untouched
+    en = pe.project(mc.get_null_proj(),inplace=False)
+    assert not pe.islog and not en.islog
+    assert np.allclose(pe.values,before)
+
+def ensemble_parfiles_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    from pyemu.en import ParameterEnsemble
+    jco = os.path.join("pst","pest.jcb")
+    out_dir = os.path.join("mc_parfiles")
+    if not os.path.exists(out_dir):
+        os.mkdir(out_dir)
+    mc = MonteCarlo(jco=jco)
+    mc.draw(10,seed=5)
+    for num_workers in [None,2]:
+        prefix = os.path.join(out_dir,"real_{0}_".format(num_workers))
+        mc.parensemble.to_parfiles(prefix,num_workers=num_workers)
+        parfiles = [prefix + real + ".par" for real in mc.parensemble.index]
+        pe = ParameterEnsemble(pst=mc.pst)
+        pe.read_parfiles(parfiles,num_workers=num_workers)
+        assert list(pe.index) == parfiles
+        d = np.abs(pe.values - mc.parensemble.values) / \
+            np.abs(mc.parensemble.values)
+        assert d.max() < 1.0e-7,d.max()
+
+def ensemble_binary_test():
+    import os
+    import shutil
+    import numpy as np
+    from pyemu import MonteCarlo
+    from pyemu.en import ParameterEnsemble,read_binary_header
+    jco = os.path.join("pst","pest.jcb")
+    filename = os.path.join("mc_binary")
+    if os.path.exists(filename):
+        shutil.rmtree(filename)
+    mc = MonteCarlo(jco=jco)
+    # stream chunks to the binary file
+    chunks = [en.values.copy() for en in
+              mc.draw_chunks(25,chunk_size=10,seed=1,binary_file=filename)]
+    pe = ParameterEnsemble(pst=mc.pst)
+    pe.from_binary(filename)
+    assert pe.shape == (25,mc.pst.npar)
+    assert list(pe.index) == ["{0:d}".format(i) for i in range(25)]
+    assert np.all(pe.values == np.vstack(chunks))
+    assert not pe.islog
+
+    # append log transformed realizations - stored back transformed
+    pe._transform()
+    pe.index = ["{0:d}".format(i) for i in range(25,50)]
+    pe.to_binary(filename,append=True)
+    pe_all = ParameterEnsemble(pst=mc.pst)
+    pe_all.from_binary(filename,mmap_mode=None)
+    assert pe_all.shape == (50,mc.pst.npar)
+    assert np.allclose(pe_all.values[25:],pe_all.values[:25])
+
+    names = ["mult1",mc.pst.par_names[-1]]
+    pe_sub = ParameterEnsemble(pst=mc.pst)
+    pe_sub.from_binary(filename,columns=names)
+    assert list(pe_sub.columns) == names
+    assert np.all(pe_sub.values == pe_all.loc[:,names].values)
+
+    # rewriting the file replaces the header and the values together
+    pe_sub.to_binary(filename)
+    pe = ParameterEnsemble(pst=mc.pst)
+    pe.from_binary(filename,mmap_mode=None)
+    assert list(pe.columns) == names
+    assert np.all(pe.values == pe_all.loc[:,names].values)
+    assert sorted(os.listdir(filename)) == \
+        sorted(["header.json",read_binary_header(filename)["values_file"]])
+
+def write_psts_test():
+    import os
+    import numpy as np
+    from pyemu import MonteCarlo
+    jco = os.path.join("pst","pest.jcb")
+    out_dir = os.path.join("mc_psts")
+    if not os.path.exists(out_dir):
+        os.mkdir(out_dir)
+    mc = MonteCarlo(jco=jco)
+    mc.draw(4,obs=True,seed=2)
+    for num_workers in [None,2]:
+        prefix = os.path.join(out_dir,"real_{0}_".format(num_workers))
+        mc.write_psts(prefix,num_workers=num_workers)
+
+    # compare to writing each realization with Pst.write()
+    pst = mc.pst.get(par_names=mc.pst.par_names,obs_names=mc.pst.obs_names)
+    pst.parameter_data.index = pst.parameter_data.parnme
+    pst.observation_data.index = pst.observation_data.obsnme
+    par_en = mc.parensemble
+    for i in range(mc.num_reals):
+        pst.parameter_data.loc[par_en.columns,"parval1"] = par_en.iloc[i,:].T
+        pst.observation_data.loc[mc.obsensemble.columns,"obsval"] = \
+            mc.obsensemble.iloc[i,:].T
+        pst_name = os.path.join(out_dir,"check.pst")
+        pst.write(pst_name)
+        check = open(pst_name,'r').read()
+        for num_workers in [None,2]:
+            real_name = os.path.join(out_dir,"real_{0}_{1}.pst".\
+                                     format(num_workers,i))
+            assert open(real_name,'r').read() == check,real_name
+
+    # realized values of names that aren't in the pst can't be written
+    for en in [mc.obsensemble,mc.parensemble]:
+        en.rename(columns={en.columns[0]:"junk"},inplace=True)
+        try:
+            mc.write_psts(os.path.join(out_dir,"junk_"))
+        except Exception as e:
+            assert "junk" in str(e)
+        else:
+            raise Exception("should have failed")
+
+    # the template is not modified, even if it was loaded lazily
+    from pyemu import Pst
+    from pyemu.pst.pst_utils import write_psts
+    full = Pst(os.path.join("pst","pest.pst"))
+    pst = Pst(os.path.join("pst","pest.pst"),lazy=True)
+    odata = pst.observation_data
+    write_psts(pst,np.ones((2,pst.npar)),
+               [os.path.join(out_dir,"lazy_{0}.pst".format(i))
+                for i in range(2)])
+    assert pst.observation_data is odata
+    for name in ["parameter_groups","parameter_data","observation_data",
+                 "prior_information"]:
+        assert getattr(pst,name).equals(getattr(full,name)),name
+
 if __name__ == "__main__":
-    mc_test()
\ No newline at end of file
+    mc_test()
+    ensemble_draw_test()
+    ensemble_diagonal_draw_test()
+    mc_chunks_test()
+    mc_project_test()
+    ensemble_enforce_test()
+    ensemble_transform_test()
+    ensemble_parfiles_test()
+    ensemble_binary_test()
+    write_psts_test()
@@ -45,6 +45,210 @@ def res_test():
         d = np.abs(p.phi_components[gname] - p_load.phi_components[gname])
         assert d < 1.0e-5
 
+
+def phi_components_test():
+    import os
+    import numpy as np
+    import pandas as pd
+    from pyemu import Pst,pst_utils
+    pst_dir = os.path.join('..','tests',"pst")
+    p = Pst(os.path.join(pst_dir,"pest.pst"))
+    # reference: loop over the groups
+    res = p.res.copy()
+    res.index = res.name
+    obs = p.observation_data.copy()
+    obs.index = obs.obsnme
+    for og,og_obs in obs.groupby("obgnme"):
+        og_res = res.loc[res.group == og,:]
+        d = np.abs(p.phi_components[og] -
+                   np.sum((og_res.residual * og_obs.weight) ** 2))
+        assert d < 1.0e-10
+    # weights changes are picked up
+    phi = p.phi
+    p.observation_data.loc[:,"weight"] *= 2.0
+    assert np.abs(p.phi - 4.0 * phi) < 1.0e-6 * phi
+    norm = p.phi_components_normalized
+    assert np.abs(sum(norm.values()) - 1.0) < 1.0e-10
+
+    # many groups, shuffled and missing residuals
+    nobs,ngrp = 1000,10
+    names = ["o{0}".format(i) for i in range(nobs)]
+    pst = pst_utils.generic_pst(par_names=["p1"],obs_names=names)
+    pst.observation_data.loc[:,"obgnme"] = \
+        ["g{0}".format(i % ngrp) for i in range(nobs)]
+    pst.observation_data.loc[:,"weight"] = 1.0
+    pst.observation_data.loc[pst.observation_data.index[::7],"weight"] = 0.0
+    res = pd.DataFrame({"name":names,
+                        "group":pst.observation_data.obgnme.values,
+                        "residual":np.ones(nobs)})
+    res = res.iloc[np.random.permutation(nobs)[:-10],:]
+    pst.set_res(res)
+    pst.adjust_weights_resfile()
+    # each group now contributes its number of nonzero weighted obs
+    nnz = (pst.observation_data.weight > 0).groupby(
+        pst.observation_data.obgnme).sum()
+    comps = pst.phi_components
+    assert len(comps) == ngrp
+    for og,count in nnz.items():
+        assert np.abs(comps[og] - count) < 1.0e-6 * count
+
+    # the memo is reused until a column changes
+    memo = pst._Pst__memos["phi_components"]
+    assert pst.phi_components == comps
+    assert pst._Pst__memos["phi_components"] is memo
+    pst.res.loc[:,"residual"] *= 2.0
+    assert pst.phi_components == dict((og,4.0 * c) for og,c in comps.items())
+    assert pst._Pst__memos["phi_components"] is not memo
+
+
+def get_test():
+    import os
+    from pyemu import Pst,pst_utils
+    pst_dir = os.path.join('..','tests',"pst")
+    p = Pst(os.path.join(pst_dir,"pest.pst"))
+    p.res
+    par_names = p.par_names[::2]
+    obs_names = p.obs_names[::3]
+    for lazy in [False,True]:
+        new_p = p.get(par_names,obs_names,lazy=lazy)
+        assert new_p.par_names == par_names
+        assert new_p.obs_names == obs_names
+        assert list(new_p.res.name) == obs_names
+        assert list(new_p.parameter_data.index) == par_names
+        # the new instance is independent once accessed
+        new_p.parameter_data.loc[:,"parval1"] = -1.0
+        new_p.observation_data.loc[:,"weight"] = -1.0
+        assert (p.parameter_data.parval1 != -1.0).all()
+        assert (p.observation_data.weight != -1.0).all()
+
+    # the new instance doesn't see changes made to this instance after
+    # get(), even before it is accessed
+    new_p = p.get(par_names,obs_names,lazy=True)
+    p.parameter_data.loc[:,"parval1"] = 2.0
+    p.observation_data.loc[:,"weight"] = 2.0
+    p.res.loc[:,"residual"] = 2.0
+    assert (new_p.parameter_data.parval1 != 2.0).all()
+    assert (new_p.observation_data.weight != 2.0).all()
+    assert (new_p.res.residual != 2.0).all()
+    new_p.parameter_data.loc[:,"parval1"] = 3.0
+    assert (p.parameter_data.parval1 == 2.0).all()
+
+
+def read_resfile_test():
+    import os
+    import shutil
+    import numpy as np
+    from pyemu import Pst,pst_utils
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    res_file = os.path.join(temp_dir,"read_resfile_test.rei")
+    shutil.copy2(os.path.join(pst_dir,"pest.rei"),res_file)
+    if os.path.exists(res_file + ".cache"):
+        os.remove(res_file + ".cache")
+    res = pst_utils.read_resfile(res_file)
+    assert list(res.index) == list(res.name)
+    assert all([n == n.lower() for n in res.name])
+    assert res.residual.dtype == np.float64
+
+    cached = pst_utils.read_resfile(res_file,use_cache=True)
+    assert os.path.exists(res_file + ".cache")
+    assert cached.equals(res)
+    assert pst_utils.read_file_cache(res_file).equals(res)
+    # a changed file invalidates the cache
+    with open(res_file,'a') as f:
+        f.write(" NEW_OBS head 1.0 2.0 nan 1.0\n")
+    assert pst_utils.read_file_cache(res_file) is None
+    res = pst_utils.read_resfile(res_file,use_cache=True)
+    assert res.shape[0] == cached.shape[0] + 1
+    assert np.isnan(res.loc["new_obs","residual"])
+    assert res.residual.dtype == np.float64
+
+    # observations missing from the residuals
+    pst = Pst(os.path.join(pst_dir,"pest.pst"),resfile=res_file)
+    pst.res
+    pst = Pst(os.path.join(pst_dir,"pest.pst"),resfile=res_file)
+    pst.observation_data.loc[0,"obsnme"] = "not_in_res"
+    try:
+        pst.res
+    except Exception as e:
+        assert "not_in_res" in str(e)
+    else:
+        raise Exception("should have failed")
+
+def recfile_test():
+    import os
+    from pyemu import Pst,pst_utils
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    rec_file = os.path.join(pst_dir,"pest.rec")
+    comps = pst_utils.get_phi_comps_from_recfile(rec_file)
+    assert len(comps) == 1
+    assert comps[1]["conc"] == 197.058
+
+    # a multi-iteration record file with an unfinished last block
+    rec_file = os.path.join(temp_dir,"recfile_test.rec")
+    with open(rec_file,'w') as f:
+        for i in range(1,6):
+            f.write("  Starting phi for this iteration    Total : {0}\n".format(i))
+            f.write('  Contribution to phi from observation group  "HEAD" : {0}\n'.format(i))
+            f.write('  Contribution to phi from observation group  "conc" : {0}\n'.format(10 * i))
+            f.write("\n")
+        f.write("  Final phi    Total : 6\n")
+        f.write('  Contribution to phi from observation group  "head" : 6\n')
+    comps = pst_utils.get_phi_comps_from_recfile(rec_file)
+    assert len(comps) == 5
+    assert comps[5] == {"head":5.0,"conc":50.0}
+    for chunk_size in [7,64,2**24]:
+        df = pst_utils.read_recfile_phi_components(rec_file,chunk_size=chunk_size)
+        assert list(df.columns) == ["iteration","group","contribution"]
+        assert df.shape[0] == 10
+        assert df.iteration.max() == 5
+        for i,g in comps.items():
+            d = df.loc[df.iteration == i,:]
+            assert dict(zip(d.group,d.contribution)) == g
+        df = pst_utils.read_recfile_phi_components(rec_file,last=True,
+                                                   groups=["conc"],
+                                                   chunk_size=chunk_size)
+        assert (df.iteration == -1).all()
+        assert dict(zip(df.group,df.contribution)) == comps[5]
+        df = pst_utils.read_recfile_phi_components(rec_file,last=True,
+                                                   groups=["missing"],
+                                                   chunk_size=chunk_size)
+        assert df.shape[0] == 0
+
+    pst = Pst(os.path.join(pst_dir,"pest.pst"))
+    pst.adjust_weights_recfile(os.path.join(pst_dir,"pest.rec"))
+
+
+def write_parfile_test():
+    import os
+    import numpy as np
+    from pyemu import Pst,pst_utils
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    # pest_ref.par was written with the DataFrame.to_string() writer
+    # under pandas 0.24 - the output shouldn't depend on the pandas version
+    pst = Pst(os.path.join(pst_dir,"pest.pst"))
+    df = pst.parameter_data.loc[:,["parnme","parval1","scale","offset"]].\
+        iloc[:30,:].copy()
+    df.loc[df.index[0],"parnme"] = "a_long_parameter_name_of_28"
+    df.loc[:,"parval1"] = np.linspace(-1.0e+3,2.5e+5,df.shape[0])
+    df.loc[df.index[1],"parval1"] = 0.0
+    par_file = os.path.join(temp_dir,"write_parfile_test.par")
+    pst_utils.write_parfile(df,par_file)
+    assert open(par_file,'r').read() == \
+        open(os.path.join(pst_dir,"pest_ref.par"),'r').read()
+    names,values = pst_utils.read_parfile_values(par_file)
+    assert names == list(df.parnme)
+    assert np.allclose(values,df.parval1.values)
+
+
 def pst_manip_test():
     import os
     from pyemu import Pst
@@ -99,6 +303,343 @@ def load_test():
     if len(exceptions) > 0:
         raise Exception('\n'.join(exceptions))
 
+def load_parse_test():
+    import os
+    import numpy as np
+    from pyemu import Pst
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    pst = Pst(os.path.join(pst_dir,"pest.pst"))
+    lines = open(os.path.join(pst_dir,"pest.pst"),'r').readlines()
+    ipar = lines.index("* parameter data\n") + 1
+    iobs = lines.index("* observation data\n") + 1
+    # upper case names, fortran exponents, a blank line and
+    # a missing (defaulted) dercom entry
+    raw = lines[iobs].split()
+    lines[iobs] = ' '.join([raw[0].upper(),raw[1].upper().replace('E','D'),
+                            raw[2],raw[3].upper()]) + '\n'
+    lines.insert(iobs + 1,"   \n")
+    lines[ipar] = ' '.join(lines[ipar].split()[:-1]) + '\n'
+    new_file = os.path.join(temp_dir,"parse_test.pst")
+    with open(new_file,'w') as f:
+        f.write(''.join(lines))
+    new_pst = Pst(new_file)
+    assert new_pst.nobs == pst.nobs
+    assert new_pst.obs_names == pst.obs_names
+    assert list(new_pst.observation_data.obgnme) == \
+           list(pst.observation_data.obgnme)
+    assert np.all(new_pst.observation_data.obsval.values ==
+                  pst.observation_data.obsval.values)
+    assert new_pst.parameter_data.dercom.dtype == np.int64
+    assert new_pst.parameter_data.parval1.dtype == np.float64
+    assert list(new_pst.model_command) == list(pst.model_command)
+
+    # a line with an extra entry and one with a missing entry can't shift
+    # the entries of the lines in between
+    lines = open(os.path.join(pst_dir,"pest.pst"),'r').readlines()
+    lines[iobs] = lines[iobs].rstrip() + " extra\n"
+    lines[iobs + 2] = ' '.join(lines[iobs + 2].split()[:-1]) + '\n'
+    with open(new_file,'w') as f:
+        f.write(''.join(lines))
+    try:
+        Pst(new_file)
+    except Exception as e:
+        assert "NANs" in str(e)
+    else:
+        raise Exception("should have failed")
+
+    # whole numbers in columns without a formatter are written as read
+    lines = open(os.path.join(pst_dir,"pest.pst"),'r').readlines()
+    ipargp = lines.index("* parameter groups\n") + 1
+    for i in range(ipargp,ipargp + 2):
+        lines[i] = lines[i].replace(" 0.0 "," 0 ")
+    with open(new_file,'w') as f:
+        f.write(''.join(lines))
+    new_pst = Pst(new_file)
+    assert new_pst.parameter_groups.derinclb.dtype == np.int64
+    assert pst.parameter_groups.derinclb.dtype == np.float64
+
+
+def load_generic_test():
+    import os
+    import numpy as np
+    from pyemu import Pst,pst_utils
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    pst_file = os.path.join(temp_dir,"generic.pst")
+    pst = pst_utils.generic_pst(par_names=["p{0}".format(i)
+                                           for i in range(10)],
+                                obs_names=["o{0}".format(i)
+                                           for i in range(100)])
+    pst.observation_data.loc[:,"obsval"] = np.arange(100) / 3.0
+    pst.write(pst_file)
+    new_pst = Pst(pst_file)
+    assert new_pst.nobs == 100
+    assert new_pst.npar == 10
+    assert new_pst.obs_names == pst.obs_names
+    assert new_pst.par_names == pst.par_names
+    assert np.allclose(new_pst.observation_data.obsval.values,
+                       np.arange(100) / 3.0)
+
+
+def lazy_load_test():
+    import os
+    from pyemu import Pst
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    for pst_file in ["pest.pst","200_superobs.pst"]:
+        pst_file = os.path.join(pst_dir,pst_file)
+        pst = Pst(pst_file)
+        lazy = Pst(pst_file,lazy=True)
+        for name in Pst.lazy_sections:
+            assert getattr(pst,name).equals(getattr(lazy,name)),name
+        assert pst.pestpp_options == lazy.pestpp_options
+        # writing a lazy Pst parses whatever hasn't been accessed yet
+        lazy = Pst(pst_file,lazy=True)
+        lazy.write(os.path.join(temp_dir,"lazy.pst"))
+        pst.write(os.path.join(temp_dir,"eager.pst"))
+        assert open(os.path.join(temp_dir,"lazy.pst")).read() == \
+               open(os.path.join(temp_dir,"eager.pst")).read()
+
+    # assigning a section replaces it without parsing it
+    lazy = Pst(os.path.join(pst_dir,"pest.pst"),lazy=True)
+    lazy.observation_data = pst.observation_data.iloc[:10,:]
+    assert lazy.observation_data.shape[0] == 10
+
+    # windows line endings
+    pst = Pst(os.path.join(pst_dir,"pest.pst"))
+    pst_file = os.path.join(temp_dir,"lazy_crlf.pst")
+    with open(os.path.join(pst_dir,"pest.pst"),'r') as f:
+        text = f.read()
+    with open(pst_file,'wb') as f:
+        f.write(text.replace('\n','\r\n').encode())
+    lazy = Pst(pst_file,lazy=True)
+    for name in Pst.lazy_sections:
+        assert getattr(pst,name).equals(getattr(lazy,name)),name
+
+    # the sections are read from the file when accessed, so the file
+    # can't change in between
+    lazy = Pst(pst_file,lazy=True)
+    with open(pst_file,'w') as f:
+        f.write(text)
+    try:
+        lazy.observation_data
+    except Exception as e:
+        assert "changed" in str(e)
+    else:
+        raise Exception("should have failed")
+
+
+def write_to_string_test():
+    import os
+    from pyemu import Pst
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    # the *_ref.pst files were written with the DataFrame.to_string()
+    # writer (under pandas 1.3) - between them they have ++ options,
+    # prior information, regularization, tied parameters and whole
+    # number derinclb entries
+    new_file = os.path.join(temp_dir,"write_to_string_test.pst")
+    for pst_file in [os.path.join(pst_dir,"pest.pst"),
+                     os.path.join(pst_dir,"100_superobs.pst"),
+                     os.path.join(pst_dir,"LPR_SS11_FINAL_BEST_JACOBIAN.pst"),
+                     os.path.join("..","..","verification","Freyberg",
+                                  "freyberg_ord.pst")]:
+        pst = Pst(pst_file)
+        pst.write(new_file)
+        ref_file = os.path.join(pst_dir,os.path.split(pst_file)[-1].\
+                                replace(".pst","_ref.pst"))
+        assert open(new_file,'r').read() == open(ref_file,'r').read(),\
+            pst_file
+
+
+def derived_properties_test():
+    import os
+    from pyemu import Pst
+    pst = Pst(os.path.join('..','tests',"pst","pest.pst"))
+    pdata,odata = pst.parameter_data,pst.observation_data
+    adj_names = [n for t,n in zip(pdata.partrans,pdata.parnme)
+                 if t not in ["fixed","tied"]]
+    nz_names = [n for w,n in zip(odata.weight,odata.obsnme) if w > 0.0]
+    for _ in range(2):
+        assert pst.adj_par_names == adj_names
+        assert pst.npar_adj == len(adj_names)
+        assert pst.nnz_obs_names == nz_names
+        assert pst.nnz_obs == len(nz_names)
+    # changing the returned lists doesn't change the Pst
+    pst.adj_par_names.pop(0)
+    assert pst.adj_par_names == adj_names
+    # the memos are reused until a column changes
+    memos = dict(pst._Pst__memos)
+    assert len(memos) == 3
+    pst.npar_adj,pst.adj_par_names,pst.nnz_obs_names
+    for name,memo in memos.items():
+        assert pst._Pst__memos[name] is memo,name
+    # in-place changes are picked up
+    pdata.loc[pdata.parnme == adj_names[0],"partrans"] = "fixed"
+    odata.loc[odata.obsnme == nz_names[0],"weight"] = 0.0
+    assert pst.adj_par_names == adj_names[1:]
+    assert pst.npar_adj == len(adj_names) - 1
+    assert pst.nnz_obs_names == nz_names[1:]
+    assert pst.nnz_obs == len(nz_names) - 1
+    # and so are replaced dataframes
+    pst.observation_data = odata.iloc[:10,:]
+    assert pst.nnz_obs_names == [n for n in nz_names[1:]
+                                 if n in odata.obsnme.values[:10]]
+
+
+def write_test():
+    import os
+    import copy
+    import numpy as np
+    from pyemu import Pst
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    for pst_file in ["pest.pst","200_superobs.pst"]:
+        pst = Pst(os.path.join(pst_dir,pst_file))
+        frames = {}
+        for name in ["parameter_groups","parameter_data","observation_data",
+                     "prior_information"]:
+            frames[name] = getattr(pst,name).copy()
+        control = pst.control_data._df.copy()
+        new_file = os.path.join(temp_dir,"write_test.pst")
+        pst.write(new_file)
+        # write() should not change the Pst
+        for name,df in frames.items():
+            assert getattr(pst,name).equals(df),name
+            assert list(getattr(pst,name).columns) == list(df.columns),name
+            assert getattr(pst,name).index.equals(df.index),name
+        assert pst.control_data._df.equals(control)
+        # and a written-then-reloaded Pst should write the same file
+        new_pst = Pst(new_file)
+        new_pst.write(new_file + ".2")
+        assert open(new_file,'r').read() == open(new_file + ".2",'r').read()
+        assert new_pst.par_names == pst.par_names
+        assert new_pst.obs_names == pst.obs_names
+
+
+def control_data_test():
+    import os
+    import copy
+    import pickle
+    from pyemu import Pst
+    pst = Pst(os.path.join('..','tests',"pst","pest.pst"))
+    cd = pst.control_data
+    npar = cd.npar
+    # copies are independent
+    cd_copy = cd.copy()
+    cd_copy.npar = npar + 1
+    cd_copy.pestmode = "regularization"
+    assert cd.npar == npar
+    assert cd.pestmode == "estimation"
+    assert cd_copy.npar == npar + 1
+    noptmax = cd.noptmax
+    new_pst = pst.get()
+    new_pst.control_data.noptmax = noptmax + 10
+    assert pst.control_data.noptmax == noptmax
+    # values are cast to the variable type
+    cd_copy.npar = "10"
+    assert cd_copy.npar == 10
+    try:
+        cd_copy.not_a_variable = 1
+    except AssertionError:
+        pass
+    else:
+        raise Exception("should have failed")
+    try:
+        cd_copy.not_a_variable
+    except AssertionError:
+        pass
+    else:
+        raise Exception("should have failed")
+    # the dataframe view is built on demand
+    df = cd._df
+    assert df.loc["npar","value"] == npar
+    df.loc["npar","value"] = 0
+    assert cd.npar == npar
+    assert list(cd.formatted_values.index) == list(df.index)
+    assert cd.to_dict()["npar"] == npar
+    for c in [copy.deepcopy(cd),pickle.loads(pickle.dumps(cd))]:
+        assert c.to_dict() == cd.to_dict()
+
+
+def snapshot_test():
+    import os
+    import time
+    import shutil
+    from pyemu import Pst
+    pst_dir = os.path.join('..','tests',"pst")
+    temp_dir = "temp"
+    if not os.path.exists(temp_dir):
+        os.mkdir(temp_dir)
+    pst_file = os.path.join(temp_dir,"snapshot_test.pst")
+    shutil.copy2(os.path.join(pst_dir,"pest.pst"),pst_file)
+    if os.path.exists(pst_file + ".cache"):
+        os.remove(pst_file + ".cache")
+
+    t = time.time()
+    pst = Pst(pst_file,use_cache=True)
+    print("parse:{0:10.4f}".format(time.time() - t))
+    assert os.path.exists(pst_file + ".cache")
+    t = time.time()
+    cached = Pst(pst_file,use_cache=True)
+    print("snapshot:{0:10.4f}".format(time.time() - t))
+    for name in Pst.snapshot_attrs:
+        v1,v2 = getattr(pst,name),getattr(cached,name)
+        if hasattr(v1,"equals"):
+            assert v1.equals(v2),name
+        else:
+            assert v1 == v2,name
+    assert pst.control_data._df.value.equals(cached.control_data._df.value)
+    cached.write(pst_file + ".1")
+    pst.write(pst_file + ".2")
+    assert open(pst_file + ".1").read() == open(pst_file + ".2").read()
+
+    # touching the file without changing it still uses the snapshot
+    os.utime(pst_file,None)
+    assert Pst(pst_file,load=False).load_snapshot(pst_file)
+
+    # a changed file invalidates the snapshot
+    pst.observation_data.loc[:,"weight"] = 2.0
+    pst.write(pst_file)
+    assert not Pst(pst_file,load=False).load_snapshot(pst_file)
+    new_pst = Pst(pst_file,use_cache=True)
+    assert (new_pst.observation_data.weight == 2.0).all()
+    assert Pst(pst_file,load=False).load_snapshot(pst_file)
+
+    # a lazy load doesn't write a snapshot - that would parse every section
+    os.remove(pst_file + ".cache")
+    lazy = Pst(pst_file,use_cache=True,lazy=True)
+    assert not os.path.exists(pst_file + ".cache")
+    assert len(lazy._Pst__pending) > 0
+    assert (lazy.observation_data.weight == 2.0).all()
+
+
+def cov_reuse_pst_test():
+    import os
+    from pyemu import Pst,Cov
+    pst = Pst(os.path.join('..','tests',"pst","pest.pst"))
+    c1,c2 = Cov(),Cov()
+    c1.from_parbounds(pst.filename)
+    c2.from_parbounds(pst)
+    assert c1.row_names == c2.row_names
+    assert (c1.x == c2.x).all()
+    c1,c2 = Cov(),Cov()
+    c1.from_obsweights(pst.filename)
+    c2.from_obsweights(pst)
+    assert c1.row_names == c2.row_names
+    assert (c1.x == c2.x).all()
+
+
 def smp_test():
     import os
     from pyemu.pst.pst_utils import smp_to_dataframe,dataframe_to_smp,\
@@ -137,6 +678,20 @@ if __name__ == "__main__":
     # pst_manip_test()
     # tpl_ins_test()
     # load_test()
+    # load_parse_test()
+    # load_generic_test()
+    # lazy_load_test()
+    # write_test()
+    # write_to_string_test()
+    # derived_properties_test()
+    # control_data_test()
+    # snapshot_test()
+    # cov_reuse_pst_test()
     # res_test()
+    # phi_components_test()
+    # get_test()
+    # read_resfile_test()
+    # recfile_test()
+    # write_parfile_test()
     #smp_test()
 